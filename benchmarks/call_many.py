@@ -0,0 +1,63 @@
+"""
+Benchmark `Promise.call_many` against a loop of `Promise.call`.
+
+Submits `--tasks` trivial calls both ways and reports the time to submit them
+and the time until every result is available.::
+
+  python benchmarks/call_many.py --tasks 100000 --chunksizes 1,16,256
+"""
+import argparse
+import sys
+import time
+
+from mirai import Promise, AdaptiveThreadPoolExecutor
+
+
+def work(i):
+  return i + 1
+
+
+def loop_of_calls(args, chunksize):
+  return Promise.collect([Promise.call(work, *a) for a in args])
+
+
+def call_many(args, chunksize):
+  return Promise.call_many(work, args, chunksize=chunksize)
+
+
+def measure(method, args, chunksize, workers):
+  Promise.executor(AdaptiveThreadPoolExecutor(max_workers=workers))
+  try:
+    start     = time.time()
+    result    = method(args, chunksize)
+    submitted = time.time()
+    result.get()
+    finished  = time.time()
+  finally:
+    Promise.executor().shutdown(wait=True)
+  return (submitted - start, finished - start)
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+  parser.add_argument('--tasks',      type=int, default=100000, help="number of calls")
+  parser.add_argument('--workers',    type=int, default=8,      help="maximum executor threads")
+  parser.add_argument('--chunksizes', default="1,16,256",       help="comma-separated chunk sizes for call_many")
+  args = parser.parse_args(argv)
+
+  calls = [(i,) for i in range(args.tasks)]
+  runs  = [("loop of Promise.call", loop_of_calls, 1)] + [
+    ("call_many chunksize={}".format(c), call_many, c)
+    for c in (int(c) for c in args.chunksizes.split(','))
+  ]
+
+  print "{:<26} {:>12} {:>12} {:>12}".format("method", "submit (s)", "total (s)", "calls/s")
+  for (name, method, chunksize) in runs:
+    (submit, total) = measure(method, calls, chunksize, args.workers)
+    print "{:<26} {:>12.3f} {:>12.3f} {:>12.0f}".format(name, submit, total, args.tasks / total)
+    sys.stdout.flush()
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
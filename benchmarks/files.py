@@ -0,0 +1,97 @@
+"""
+Benchmark `mirai.files` against reading files with `Promise.call`.
+
+Writes `--small` files of `--small-size` bytes and one file of `--large-size`
+megabytes to a temporary directory, then reads them each way and reports the
+time until every byte has been checksummed.::
+
+  python benchmarks/files.py --small 10000 --large-size 512
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+import zlib
+
+from mirai import Promise, AdaptiveThreadPoolExecutor
+from mirai import files
+
+
+def slurp(path):
+  with open(path, 'rb') as f:
+    return f.read()
+
+
+def checksum(data):
+  return zlib.crc32(data)
+
+
+def small_loop_of_calls(paths):
+  return Promise.collect([Promise.call(slurp, path) for path in paths]).map(lambda d: [checksum(x) for x in d])
+
+
+def small_read_many(paths):
+  return files.read_many(paths, batch_size=64).map(lambda d: [checksum(x) for x in d])
+
+
+def large_call(path):
+  return Promise.call(slurp, path).map(checksum)
+
+
+def large_mmap_view(path):
+  return files.mmap_view(path).map(checksum)
+
+
+def measure(method, arg, workers):
+  Promise.executor(AdaptiveThreadPoolExecutor(max_workers=workers))
+  files.executor(AdaptiveThreadPoolExecutor(max_workers=workers))
+  try:
+    start = time.time()
+    method(arg).get()
+    return time.time() - start
+  finally:
+    Promise.executor().shutdown(wait=True)
+    files.executor().shutdown(wait=True)
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+  parser.add_argument('--small',      type=int, default=5000, help="number of small files")
+  parser.add_argument('--small-size', type=int, default=4096, help="bytes per small file")
+  parser.add_argument('--large-size', type=int, default=256,  help="megabytes in the large file")
+  parser.add_argument('--workers',    type=int, default=16,   help="maximum executor threads")
+  args = parser.parse_args(argv)
+
+  root = tempfile.mkdtemp()
+  try:
+    paths = []
+    for i in range(args.small):
+      paths.append(os.path.join(root, "small-{}".format(i)))
+      with open(paths[-1], 'wb') as f:
+        f.write(os.urandom(args.small_size))
+    large = os.path.join(root, "large")
+    with open(large, 'wb') as f:
+      block = os.urandom(1024 * 1024)
+      for i in range(args.large_size):
+        f.write(block)
+
+    runs = [
+      ("{} small files".format(args.small), "loop of Promise.call", small_loop_of_calls, paths),
+      ("{} small files".format(args.small), "files.read_many",      small_read_many,     paths),
+      ("{} MB file".format(args.large_size), "Promise.call(read)",  large_call,          large),
+      ("{} MB file".format(args.large_size), "files.mmap_view",     large_mmap_view,     large),
+    ]
+
+    print "{:<18} {:<22} {:>10}".format("workload", "method", "total (s)")
+    for (workload, name, method, arg) in runs:
+      print "{:<18} {:<22} {:>10.3f}".format(workload, name, measure(method, arg, args.workers))
+      sys.stdout.flush()
+  finally:
+    shutil.rmtree(root)
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,73 @@
+"""
+Measure how long `import mirai` takes.
+
+Starts a fresh interpreter for each sample, once running only `import
+mirai` and once running nothing, and reports the median difference. Exits
+with a non-zero status if it exceeds `--budget` milliseconds or if importing
+mirai loads any of the `--forbid` modules.::
+
+  python benchmarks/import_time.py --samples 20 --budget 60
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# modules mirai only imports once a feature needing them is used
+LAZY = [
+  'joblib', 'numpy', 'inspect', 'socket', 'mmap', 'hashlib', 'shutil',
+  'mirai.debug', 'mirai.reactor', 'mirai.routing',
+]
+
+
+def run(code):
+  """Seconds taken to start an interpreter and run `code`."""
+  start = time.time()
+  subprocess.check_call([sys.executable, '-c', code], cwd=ROOT)
+  return time.time() - start
+
+
+def median(xs):
+  xs = sorted(xs)
+  return xs[len(xs) // 2]
+
+
+def loaded(modules):
+  """The names in `modules` that `import mirai` imports."""
+  code = "import sys, mirai; print ' '.join(m for m in {!r} if m in sys.modules)".format(modules)
+  return subprocess.check_output([sys.executable, '-c', code], cwd=ROOT).split()
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+  parser.add_argument('--samples', type=int,   default=20,   help="interpreters to start per measurement")
+  parser.add_argument('--budget',  type=float, default=60.0, help="milliseconds `import mirai` may take")
+  parser.add_argument('--forbid',  default=",".join(LAZY),    help="comma-separated modules mirai must not import")
+  args = parser.parse_args(argv)
+
+  # alternate so that both measurements see the same system load
+  baseline = []
+  imported = []
+  for i in range(args.samples):
+    baseline.append(run("pass"))
+    imported.append(run("import mirai"))
+  cost = 1000 * (median(imported) - median(baseline))
+
+  print "{:<24} {:>10.1f} ms".format("interpreter startup", 1000 * median(baseline))
+  print "{:<24} {:>10.1f} ms (budget {:.1f} ms)".format("import mirai", cost, args.budget)
+
+  failed = cost > args.budget
+  if failed:
+    print "FAIL: import mirai is over budget"
+  for module in loaded(args.forbid.split(',')):
+    print "FAIL: import mirai imports {}".format(module)
+    failed = True
+  return 1 if failed else 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
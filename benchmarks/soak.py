@@ -0,0 +1,181 @@
+"""
+Load and soak test for mirai.
+
+Drives a configurable mix of `Promise.call`, `Promise.collect`,
+`Promise.select` and `Promise.within` while keeping a fixed number of
+operations outstanding, and samples throughput, memory, thread count and live
+Promise count at regular intervals. Exits with a non-zero status if any
+resource keeps growing after the warm-up period.::
+
+  python benchmarks/soak.py --duration 3600 --pending 100000 \\
+      --mix call=4,collect=2,select=1,within=1,fail=1
+"""
+import argparse
+import gc
+import random
+import resource
+import sys
+import threading
+import time
+
+from mirai import Promise, AdaptiveThreadPoolExecutor
+from mirai.exceptions import ShadowException
+from mirai.futures import Future
+
+
+def rss():
+  """Current resident set size in bytes."""
+  try:
+    with open('/proc/self/statm') as f:
+      return int(f.read().split()[1]) * resource.getpagesize()
+  except IOError:
+    return peak_rss()
+
+
+def peak_rss():
+  """Peak resident set size in bytes."""
+  maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+
+def live_promises():
+  """Number of Promise and Future objects reachable by the garbage collector."""
+  gc.collect()
+  return sum(1 for o in gc.get_objects() if isinstance(o, (Promise, Future)))
+
+
+def shadow_classes():
+  """Number of ShadowException subclasses alive."""
+  return len(ShadowException.__subclasses__())
+
+
+class Workload(object):
+  """Builds one operation at a time according to a weighted mix."""
+
+  def __init__(self, mix, work, fanout):
+    self.work   = work
+    self.fanout = fanout
+    self.ops    = []
+    for (name, weight) in mix:
+      self.ops.extend([getattr(self, name)] * weight)
+
+  def task(self):
+    time.sleep(random.random() * self.work)
+    return 1
+
+  def failing(self):
+    time.sleep(random.random() * self.work)
+    raise ValueError("soak")
+
+  def call(self):
+    return Promise.call(self.task)
+
+  def fail(self):
+    return Promise.call(self.failing)
+
+  def collect(self):
+    return Promise.collect([Promise.call(self.task) for i in range(self.fanout)])
+
+  def select(self):
+    return Promise.select([Promise.call(self.task) for i in range(self.fanout)])
+
+  def within(self):
+    return Promise.call(self.task).within(self.work / 2.0)
+
+  def __call__(self):
+    return random.choice(self.ops)()
+
+
+def grows(samples, key, tolerance, slack):
+  """
+  Return True if `key` keeps growing: the peak over the last third of
+  `samples` is beyond the peak over the middle third by more than `tolerance`
+  (relative) plus `slack` (absolute). The first third is warm-up.
+  """
+  third = len(samples) // 3
+  if third == 0:
+    return False
+  middle = max(s[key] for s in samples[third:2 * third])
+  last   = max(s[key] for s in samples[2 * third:])
+  return last > middle * (1 + tolerance) + slack
+
+
+def soak(args):
+  Promise.executor(AdaptiveThreadPoolExecutor(max_workers=args.workers))
+
+  mix      = [(name, int(weight)) for (name, weight) in (kv.split('=') for kv in args.mix.split(','))]
+  workload = Workload(mix, args.work, args.fanout)
+  slots    = threading.Semaphore(args.pending)
+  done     = [0]
+  lock     = threading.Lock()
+
+  def finished(fut):
+    with lock:
+      done[0] += 1
+    slots.release()
+
+  samples = []
+  start   = time.time()
+  last    = start
+  print "{:>8} {:>10} {:>10} {:>10} {:>8} {:>10} {:>8}".format(
+    "elapsed", "ops/s", "rss(MB)", "peak(MB)", "threads", "promises", "shadows"
+  )
+  while time.time() - start < args.duration:
+    slots.acquire()
+    workload().respond(finished)
+
+    now = time.time()
+    if now - last >= args.interval:
+      with lock:
+        count, done[0] = done[0], 0
+      s = {
+        'elapsed'    : now - start,
+        'throughput' : count / (now - last),
+        'rss'        : rss(),
+        'peak_rss'   : peak_rss(),
+        'threads'    : threading.active_count(),
+        'promises'   : live_promises(),
+        'shadows'    : shadow_classes(),
+      }
+      samples.append(s)
+      last = time.time()
+      print "{elapsed:8.1f} {throughput:10.1f} {rss_mb:10.1f} {peak_mb:10.1f} {threads:8d} {promises:10d} {shadows:8d}".format(
+        rss_mb  = s['rss'] / 1e6,
+        peak_mb = s['peak_rss'] / 1e6,
+        **s
+      )
+      sys.stdout.flush()
+
+  Promise.executor().shutdown(wait=True)
+
+  failures = [
+    key for key in ['rss', 'threads', 'promises', 'shadows']
+    if grows(samples, key, args.tolerance, args.slack[key])
+  ]
+  for key in failures:
+    print "FAIL: {} grew without bound".format(key)
+  return 1 if failures else 0
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+  parser.add_argument('--duration', type=float, default=60.0,    help="seconds to run for")
+  parser.add_argument('--interval', type=float, default=5.0,     help="seconds between samples")
+  parser.add_argument('--pending',  type=int,   default=10000,   help="operations kept outstanding")
+  parser.add_argument('--workers',  type=int,   default=32,      help="maximum executor threads")
+  parser.add_argument('--fanout',   type=int,   default=4,       help="inputs per collect/select")
+  parser.add_argument('--work',     type=float, default=0.001,   help="maximum seconds per task")
+  parser.add_argument('--mix',      default="call=4,collect=2,select=1,within=1,fail=1",
+                      help="comma-separated operation=weight pairs")
+  parser.add_argument('--tolerance', type=float, default=0.10,
+                      help="relative growth allowed after warm-up")
+  args = parser.parse_args(argv)
+
+  # absolute growth allowed on top of `tolerance`, so that small counts don't
+  # fail on noise
+  args.slack = {'rss': 16e6, 'threads': 4, 'promises': args.pending, 'shadows': 16}
+  return soak(args)
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -1,4 +1,12 @@
 from concurrent.futures import TimeoutError
 from .futures import Promise, Future
-from .exceptions import AlreadyResolvedError, MiraiError
+from .broadcast import BroadcastPromise
+from .dataflow import Dataflow
+from .pipeline import Pipeline
+from .pool import ResourcePool
+from .channel import AsyncQueue
+from .cache import DiskCache
+from .coroutines import coroutine, Return
+from .exceptions import AlreadyResolvedError, MiraiError, QueueClosedError, RejectedError
+from .executors import AdaptiveThreadPoolExecutor, PartitionedExecutor, PriorityThreadPoolExecutor
 from ._version import __version__
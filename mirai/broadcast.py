@@ -0,0 +1,110 @@
+import traceback
+
+from .exceptions import AlreadyResolvedError
+from .futures import Promise
+
+
+class BroadcastPromise(Promise):
+  """
+  A Promise meant for many subscribers, e.g. a "config loaded" signal that
+  thousands of requests wait upon. Callbacks registered before it resolves are
+  stored as-is (no per-callback wrapper) and, once it resolves, are run on the
+  executor in batches of `batch_size` instead of one after another on the
+  resolving thread. Callbacks registered after it resolves run immediately on
+  the registering thread.::
+
+    config = BroadcastPromise()
+    Promise.call(load_config).proxyto(config)
+
+    def handle(request):
+      return config.flatmap(lambda c: process(c, request))
+
+  Parameters
+  ----------
+  batch_size : int, optional
+      Number of callbacks run per executor task.
+  executor : concurrent.futures.Executor or None, optional
+      Executor to run callbacks on. Defaults to `Promise.executor()` at the
+      time this Promise resolves.
+  """
+
+  __slots__ = ['_subscribers', '_batch_size', '_executor']
+
+  def __init__(self, batch_size=64, executor=None):
+    if batch_size <= 0:
+      raise ValueError("batch_size must be greater than 0")
+    super(BroadcastPromise, self).__init__()
+    self._subscribers = []
+    self._batch_size  = batch_size
+    self._executor    = executor
+
+  def respond(self, fn):
+    if Promise.PROFILER is not None:
+      fn = Promise.PROFILER.wrap(fn)
+
+    # `_subscribers` only ever goes from a list to None, so once it's None
+    # there's no need to take the lock.
+    if self._subscribers is not None:
+      with self._lock:
+        if self._subscribers is not None:
+          self._subscribers.append(fn)
+          return self
+    self._run([fn])
+    return self
+
+  respond.__doc__ = Promise.respond.__doc__
+
+  def setvalue(self, val):
+    return self._resolve(self._future.set_result, val)
+
+  setvalue.__doc__ = Promise.setvalue.__doc__
+
+  def setexception(self, e):
+    return self._resolve(self._future.set_exception, e)
+
+  setexception.__doc__ = Promise.setexception.__doc__
+
+  def subscribers(self):
+    """
+    Return the number of callbacks waiting for this Promise to resolve.
+
+    Returns
+    -------
+    result : int
+    """
+    subscribers = self._subscribers
+    return 0 if subscribers is None else len(subscribers)
+
+  def _resolve(self, set, arg):
+    with self._lock:
+      if self.isdefined():
+        raise AlreadyResolvedError("Promise is already resolved; you cannot set its status again.")
+      set(arg)
+      subscribers, self._subscribers = self._subscribers, None
+
+    executor = self._executor or Promise.executor()
+    for i in range(0, len(subscribers), self._batch_size):
+      self._submit(executor, subscribers[i:i + self._batch_size])
+    return self
+
+  def _submit(self, executor, subscribers):
+    # if the executor won't run them -- it's shut down, or full and rejecting
+    # or dropping tasks -- run them here rather than leave them waiting forever
+    try:
+      task = executor.submit(self._run, subscribers)
+    except Exception:
+      self._run(subscribers)
+      return
+
+    def done(task):
+      # `_run` doesn't raise, so a failed task never ran
+      if task.cancelled() or task.exception() is not None:
+        self._run(subscribers)
+    task.add_done_callback(done)
+
+  def _run(self, subscribers):
+    for fn in subscribers:
+      try:
+        fn(self)
+      except Exception:
+        traceback.print_exc()
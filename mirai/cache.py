@@ -0,0 +1,385 @@
+"""
+Remember the results of expensive calls on disk, across runs, in the spirit
+of `joblib.Memory`.::
+
+  cache = DiskCache('/var/cache/nightly', max_bytes=10 * 2 ** 30, max_age=7 * 86400)
+
+  @cache.memoize
+  def features(day):
+    ...
+
+  features('2014-06-01').map(train)   # computed, stored, then reused
+"""
+import errno
+import os
+import sys
+import threading
+import time
+import weakref
+
+from . import files
+from .futures import Promise
+
+
+class DiskCache(object):
+  """
+  Persistent memoization for `Promise.call`. A call is identified by the
+  function's name and source and the values of its arguments, default
+  arguments and, for a closure, the variables it captured. A function should
+  depend only on those -- and they must be picklable -- to be cached.
+
+  Looking up and storing results run on the `mirai.files` executor, and
+  computing them on `Promise.EXECUTOR`, so the caller's thread never touches
+  the disk. Concurrent calls for the same missing result share one
+  computation.
+
+  NumPy arrays (of any dtype but `object`) are stored as `.npy` files and
+  returned as read-only arrays memory-mapped from them, so reusing a large
+  result costs no more than the parts of it that are read. Other results are
+  pickled.
+
+  Parameters
+  ----------
+  directory : str
+      Directory results are stored in. Created if needed.
+  max_bytes : int or None, optional
+      After storing a result, the least recently used results are removed
+      until the cache holds at most this many bytes. None for no limit. The
+      directory is measured once, then its size is tracked as results are
+      stored, so results stored by other processes are only noticed the next
+      time the limit is exceeded.
+  max_age : number or None, optional
+      Seconds after which a stored result is recomputed instead of reused.
+      None for no limit.
+  """
+
+  def __init__(self, directory, max_bytes=None, max_age=None):
+    if max_bytes is not None and max_bytes < 0:
+      raise ValueError("max_bytes must not be negative")
+    if max_age is not None and max_age < 0:
+      raise ValueError("max_age must not be negative")
+
+    self.directory = directory
+    self.max_bytes = max_bytes
+    self.max_age   = max_age
+
+    self._lock     = threading.Lock()
+    self._inflight = {}   # path -> Promise of a result being computed
+    self._sources  = weakref.WeakKeyDictionary()   # code object -> hash of its source
+    self._hits     = 0
+    self._misses   = 0
+    self._shared   = 0
+    self._stored   = 0
+    self._evicted  = 0
+    self._size     = None # bytes stored, once measured by _evict
+
+  def call(self, fn, *args, **kwargs):
+    """
+    Call a function, or reuse the stored result of an identical call.
+
+    Parameters
+    ----------
+    fn : function
+        Function to call.
+    *args, **kwargs
+        Arguments to `fn`.
+
+    Returns
+    -------
+    result : Future
+        Future containing the return value of `fn`. Results of calls that
+        fail aren't stored.
+    """
+    return files._submit(self._lookup, fn, args, kwargs).flatmap(lambda result: result)
+
+  def memoize(self, fn):
+    """
+    Wrap a function so that calling it calls `DiskCache.call`.
+
+    Returns
+    -------
+    memoized : function
+        Function taking the same arguments as `fn` and returning a Future.
+    """
+    def memoized(*args, **kwargs):
+      return self.call(fn, *args, **kwargs)
+    memoized.__name__ = getattr(fn, '__name__', 'memoized')
+    memoized.__doc__  = getattr(fn, '__doc__', None)
+    return memoized
+
+  def evict(self):
+    """
+    Remove results older than `max_age`, then the least recently used results
+    until the cache is no larger than `max_bytes`.
+
+    Returns
+    -------
+    result : Future
+        Future containing the number of results removed.
+    """
+    return files._submit(self._evict)
+
+  def clear(self):
+    """
+    Remove every stored result.
+
+    Returns
+    -------
+    result : Future
+        Future containing None once they're gone.
+    """
+    return files._submit(self._clear)
+
+  def stats(self):
+    """
+    Report how often stored results were reused.
+
+    Returns
+    -------
+    stats : dict
+        Keys `hits` (calls answered from disk), `misses` (calls computed),
+        `shared` (calls that waited on an identical call already being
+        computed), `stored` and `evicted` (result counts).
+    """
+    with self._lock:
+      return {
+        'hits'    : self._hits,
+        'misses'  : self._misses,
+        'shared'  : self._shared,
+        'stored'  : self._stored,
+        'evicted' : self._evicted,
+      }
+
+  def _lookup(self, fn, args, kwargs):
+    """Runs on the files executor. Returns a Future of the result."""
+    path = self._path(fn, args, kwargs)
+    with self._lock:
+      pending = self._inflight.get(path)
+      if pending is not None:
+        self._shared += 1
+        return pending.future()
+
+    try:
+      result = self._load(path)
+    except Exception: # missing, expired, or unreadable: recompute
+      result = _MISSING
+
+    with self._lock:
+      if result is not _MISSING:
+        self._hits += 1
+        return Promise.value(result)
+      pending = self._inflight.get(path)
+      if pending is not None: # started while this call read the disk
+        self._shared += 1
+        return pending.future()
+      self._misses += 1
+      p = self._inflight[path] = Promise()
+
+    def stored(f):
+      with self._lock:
+        del self._inflight[path]
+      p.update(f)
+
+    def computed(f):
+      if f.isfailure():
+        stored(f)
+      else:
+        value = f.get()
+        try:
+          storing = files._submit(self._store, path, value)
+        except Exception: # e.g. the files executor was shut down
+          storing = Promise.value(value)
+        # a disk error shouldn't fail the call
+        storing.rescue(lambda e: Promise.value(value)).respond(stored)
+
+    Promise.call(fn, *args, **kwargs).respond(computed)
+    return p.future()
+
+  def _path(self, fn, args, kwargs):
+    # this and the other modules only needed once a call is cached are
+    # imported on first use, to keep them out of `import mirai`
+    import cPickle as pickle
+    import hashlib
+    from .debug import _qualname
+    key = (self._source(fn), _bound(fn), args, sorted(kwargs.items()))
+    try:
+      import joblib
+      digest = joblib.hash(key)
+    except ImportError:
+      digest = hashlib.sha1(pickle.dumps(key, pickle.HIGHEST_PROTOCOL)).hexdigest()
+    return os.path.join(self.directory, _qualname(fn), digest)
+
+  def _source(self, fn):
+    """
+    Hash of `fn`'s source, so that results are recomputed when it changes.
+    """
+    import hashlib
+    import inspect
+    # remembered by code object, which every closure or lambda made from the
+    # same definition shares, and only while that code is around
+    code = getattr(fn, '__code__', None)
+    with self._lock:
+      source = None if code is None else self._sources.get(code)
+    if source is None:
+      try:
+        source = hashlib.sha1(inspect.getsource(fn)).hexdigest()
+      except (IOError, TypeError):
+        source = ''
+      if code is not None:
+        with self._lock:
+          self._sources[code] = source
+    return source
+
+  def _load(self, path):
+    import cPickle as pickle
+    for name in _OUTPUTS:
+      output = os.path.join(path, name)
+      try:
+        written = os.path.getmtime(output)
+      except OSError:
+        continue
+      if self.max_age is not None and time.time() - written > self.max_age:
+        raise LookupError("expired")
+
+      if name == 'output.npy':
+        import numpy
+        result = numpy.load(output, mmap_mode='r')
+      else:
+        with open(output, 'rb') as f:
+          result = pickle.load(f)
+      os.utime(path, None) # the entry's directory records when it was last used
+      return result
+    raise LookupError("missing")
+
+  def _store(self, path, value):
+    """Runs on the files executor. Returns the result to hand to callers."""
+    import cPickle as pickle
+    try:
+      os.makedirs(path)
+    except OSError as e:
+      if e.errno != errno.EEXIST:
+        raise
+
+    # write under a temporary name, so that concurrent readers (including
+    # other processes) never see a partial file
+    replaced = sum(_getsize(os.path.join(path, name)) for name in _OUTPUTS)
+    temp     = os.path.join(path, '.{}-{}.tmp'.format(os.getpid(), threading.current_thread().ident))
+    if _is_array(value):
+      import numpy
+      with open(temp, 'wb') as f:
+        numpy.save(f, value)
+      output = os.path.join(path, 'output.npy')
+    else:
+      with open(temp, 'wb') as f:
+        pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+      output = os.path.join(path, 'output.pkl')
+
+    # a result of the other kind, stored before the function changed what it
+    # returns, would otherwise be found first. Remove it before the new one
+    # appears, so readers see either a miss or the new result.
+    for name in _OUTPUTS:
+      if os.path.join(path, name) != output:
+        _remove(os.path.join(path, name))
+    added = os.path.getsize(temp)
+    os.rename(temp, output)
+    if output.endswith('.npy'):
+      value = numpy.load(output, mmap_mode='r')
+
+    with self._lock:
+      self._stored += 1
+      if self._size is not None:
+        self._size += added - replaced
+      full = self.max_bytes is not None and (self._size is None or self._size > self.max_bytes)
+    if full:
+      self._evict()
+    return value
+
+  def _evict(self):
+    """
+    Runs on the files executor. Returns the number of results removed. Callers
+    still using a memory-mapped result keep it; its pages are freed when they
+    let go.
+    """
+    entries = []   # (last used, size, path)
+    now     = time.time()
+    removed = 0
+    for (root, dirs, names) in os.walk(self.directory):
+      outputs = [n for n in names if n in _OUTPUTS]
+      if not outputs:
+        continue
+      try:
+        output = os.stat(os.path.join(root, outputs[0]))
+        used   = os.stat(root).st_mtime
+      except OSError: # removed concurrently
+        continue
+      if self.max_age is not None and now - output.st_mtime > self.max_age:
+        _rmtree(root)
+        removed += 1
+      else:
+        entries.append((used, output.st_size, root))
+
+    total = sum(size for (used, size, root) in entries)
+    if self.max_bytes is not None:
+      entries.sort()
+      for (used, size, root) in entries:
+        if total <= self.max_bytes:
+          break
+        _rmtree(root)
+        removed += 1
+        total   -= size
+
+    with self._lock:
+      self._evicted += removed
+      self._size     = total
+    return removed
+
+  def _clear(self):
+    _rmtree(self.directory)
+    with self._lock:
+      self._size = 0
+
+
+_MISSING = object()
+
+_OUTPUTS = ('output.npy', 'output.pkl')
+
+
+def _rmtree(path):
+  import shutil
+  shutil.rmtree(path, True)
+
+
+def _bound(fn):
+  """
+  Values `fn` depends on besides its arguments and source: its defaults and
+  the variables it captured, so that closures made from the same definition
+  aren't mistaken for one another.
+  """
+  cells = getattr(fn, '__closure__', None) or ()
+  return (getattr(fn, '__defaults__', None), [c.cell_contents for c in cells])
+
+
+def _getsize(path):
+  try:
+    return os.path.getsize(path)
+  except OSError:
+    return 0
+
+
+def _remove(path):
+  try:
+    os.remove(path)
+  except OSError as e:
+    if e.errno != errno.ENOENT:
+      raise
+
+
+def _is_array(value):
+  # if numpy hasn't been imported, `value` can't be an array
+  numpy = sys.modules.get('numpy')
+  return (
+    numpy is not None
+    and type(value) is numpy.ndarray
+    and not value.dtype.hasobject
+    and value.size > 0   # empty files can't be memory-mapped
+  )
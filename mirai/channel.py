@@ -0,0 +1,227 @@
+import collections
+import threading
+
+from concurrent.futures import TimeoutError
+
+from . import context
+from .exceptions import QueueClosedError
+from .futures import Promise, _off_timer, _resolve
+
+
+class AsyncQueue(object):
+  """
+  A FIFO queue whose `put` and `get` return Futures instead of blocking, for
+  connecting producers to consumers without a thread waiting on either side.
+  An item put while a caller is waiting in `get` is handed straight to it.::
+
+    queue = AsyncQueue(max_size=100)
+
+    def consume():
+      return (
+        queue.get_many(32)
+        .flatmap(lambda batch: Promise.call(write, batch))
+        .flatmap(lambda _: consume())
+        .rescue(lambda e: Promise.value(None) if isinstance(e, QueueClosedError) else Promise.exception(e))
+      )
+    consumers = [consume() for i in range(4)]
+
+    for record in records:
+      queue.put(record).get()   # waits while the queue is full
+    queue.close()
+    queue.drain().get()         # waits until every record has been taken
+
+  Parameters
+  ----------
+  max_size : int or None, optional
+      Maximum number of items held; `put` waits while the queue is full. 0
+      holds no items at all: `put` waits until a `get` takes its item. None
+      for no limit.
+  """
+
+  def __init__(self, max_size=None):
+    if max_size is not None and max_size < 0:
+      raise ValueError("max_size must not be negative")
+    self.max_size = max_size
+
+    self._lock    = threading.Lock()
+    self._items   = collections.deque()
+    self._getters = collections.deque()   # (promise, n); n is None for `get`
+    self._putters = collections.deque()   # (promise, item) waiting for room
+    self._drained = []                    # promises from `drain`
+    self._closed  = False
+
+  def put(self, item, timeout=None):
+    """
+    Add an item to the queue.
+
+    Parameters
+    ----------
+    item : object
+        Item to add.
+    timeout : number or None, optional
+        Seconds to wait for room in the queue. If a deadline set with
+        `Promise.deadline` expires sooner, that deadline is used instead.
+
+    Returns
+    -------
+    result : Future
+        Future containing None once the item is in the queue (or taken by a
+        `get`). Fails with `QueueClosedError` if the queue is closed, or with
+        `TimeoutError` if there's no room in time, in which case the item is
+        never added.
+    """
+    p = Promise()
+    with self._lock:
+      if self._closed:
+        return Promise.exception(QueueClosedError("AsyncQueue is closed"))
+      self._putters.append((p, item))
+      done = self._pump()
+    self._resolve(done)
+    self._expire_after(p, self._putters, timeout)
+    return p.future()
+
+  def get(self, timeout=None):
+    """
+    Take the oldest item from the queue.
+
+    Parameters
+    ----------
+    timeout : number or None, optional
+        Seconds to wait for an item; see `put`.
+
+    Returns
+    -------
+    result : Future
+        Future containing the item. Fails with `QueueClosedError` if the
+        queue is closed and empty, or with `TimeoutError` if no item arrives
+        in time.
+    """
+    return self._get(None, timeout)
+
+  def get_many(self, n, timeout=None):
+    """
+    Take up to `n` of the oldest items from the queue at once. Waits only for
+    the first; the Future resolves with whatever's in the queue then.
+
+    Parameters
+    ----------
+    n : int
+        Maximum number of items to take.
+    timeout : number or None, optional
+        Seconds to wait for an item; see `put`.
+
+    Returns
+    -------
+    result : Future
+        Future containing a list of between 1 and `n` items, oldest first.
+        Fails as `get` does.
+    """
+    if n <= 0:
+      raise ValueError("n must be greater than 0")
+    return self._get(n, timeout)
+
+  def close(self):
+    """
+    Stop accepting items. Items already in the queue, or waiting for room,
+    can still be taken; once they have been, `get` fails with
+    `QueueClosedError`.
+    """
+    with self._lock:
+      self._closed = True
+      done = self._pump()
+    self._resolve(done)
+
+  def drain(self):
+    """
+    Wait for the queue to be closed and emptied.
+
+    Returns
+    -------
+    result : Future
+        Future containing None once the queue is closed and every item has
+        been taken.
+    """
+    p = Promise()
+    with self._lock:
+      self._drained.append(p)
+      done = self._pump()
+    self._resolve(done)
+    return p.future()
+
+  def qsize(self):
+    """Return the number of items in the queue, not counting waiting `put`s."""
+    with self._lock:
+      return len(self._items)
+
+  def closed(self):
+    """Return True if `close` has been called."""
+    with self._lock:
+      return self._closed
+
+  def _get(self, n, timeout):
+    p = Promise()
+    with self._lock:
+      self._getters.append((p, n))
+      done = self._pump()
+    self._resolve(done)
+    self._expire_after(p, self._getters, timeout)
+    return p.future()
+
+  def _pump(self):
+    """
+    Move waiting puts into the queue and items out to waiting gets. Called
+    with the lock held; returns the `(promise, value, exception)` triples to
+    resolve once it's released.
+    """
+    done = []
+    while True:
+      while self._putters and (self.max_size is None or len(self._items) < self.max_size):
+        (p, item) = self._putters.popleft()
+        self._items.append(item)
+        done.append((p, None, None))
+
+      if not self._getters or not (self._items or self._putters):
+        break
+
+      (p, n) = self._getters.popleft()
+      taken  = []
+      while len(taken) < (n or 1) and (self._items or self._putters):
+        if self._items:
+          taken.append(self._items.popleft())
+        else: # no room at all (max_size=0): take straight from a put
+          (q, item) = self._putters.popleft()
+          taken.append(item)
+          done.append((q, None, None))
+      done.append((p, taken if n is not None else taken[0], None))
+
+    if self._closed and not self._items and not self._putters:
+      e = QueueClosedError("AsyncQueue is closed")
+      done.extend((p, None, e) for (p, n) in self._getters)
+      done.extend((p, None, None) for p in self._drained)
+      self._getters.clear()
+      del self._drained[:]
+    return done
+
+  def _resolve(self, done):
+    for (p, value, exception) in done:
+      _resolve(p, value, exception)
+
+  def _expire_after(self, p, waiters, timeout):
+    remaining = context.remaining()
+    if remaining is not None and (timeout is None or remaining < timeout):
+      timeout = remaining
+    if timeout is None:
+      return
+
+    def expire():
+      with self._lock:
+        for waiter in waiters:
+          if waiter[0] is p:
+            waiters.remove(waiter)
+            break
+        else:
+          return # already resolved
+      _resolve(p, exception=TimeoutError("AsyncQueue did not respond in {} seconds".format(timeout)))
+
+    task = Promise._timer().schedule(timeout, _off_timer(expire))
+    p._future.add_done_callback(lambda f: task.cancel())
@@ -0,0 +1,101 @@
+"""
+Per-thread scheduling context. Work submitted with `Promise.call` runs under
+the context that was active when it was submitted, as do callbacks attached to
+the Promise it returns, so anything they schedule in turn inherits the same
+settings.
+"""
+import contextlib
+import threading
+import time
+
+
+class Context(object):
+  """
+  Immutable bundle of scheduling hints.
+
+  Parameters
+  ----------
+  priority : number or None
+      Priority used by priority-aware executors. Higher runs sooner.
+  deadline : number or None
+      Absolute time (as returned by `time.time()`) by which work started under
+      this context should be finished.
+  """
+
+  __slots__ = ['priority', 'deadline']
+
+  def __init__(self, priority=None, deadline=None):
+    self.priority = priority
+    self.deadline = deadline
+
+  def replace(self, **kwargs):
+    """Return a copy of this Context with some attributes replaced."""
+    values = dict((k, getattr(self, k)) for k in self.__slots__)
+    values.update(kwargs)
+    return Context(**values)
+
+  def __repr__(self):
+    return "Context({})".format(", ".join(
+      "{}={!r}".format(k, getattr(self, k)) for k in self.__slots__
+    ))
+
+
+EMPTY  = Context()
+_local = threading.local()
+
+
+def current():
+  """Return the Context active on this thread."""
+  return getattr(_local, 'context', EMPTY)
+
+
+@contextlib.contextmanager
+def bound(context):
+  """Make `context` the active Context on this thread for a `with` block."""
+  previous       = current()
+  _local.context = context
+  try:
+    yield context
+  finally:
+    _local.context = previous
+
+
+def deadline(timeout):
+  """
+  Bind a deadline `timeout` seconds from now for a `with` block. If a tighter
+  deadline is already active, it's kept.
+  """
+  ctx  = current()
+  when = time.time() + timeout
+  if ctx.deadline is not None and ctx.deadline <= when:
+    return bound(ctx)
+  else:
+    return bound(ctx.replace(deadline=when))
+
+
+def remaining():
+  """
+  Return the number of seconds left before the active deadline (possibly
+  negative), or None if there is no deadline.
+  """
+  when = current().deadline
+  if when is None:
+    return None
+  else:
+    return when - time.time()
+
+
+def wrap(fn, context=None):
+  """
+  Return a function that calls `fn` with `context` (default: the currently
+  active Context) bound. Returns `fn` itself if there's nothing to bind.
+  """
+  if context is None:
+    context = current()
+  if context is EMPTY:
+    return fn
+
+  def wrapped(*args, **kwargs):
+    with bound(context):
+      return fn(*args, **kwargs)
+  return wrapped
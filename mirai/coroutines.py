@@ -0,0 +1,108 @@
+import functools
+import types
+
+from .futures import Promise
+
+
+class Return(Exception):
+  """
+  Raise inside a `coroutine` to finish it with a value (generators can't
+  `return` one).
+
+  Parameters
+  ----------
+  value : anything
+      Value of the Promise the coroutine returned.
+  """
+
+  def __init__(self, value=None):
+    super(Return, self).__init__(value)
+    self.value = value
+
+
+def coroutine(fn):
+  """
+  Turn a generator function that yields Promises into a function returning a
+  Promise. Each time the generator yields a Promise, it's suspended until that
+  Promise resolves and then resumed with its value (or has its exception
+  raised at the `yield`). Yielding a list of Promises waits for all of them,
+  as with `Promise.collect`. No thread is blocked while the generator is
+  suspended, so unlike calling `Promise.get` inside `Promise.call`, this can't
+  starve the executor.::
+
+    @coroutine
+    def feed(user_id):
+      user    = yield Promise.call(fetch_user, user_id)
+      friends = yield [Promise.call(fetch_user, f) for f in user.friends]
+      raise Return(render(user, friends))
+
+    feed(1234).get()
+
+  The generator runs on the calling thread until it first waits on an
+  unresolved Promise, then on whichever thread resolves the Promise it's
+  waiting on -- so blocking work should still go through `Promise.call`.
+
+  Parameters
+  ----------
+  fn : generator function
+      Function to wrap. If it's not a generator, its return value is used
+      as-is.
+
+  Returns
+  -------
+  wrapper : (*args, **kwargs) -> Future
+      Function returning a Future containing the value passed to `Return`
+      (None if the generator finishes without raising one), or the exception
+      the generator raised.
+  """
+  @functools.wraps(fn)
+  def wrapper(*args, **kwargs):
+    try:
+      gen = fn(*args, **kwargs)
+    except Return as r:
+      return Promise.value(r.value)
+    except Exception as e:
+      return Promise.exception(e)
+    if not isinstance(gen, types.GeneratorType):
+      return Promise.value(gen)
+
+    p = Promise()
+    _step(gen, p, gen.send, None)
+    return p.future()
+  return wrapper
+
+
+def _step(gen, p, method, arg):
+  """Run `gen` until it waits on an unresolved Promise or finishes."""
+  while True:
+    try:
+      yielded = method(arg)
+    except StopIteration:
+      p.setvalue(None)
+      return
+    except Return as r:
+      p.setvalue(r.value)
+      return
+    except Exception as e:
+      p.setexception(e)
+      return
+
+    if isinstance(yielded, list):
+      yielded = Promise.collect(yielded)
+
+    if not isinstance(yielded, Promise):
+      method, arg = gen.send, yielded
+    elif yielded.isdefined():
+      # resume right away instead of through a callback so a run of already
+      # resolved Promises doesn't grow the stack
+      method, arg = _outcome(gen, yielded)
+    else:
+      yielded.respond(lambda f: _step(gen, p, *_outcome(gen, f)))
+      return
+
+
+def _outcome(gen, f):
+  try:
+    return (gen.send, f.get())
+  except Exception as e:
+    return (gen.throw, e)
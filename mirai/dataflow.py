@@ -0,0 +1,241 @@
+import threading
+import time
+
+from .futures import Promise
+
+
+class _Node(object):
+
+  __slots__ = ['name', 'fn', 'inputs', 'args', 'kwargs', 'cost', 'aliases']
+
+  def __init__(self, name, fn, inputs, args, kwargs, cost):
+    self.name    = name
+    self.fn      = fn
+    self.inputs  = inputs
+    self.args    = args
+    self.kwargs  = kwargs
+    self.cost    = cost
+    self.aliases = []
+
+
+class Dataflow(object):
+  """
+  A graph of dependent computations. Each node names the nodes whose values it
+  takes as input; `run` turns the graph into Promises, starting every node as
+  soon as its inputs are available.::
+
+    flow = Dataflow()
+    flow.add('user',    fetch_user, args=(user_id,))
+    flow.add('friends', fetch_friends, inputs=['user'])
+    flow.add('posts',   fetch_posts,   inputs=['user'], cost=5)
+    flow.add('feed',    build_feed,    inputs=['friends', 'posts'])
+
+    feed = flow.run(['feed']).map(lambda values: values['feed'])
+
+  Nodes that would compute the same thing -- the same function applied to the
+  same inputs and arguments -- are only computed once. Each node is submitted
+  with `Promise.call` at a priority equal to the total cost of the most
+  expensive path from it to the end of the graph, so when used with a
+  `PriorityThreadPoolExecutor`, work on the critical path runs first.
+  """
+
+  def __init__(self):
+    self._lock    = threading.Lock()
+    self._nodes   = {}   # name -> _Node
+    self._order   = []   # canonical node names, in the order they were added
+    self._aliases = {}   # name -> canonical name
+    self._keys    = {}   # (fn, inputs, args, kwargs) -> canonical name
+    self._trace   = {}
+
+  def add(self, name, fn, inputs=(), args=(), kwargs=None, cost=1.0):
+    """
+    Add a node to the graph.
+
+    Parameters
+    ----------
+    name : str
+        Name of the node. Must be unique.
+    fn : function
+        Function computing the node's value. It's called with the values of
+        `inputs` as positional arguments, followed by `args` and `kwargs`.
+    inputs : [str], optional
+        Names of nodes whose values `fn` takes. They must already have been
+        added, which also guarantees the graph has no cycles.
+    args : tuple, optional
+        Extra positional arguments for `fn`.
+    kwargs : dict, optional
+        Keyword arguments for `fn`.
+    cost : number, optional
+        Relative cost of computing this node, used to find the critical path.
+
+    Returns
+    -------
+    name : str
+        Name of the node that will compute this value. If an identical node
+        already exists, this is its name.
+    """
+    kwargs = kwargs or {}
+    with self._lock:
+      if name in self._aliases:
+        raise ValueError("Node {!r} already exists".format(name))
+      for i in inputs:
+        if i not in self._aliases:
+          raise ValueError("Node {!r} depends on unknown node {!r}".format(name, i))
+
+      inputs = tuple(self._aliases[i] for i in inputs)
+      try:
+        key = (fn, inputs, tuple(args), frozenset(kwargs.items()))
+        hash(key)
+      except TypeError: # unhashable arguments can't be compared; never share
+        key = None
+
+      if key is not None and key in self._keys:
+        canonical = self._keys[key]
+        self._aliases[name] = canonical
+        self._nodes[canonical].aliases.append(name)
+        return canonical
+
+      self._nodes[name]   = _Node(name, fn, inputs, tuple(args), kwargs, cost)
+      self._aliases[name] = name
+      self._order.append(name)
+      if key is not None:
+        self._keys[key] = name
+      return name
+
+  def critical_path(self):
+    """
+    Return the total cost of the most expensive path from each node to the end
+    of the graph (including the node itself).
+
+    Returns
+    -------
+    result : dict
+        Mapping from canonical node name to path cost.
+    """
+    with self._lock:
+      order = list(self._order)
+      nodes = dict(self._nodes)
+
+    path = {}
+    for name in reversed(order):
+      path.setdefault(name, 0)
+      path[name] += nodes[name].cost
+      for i in nodes[name].inputs:
+        path[i] = max(path.get(i, 0), path[name])
+    return path
+
+  def run(self, targets=None):
+    """
+    Compute the graph, or only the parts of it needed for `targets`.
+
+    Parameters
+    ----------
+    targets : [str] or None
+        Names of the nodes whose values are wanted. If None, all nodes.
+
+    Returns
+    -------
+    result : Future
+        Future containing a dict from each name in `targets` to its value.
+        Fails with the exception of the first node to fail.
+    """
+    with self._lock:
+      order   = list(self._order)
+      nodes   = dict(self._nodes)
+      aliases = dict(self._aliases)
+    if targets is None:
+      targets = list(aliases)
+    for t in targets:
+      if t not in aliases:
+        raise ValueError("Unknown node {!r}".format(t))
+
+    # only run nodes that targets (transitively) depend upon
+    needed = set(aliases[t] for t in targets)
+    for name in reversed(order):
+      if name in needed:
+        needed.update(nodes[name].inputs)
+
+    path     = self.critical_path()
+    trace    = {}
+    promises = {}
+    for name in order:
+      if name not in needed:
+        continue
+      node           = nodes[name]
+      record         = {'priority': path[name]}
+      trace[name]    = record
+      inputs         = [promises[i] for i in node.inputs]
+      promises[name] = (
+        Promise.collect(inputs)
+        .flatmap(lambda values, node=node, record=record:
+          Promise.call(self._timed(node, record), *(values + list(node.args)), priority=record['priority'], **node.kwargs)
+        )
+      )
+    self._trace = trace
+
+    names = list(targets)
+    return Promise.collect([promises[aliases[t]] for t in names]).map(lambda values: dict(zip(names, values)))
+
+  def _timed(self, node, record):
+    record['ready'] = time.time()
+    def timed(*args, **kwargs):
+      record['start'] = time.time()
+      try:
+        return node.fn(*args, **kwargs)
+      finally:
+        record['end'] = time.time()
+    return timed
+
+  def export(self):
+    """
+    Describe the graph and the timings of its most recent `run`.
+
+    Returns
+    -------
+    result : [dict]
+        One dict per node, in the order nodes were added, with keys `name`,
+        `aliases` (names of identical nodes merged into this one), `function`,
+        `inputs`, `cost` and `priority`. Nodes computed by the most recent run
+        also have `ready` (when their inputs were available), `start` and
+        `end` times as given by `time.time()`.
+    """
+    with self._lock:
+      order = list(self._order)
+      nodes = dict(self._nodes)
+    trace = self._trace
+    path  = self.critical_path()
+
+    result = []
+    for name in order:
+      node = nodes[name]
+      info = {
+        'name'     : name,
+        'aliases'  : list(node.aliases),
+        'function' : getattr(node.fn, '__name__', repr(node.fn)),
+        'inputs'   : list(node.inputs),
+        'cost'     : node.cost,
+        'priority' : path[name],
+      }
+      info.update(trace.get(name, {}))
+      result.append(info)
+    return result
+
+  def to_dot(self):
+    """
+    Render the graph and the timings of its most recent `run` in Graphviz's
+    DOT language.
+
+    Returns
+    -------
+    result : str
+    """
+    lines = ["digraph dataflow {"]
+    for node in self.export():
+      label = node['name']
+      if 'start' in node and 'end' in node:
+        label += "\\n{:.1f} ms".format(1000 * (node['end'] - node['start']))
+      lines.append('  "{}" [label="{}"];'.format(node['name'], label))
+      for i in node['inputs']:
+        lines.append('  "{}" -> "{}";'.format(i, node['name']))
+    lines.append("}")
+    return "\n".join(lines)
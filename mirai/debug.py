@@ -0,0 +1,197 @@
+"""
+Debugging aids. Callbacks attached with `Promise.respond` (and so with
+`Promise.map`, `Promise.onsuccess`, etc.) run on whichever thread resolves
+their Promise -- often an executor worker -- so a slow callback stalls
+unrelated work. While a `CallbackProfiler` is enabled, every callback is
+timed, attributed to the function it came from and the line that registered
+it, and reported if it runs for too long.::
+
+  from mirai import debug
+
+  profiler = debug.enable(threshold=0.05)
+  ...
+  profiler.print_stats(sort='cpu')
+  debug.disable()
+"""
+import logging
+import os
+import resource
+import sys
+import threading
+import time
+
+from .futures import Promise
+
+
+log = logging.getLogger(__name__)
+
+_PACKAGE = os.path.dirname(os.path.abspath(__file__))
+
+# per-thread CPU time is only available on Linux; elsewhere, fall back to wall
+# time.
+_RUSAGE_THREAD = getattr(resource, 'RUSAGE_THREAD', 1 if sys.platform.startswith('linux') else None)
+
+def _cpu():
+  if _RUSAGE_THREAD is None:
+    return time.time()
+  usage = resource.getrusage(_RUSAGE_THREAD)
+  return usage.ru_utime + usage.ru_stime
+
+
+def _internal(code):
+  """True if `code` belongs to mirai itself (but not its tests)."""
+  return os.path.dirname(os.path.abspath(code.co_filename)) == _PACKAGE
+
+
+def _qualname(fn):
+  """Best-effort dotted name for a callable."""
+  if hasattr(fn, 'im_func'):
+    cls = fn.im_class if fn.im_self is None or isinstance(fn.im_self, type) else type(fn.im_self)
+    return "{}.{}.{}".format(fn.__module__, cls.__name__, fn.__name__)
+  elif hasattr(fn, '__name__'):
+    return "{}.{}".format(getattr(fn, '__module__', None), fn.__name__)
+  else:
+    return "{}.{}".format(type(fn).__module__, type(fn).__name__)
+
+
+def _origin(fn, depth=0):
+  """
+  mirai wraps user callbacks in its own closures (e.g. `Promise.map` registers
+  a function that calls `fn`). Dig through those closures for the user's
+  function. Returns `fn` if there isn't one.
+  """
+  code = getattr(getattr(fn, 'im_func', fn), 'func_code', None)
+  if code is None or not _internal(code):
+    return fn
+  if depth < 4:
+    for cell in getattr(fn, 'func_closure', None) or ():
+      try:
+        value = cell.cell_contents
+      except ValueError: # cell not yet bound
+        continue
+      if callable(value) and not isinstance(value, (type, Promise)):
+        origin = _origin(value, depth + 1)
+        if origin is not None:
+          return origin
+  return fn if depth == 0 else None
+
+
+def _site():
+  """`file:line` of the innermost stack frame outside of mirai."""
+  frame = sys._getframe(2)
+  while frame is not None and _internal(frame.f_code):
+    frame = frame.f_back
+  if frame is None:
+    return "<unknown>"
+  return "{}:{}".format(frame.f_code.co_filename, frame.f_lineno)
+
+
+class CallbackProfiler(object):
+  """
+  Collects timings for callbacks registered while it's installed.
+
+  Parameters
+  ----------
+  threshold : number or None, optional
+      Callbacks that run for longer than this many seconds (wall time) are
+      logged as a warning on the `mirai.debug` logger. If None, nothing is
+      logged.
+  """
+
+  def __init__(self, threshold=0.1):
+    self.threshold = threshold
+    self._lock     = threading.Lock()
+    self._stats    = {}
+
+  def wrap(self, fn):
+    """Return a version of callback `fn` that records its timings here."""
+    key = (_qualname(_origin(fn)), _site())
+
+    def timed(*args, **kwargs):
+      wall = time.time()
+      cpu  = _cpu()
+      try:
+        return fn(*args, **kwargs)
+      finally:
+        self.record(key, time.time() - wall, _cpu() - cpu)
+    return timed
+
+  def record(self, key, wall, cpu):
+    with self._lock:
+      stats = self._stats.get(key)
+      if stats is None:
+        stats = self._stats[key] = [0, 0.0, 0.0, 0.0]
+      stats[0] += 1
+      stats[1] += wall
+      stats[2] += cpu
+      stats[3]  = max(stats[3], wall)
+
+    if self.threshold is not None and wall > self.threshold:
+      log.warning("Executing callback %s registered at %s took %.3f seconds", key[0], key[1], wall)
+
+  def stats(self, sort='cpu'):
+    """
+    Return timings per callback, most expensive first.
+
+    Parameters
+    ----------
+    sort : str
+        Field to sort by: 'calls', 'wall', 'cpu' or 'max'.
+
+    Returns
+    -------
+    stats : [dict]
+        One dict per (function, registration site) pair with keys `name`,
+        `site`, `calls`, `wall` (total seconds), `cpu` (total CPU seconds on
+        the calling thread) and `max` (longest wall time for one call).
+    """
+    with self._lock:
+      items = self._stats.items()
+    result = [
+      {'name': name, 'site': site, 'calls': calls, 'wall': wall, 'cpu': cpu, 'max': max_}
+      for ((name, site), (calls, wall, cpu, max_)) in items
+    ]
+    result.sort(key=lambda s: s[sort], reverse=True)
+    return result
+
+  def print_stats(self, sort='cpu', limit=20, stream=None):
+    """Print the `limit` most expensive callbacks as a table."""
+    stream = stream or sys.stdout
+    stream.write("{:>8} {:>10} {:>10} {:>10}  {}\n".format("calls", "cpu", "wall", "max", "callback"))
+    for s in self.stats(sort)[:limit]:
+      stream.write("{calls:8d} {cpu:10.4f} {wall:10.4f} {max:10.4f}  {name} ({site})\n".format(**s))
+
+  def clear(self):
+    """Forget all timings collected so far."""
+    with self._lock:
+      self._stats.clear()
+
+
+def enable(threshold=0.1):
+  """
+  Start timing callbacks registered from now on.
+
+  Parameters
+  ----------
+  threshold : number or None, optional
+      See `CallbackProfiler`.
+
+  Returns
+  -------
+  profiler : CallbackProfiler
+  """
+  Promise.PROFILER = CallbackProfiler(threshold)
+  return Promise.PROFILER
+
+
+def disable():
+  """
+  Stop timing newly registered callbacks.
+
+  Returns
+  -------
+  profiler : CallbackProfiler or None
+      The profiler that was installed, with the timings it collected.
+  """
+  profiler, Promise.PROFILER = Promise.PROFILER, None
+  return profiler
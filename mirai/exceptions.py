@@ -1,6 +1,6 @@
 import sys
-
-import joblib
+import traceback
+import weakref
 
 
 class MiraiError(Exception):
@@ -16,6 +16,22 @@ class AlreadyResolvedError(MiraiError):
   pass
 
 
+class RejectedError(MiraiError):
+  """
+  Exception set on a future when an executor's queue is full and it refuses
+  (or drops) the task instead of running it.
+  """
+  pass
+
+
+class QueueClosedError(MiraiError):
+  """
+  Exception set on a future when putting an item into a closed `AsyncQueue`,
+  or getting one from a closed `AsyncQueue` that's been emptied.
+  """
+  pass
+
+
 class ShadowException(MiraiError):
   """
   An exception that's never used directly. In particular, a ShadowException is
@@ -53,18 +69,28 @@ class ShadowException(MiraiError):
   def __getattr__(self, key):
     return getattr(self.exception, key)
 
+  # child classes built so far, by the class of the exception they wrap. Both
+  # are held weakly, so that exception classes created at runtime can still be
+  # collected: a child class refers to the class it wraps, so holding it
+  # strongly would keep its key alive too.
+  _classes = weakref.WeakKeyDictionary()
+
   @staticmethod
   def build(exception, context):
     """
     Construct a child class of a thrown exception and ShadowException, and
-    instantiate it.
+    instantiate it. Child classes are reused for as long as they're in use.
     """
     cls = exception.__class__
-    t = type(
-      "Mirai" + cls.__name__,
-      (ShadowException, cls),
-      {}
-    )
+    ref = ShadowException._classes.get(cls)
+    t   = None if ref is None else ref()
+    if t is None:
+      t = type(
+        "Mirai" + cls.__name__,
+        (ShadowException, cls),
+        {}
+      )
+      ShadowException._classes[cls] = weakref.ref(t)
     return t(exception, context)
 
 
@@ -84,7 +110,7 @@ class SafeFunction(object):
       e_type, e_value, e_tb = sys.exc_info()
 
       # turn stack into a string
-      text = joblib.format_stack.format_exc(e_type, e_value, e_tb, context=10, tb_offset=1)
+      text = _format_exc(e_type, e_value, e_tb)
 
       # manually delete e_tb (failing to do so will cause a memory leak. See
       # documentation for sys.exc_info())
@@ -93,3 +119,18 @@ class SafeFunction(object):
       # construct a new exception instance that's of the same class as the one
       # thrown, but also with additional context.
       raise ShadowException.build(e, text)
+
+
+def _format_exc(e_type, e_value, e_tb):
+  """
+  Describe the stack of an exception thrown inside `SafeFunction`. Uses
+  joblib's formatter, which shows the code around each frame, if it's
+  installed. joblib is only imported once an exception needs formatting, as
+  importing it takes longer than importing the rest of mirai.
+  """
+  try:
+    from joblib import format_stack
+  except ImportError:
+    # skip the frame for `SafeFunction.__call__`
+    return "".join(traceback.format_exception(e_type, e_value, e_tb.tb_next or e_tb))
+  return format_stack.format_exc(e_type, e_value, e_tb, context=10, tb_offset=1)
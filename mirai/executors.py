@@ -0,0 +1,552 @@
+from concurrent import futures
+import atexit
+import collections
+import heapq
+import itertools
+import threading
+import time
+import weakref
+
+from . import context, fork
+from .exceptions import RejectedError
+
+
+# Like concurrent.futures.ThreadPoolExecutor, let workers finish their queues
+# before the interpreter tears down the modules they use.
+_executors = weakref.WeakSet()
+
+def _python_exit():
+  for executor in list(_executors):
+    executor.shutdown(wait=True)
+
+atexit.register(_python_exit)
+
+def _after_fork():
+  for executor in list(_executors):
+    executor._after_fork()
+
+fork.register(_after_fork)
+
+
+class _WorkItem(object):
+  """A function call waiting in an executor's queue."""
+
+  __slots__ = ['future', 'fn', 'args', 'kwargs', 'enqueued']
+
+  def __init__(self, future, fn, args, kwargs):
+    self.future   = future
+    self.fn       = fn
+    self.args     = args
+    self.kwargs   = kwargs
+    self.enqueued = time.time()
+
+  def run(self, ran=None):
+    """
+    Call the function and resolve the future. `ran`, if given, is called just
+    before the future is resolved, i.e. before any callbacks on it run.
+    """
+    if not self.future.set_running_or_notify_cancel():
+      if ran is not None:
+        ran()
+      return
+    try:
+      result, exception = self.fn(*self.args, **self.kwargs), None
+    except BaseException as e:
+      result, exception = None, e
+    if ran is not None:
+      ran()
+    if exception is not None:
+      self.future.set_exception(exception)
+    else:
+      self.future.set_result(result)
+
+
+class _Throughput(object):
+  """Count events in one-second buckets over a sliding window."""
+
+  def __init__(self, window=10):
+    self.window  = window
+    self.buckets = collections.deque()
+
+  def record(self, now):
+    second = int(now)
+    if self.buckets and self.buckets[-1][0] == second:
+      self.buckets[-1][1] += 1
+    else:
+      self.buckets.append([second, 1])
+    self._trim(now)
+
+  def rate(self, now):
+    self._trim(now)
+    return sum(count for (_, count) in self.buckets) / float(self.window)
+
+  def _trim(self, now):
+    while self.buckets and self.buckets[0][0] <= int(now) - self.window:
+      self.buckets.popleft()
+
+
+class AdaptiveThreadPoolExecutor(futures.Executor):
+  """
+  A thread pool that grows and shrinks with demand. A new worker is started
+  whenever there are more queued tasks than idle workers (up to
+  `max_workers`), and workers that sit idle for `idle_timeout` seconds exit
+  (down to `min_workers`). With `min_workers=0`, an idle executor holds no
+  threads at all.::
+
+    from mirai import Promise, AdaptiveThreadPoolExecutor
+
+    Promise.executor(AdaptiveThreadPoolExecutor(max_workers=50))
+    ...
+    print Promise.executor().stats()
+
+  By default the queue of waiting tasks is unbounded. Setting `max_queue`
+  bounds it, and `overflow` picks what happens to a task submitted while the
+  queue is full:
+
+  * `'block'`: the submitting thread waits until there's room. Don't use this
+    if tasks submit more tasks to the same executor; with every worker blocked
+    in `submit`, nothing will ever make room. If a deadline is active (see
+    `Promise.deadline`), it waits no longer than that, and the returned future
+    then fails with a `TimeoutError`.
+  * `'reject'`: the returned future fails right away with a `RejectedError`.
+  * `'caller_runs'`: the task runs on the submitting thread before `submit`
+    returns, which slows producers down to the rate they can do the work
+    themselves.
+  * `'drop_oldest'`: the task that has been queued the longest fails with a
+    `RejectedError` to make room.
+
+  Parameters
+  ----------
+  max_workers : int
+      Maximum number of worker threads.
+  min_workers : int, optional
+      Number of worker threads kept alive even when idle.
+  idle_timeout : number, optional
+      Seconds a worker may wait for work before it exits.
+  max_queue : int or None, optional
+      Maximum number of tasks waiting for a worker. None for no limit.
+  overflow : str, optional
+      What to do when a task is submitted while the queue is full: `'block'`,
+      `'reject'`, `'caller_runs'` or `'drop_oldest'`.
+  """
+
+  OVERFLOW = ('block', 'reject', 'caller_runs', 'drop_oldest')
+
+  def __init__(self, max_workers=10, min_workers=0, idle_timeout=60.0, max_queue=None, overflow='block'):
+    if max_workers <= 0:
+      raise ValueError("max_workers must be greater than 0")
+    if not 0 <= min_workers <= max_workers:
+      raise ValueError("min_workers must be between 0 and max_workers")
+    if max_queue is not None and max_queue <= 0:
+      raise ValueError("max_queue must be greater than 0")
+    if overflow not in self.OVERFLOW:
+      raise ValueError("overflow must be one of {}".format(", ".join(self.OVERFLOW)))
+
+    self.max_workers  = max_workers
+    self.min_workers  = min_workers
+    self.idle_timeout = idle_timeout
+    self.max_queue    = max_queue
+    self.overflow     = overflow
+
+    lock              = threading.Lock()
+    self._cond        = threading.Condition(lock)   # work available
+    self._space       = threading.Condition(lock)   # room in a bounded queue
+    self._queue       = collections.deque()
+    self._shutdown    = False
+    self._threads     = set()
+    self._workers     = 0
+    self._idle        = 0
+    self._peak        = 0
+    self._submitted   = 0
+    self._completed   = 0
+    self._wait_time   = 0.0
+    self._max_wait    = 0.0
+    self._overflowed  = 0
+    self._throughput  = _Throughput()
+
+    with self._cond:
+      for i in range(min_workers):
+        self._spawn()
+    _executors.add(self)
+
+  def _after_fork(self):
+    # the parent's workers don't exist in this process and its tasks aren't
+    # this process's to run. Start over with fresh locks and an empty queue.
+    lock           = threading.Lock()
+    self._cond     = threading.Condition(lock)
+    self._space    = threading.Condition(lock)
+    self._threads  = set()
+    self._workers  = 0
+    self._idle     = 0
+    self._clear()
+    with self._cond:
+      if not self._shutdown:
+        for i in range(self.min_workers):
+          self._spawn()
+
+  # QUEUE -- subclasses may override these to change scheduling order. All are
+  # called with `self._cond` held.
+  def _enqueue(self, item):
+    self._queue.append(item)
+
+  def _dequeue(self):
+    return self._queue.popleft()
+
+  def _queued(self):
+    return len(self._queue)
+
+  def _evict(self):
+    """Remove and return the task to drop under `overflow='drop_oldest'`."""
+    return self._queue.popleft()
+
+  def _clear(self):
+    self._queue = collections.deque()
+
+  # EXECUTOR
+  def submit(self, fn, *args, **kwargs):
+    fork.check()
+    future  = futures.Future()
+    item    = _WorkItem(future, fn, args, kwargs)
+    dropped = None
+
+    with self._cond:
+      if self._shutdown:
+        raise RuntimeError('cannot schedule new futures after shutdown')
+
+      if self._full():
+        self._overflowed += 1
+        if self.overflow == 'block':
+          # wait for room, but not past the caller's deadline
+          deadline = context.current().deadline
+          while self._full() and not self._shutdown:
+            if deadline is None:
+              self._space.wait()
+            elif deadline > time.time():
+              self._space.wait(deadline - time.time())
+            else:
+              item = None
+              break
+          if self._shutdown:
+            raise RuntimeError('cannot schedule new futures after shutdown')
+        elif self.overflow == 'drop_oldest':
+          dropped = self._evict()
+        else:
+          item = None
+
+      if item is not None:
+        item.enqueued = time.time()
+        self._enqueue(item)
+        self._submitted += 1
+
+        if self._idle < self._queued() and self._workers < self.max_workers:
+          self._spawn()
+        self._cond.notify()
+
+    # resolve futures outside the lock; their callbacks may submit more tasks
+    if dropped is not None:
+      dropped.future.set_exception(RejectedError("Task dropped from a full executor queue"))
+    if item is None:
+      if self.overflow == 'reject':
+        future.set_exception(RejectedError("Executor queue is full"))
+      elif self.overflow == 'block':
+        future.set_exception(futures.TimeoutError("Deadline passed while waiting for room in the executor queue"))
+      else:
+        _WorkItem(future, fn, args, kwargs).run()
+    return future
+
+  submit.__doc__ = futures.Executor.submit.__doc__
+
+  def submit_many(self, fn, args):
+    """
+    Schedule `fn(*a)` for each tuple `a` in `args`, taking the queue's lock
+    once for all of them rather than once per call.
+
+    Returns
+    -------
+    futures : [concurrent.futures.Future]
+        One per call, in the same order as `args`.
+    """
+    if self.max_queue is not None:
+      # apply the overflow policy one task at a time
+      return [self.submit(fn, *a) for a in args]
+
+    fork.check()
+
+    items = [_WorkItem(futures.Future(), fn, tuple(a), {}) for a in args]
+    with self._cond:
+      if self._shutdown:
+        raise RuntimeError('cannot schedule new futures after shutdown')
+
+      for item in items:
+        self._enqueue(item)
+      self._submitted += len(items)
+
+      while self._idle < self._queued() and self._workers < self.max_workers:
+        self._spawn()
+      self._cond.notify(len(items))
+    return [item.future for item in items]
+
+  def shutdown(self, wait=True):
+    with self._cond:
+      self._shutdown = True
+      self._cond.notify_all()
+      self._space.notify_all()
+      threads = list(self._threads)
+    if wait:
+      for thread in threads:
+        if thread is not threading.current_thread():
+          thread.join()
+
+  shutdown.__doc__ = futures.Executor.shutdown.__doc__
+
+  def stats(self):
+    """
+    Report the current load on this executor.
+
+    Returns
+    -------
+    stats : dict
+        `queued` (tasks waiting for a worker), `max_queue`, `occupancy`
+        (`queued / max_queue`, or None if the queue is unbounded), `active`
+        (workers running a task), `idle`, `workers` and `peak_workers`
+        (thread counts), `submitted` and `completed` (task counts),
+        `overflowed` (tasks submitted while the queue was full),
+        `throughput` (tasks completed per second over the last 10 seconds),
+        `wait_time` (moving average of seconds spent queued) and
+        `max_wait_time`.
+    """
+    with self._cond:
+      queued = self._queued()
+      return {
+        'queued'        : queued,
+        'max_queue'     : self.max_queue,
+        'occupancy'     : None if self.max_queue is None else queued / float(self.max_queue),
+        'active'        : self._workers - self._idle,
+        'idle'          : self._idle,
+        'workers'       : self._workers,
+        'peak_workers'  : self._peak,
+        'submitted'     : self._submitted,
+        'completed'     : self._completed,
+        'overflowed'    : self._overflowed,
+        'throughput'    : self._throughput.rate(time.time()),
+        'wait_time'     : self._wait_time,
+        'max_wait_time' : self._max_wait,
+      }
+
+  def _full(self):
+    return self.max_queue is not None and self._queued() >= self.max_queue
+
+  # WORKERS
+  def _spawn(self):
+    # new workers count as idle until they pick up a task so that a burst of
+    # submissions doesn't start more threads than there are tasks.
+    self._workers += 1
+    self._idle    += 1
+    self._peak     = max(self._peak, self._workers)
+
+    thread = threading.Thread(target=self._work)
+    thread.daemon = True
+    self._threads.add(thread)
+    thread.start()
+
+  def _next(self):
+    """Wait for the next task, or return None if this worker should exit."""
+    with self._cond:
+      deadline = time.time() + self.idle_timeout
+      while self._queued() == 0:
+        if self._shutdown:
+          return self._retire()
+        remaining = deadline - time.time()
+        if remaining <= 0:
+          if self._workers > self.min_workers:
+            return self._retire()
+          remaining = self.idle_timeout
+          deadline  = time.time() + remaining
+        self._cond.wait(remaining)
+
+      item        = self._dequeue()
+      self._idle -= 1
+      if self.max_queue is not None:
+        self._space.notify()
+
+      waited          = time.time() - item.enqueued
+      self._wait_time = 0.9 * self._wait_time + 0.1 * waited
+      self._max_wait  = max(self._max_wait, waited)
+      return item
+
+  def _retire(self):
+    self._workers -= 1
+    self._idle    -= 1
+    self._threads.discard(threading.current_thread())
+    return None
+
+  def _work(self):
+    while True:
+      item = self._next()
+      if item is None:
+        return
+      item.run(self._ran)
+      del item
+
+  def _ran(self):
+    # the worker counts as idle before the task's future is resolved, so that
+    # tasks submitted by its callbacks, or by a thread waiting on it, reuse
+    # this worker rather than starting another.
+    with self._cond:
+      self._idle      += 1
+      self._completed += 1
+      self._throughput.record(time.time())
+
+
+class PriorityThreadPoolExecutor(AdaptiveThreadPoolExecutor):
+  """
+  An `AdaptiveThreadPoolExecutor` that runs queued tasks in priority order
+  instead of first-in-first-out. A task's priority is taken from the active
+  `mirai.context` when it's submitted -- see the `priority` argument of
+  `Promise.call`. Higher priorities run sooner; tasks without one have
+  priority 0. Ties run in submission order.
+
+  Parameters
+  ----------
+  max_workers : int
+      Maximum number of worker threads.
+  aging : number or None, optional
+      If set, a queued task gains 1 priority for every `aging` seconds it
+      waits, so low-priority work is never starved indefinitely.
+  **kwargs : keyword arguments
+      Passed on to `AdaptiveThreadPoolExecutor`. With
+      `overflow='drop_oldest'`, the task dropped is the one that would run
+      last.
+  """
+
+  def __init__(self, max_workers=10, aging=None, **kwargs):
+    if aging is not None and aging <= 0:
+      raise ValueError("aging must be greater than 0")
+    self.aging    = aging
+    self._heap    = []
+    self._counter = itertools.count()
+    super(PriorityThreadPoolExecutor, self).__init__(max_workers=max_workers, **kwargs)
+
+  def _enqueue(self, item):
+    priority = context.current().priority or 0
+
+    # With aging, a task's effective priority is `priority + waited / aging`.
+    # Every queued task ages at the same rate, so ordering by the constant
+    # `priority - enqueued / aging` is equivalent and keeps the heap valid.
+    if self.aging is not None:
+      priority -= item.enqueued / self.aging
+
+    heapq.heappush(self._heap, (-priority, next(self._counter), item))
+
+  def _dequeue(self):
+    return heapq.heappop(self._heap)[2]
+
+  def _clear(self):
+    self._heap = []
+
+  def _evict(self):
+    # drop the task that would run last rather than the oldest one
+    entry = max(self._heap)
+    self._heap.remove(entry)
+    heapq.heapify(self._heap)
+    return entry[2]
+
+  def _queued(self):
+    return len(self._heap)
+
+
+class PartitionedExecutor(object):
+  """
+  Runs calls that share a key one at a time, in the order they were submitted,
+  while calls with different keys run in parallel. Each key with pending calls
+  has a queue that's drained by a single task on an underlying executor, so no
+  thread ever waits for another call with the same key to finish. Keys with no
+  pending calls take no memory.::
+
+    partitions = PartitionedExecutor(Promise.executor)
+    partitions.submit(account_id, apply_update, update)
+
+  Parameters
+  ----------
+  executor : Executor or (,) -> Executor
+      Executor to run calls on, or a function returning it.
+  batch_size : int, optional
+      Number of calls a key may run back-to-back before its queue is put at
+      the back of the executor's queue, giving other keys a turn.
+  """
+
+  def __init__(self, executor, batch_size=16):
+    if batch_size <= 0:
+      raise ValueError("batch_size must be greater than 0")
+    self._executor  = executor if callable(executor) else (lambda: executor)
+    self.batch_size = batch_size
+    self._lock      = threading.Lock()
+    self._queues    = {}
+
+  def submit(self, key, fn, *args, **kwargs):
+    """
+    Schedule `fn(*args, **kwargs)` to run after all calls previously
+    submitted with the same `key`.
+
+    Returns
+    -------
+    future : concurrent.futures.Future
+    """
+    future = futures.Future()
+    item   = _WorkItem(future, fn, args, kwargs)
+    ctx    = context.current()
+    with self._lock:
+      queue = self._queues.get(key)
+      if queue is not None:
+        queue.append((item, ctx))
+        return future
+      self._queues[key] = collections.deque([(item, ctx)])
+    self._schedule(key, ctx)
+    return future
+
+  def keys(self):
+    """Return the number of keys with calls pending or running."""
+    with self._lock:
+      return len(self._queues)
+
+  def _schedule(self, key, ctx):
+    # the task draining `key` runs with the context (e.g. priority) of the
+    # call at the head of its queue. If the executor won't run it -- it's
+    # shut down or full -- nothing else will drain the queue, so fail it.
+    try:
+      with context.bound(ctx):
+        task = self._executor().submit(self._drain, key)
+    except Exception as e:
+      self._fail(key, e)
+      return
+
+    def done(task):
+      e = futures.CancelledError() if task.cancelled() else task.exception()
+      if e is not None:
+        self._fail(key, e)
+    task.add_done_callback(done)
+
+  def _fail(self, key, exception):
+    with self._lock:
+      queue = self._queues.pop(key, ())
+    for (item, ctx) in queue:
+      if item.future.set_running_or_notify_cancel():
+        item.future.set_exception(exception)
+
+  def _drain(self, key):
+    for i in range(self.batch_size):
+      with self._lock:
+        queue = self._queues[key]
+        if not queue:
+          del self._queues[key]
+          return
+        (item, ctx) = queue.popleft()
+      item.run()
+      del item
+    with self._lock:
+      queue = self._queues[key]
+      if not queue:
+        del self._queues[key]
+        return
+      ctx = queue[0][1]
+    self._schedule(key, ctx)
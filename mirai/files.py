@@ -0,0 +1,184 @@
+"""
+Read files without tying up `Promise.EXECUTOR`. Disk reads run on a separate
+pool, sized for I/O rather than computation, so a burst of reads doesn't hold
+up other work (and vice versa).::
+
+  from mirai import files
+
+  files.executor(AdaptiveThreadPoolExecutor(max_workers=64))
+  contents = files.read_many(paths).get()
+  header   = files.read(path, offset=0, size=512).get()
+  table    = files.mmap_view(path).map(parse_table)
+"""
+from concurrent import futures
+import itertools
+import os
+import threading
+
+from . import context, fork
+from .executors import AdaptiveThreadPoolExecutor
+from .futures import Promise, _prepare
+
+
+EXECUTOR = None # created on first use; see executor
+_lock    = threading.Lock()
+
+
+def executor(executor=None):
+  """
+  Set/Get the executor file operations run on. If setting, the current
+  executor is first shut down. Unless one is set, an
+  `AdaptiveThreadPoolExecutor` with up to 16 workers is created the first
+  time one is needed.
+
+  Parameters
+  ----------
+  executor : concurrent.futures.Executor or None
+      If None, retrieve the current executor, otherwise, shutdown the current
+      Executor object and replace it with this argument.
+
+  Returns
+  -------
+  executor : Executor
+      Current executor
+  """
+  global EXECUTOR
+  fork.check()
+  with _lock:
+    if executor is None:
+      if EXECUTOR is None:
+        EXECUTOR = AdaptiveThreadPoolExecutor(max_workers=16)
+    else:
+      if EXECUTOR is not None:
+        EXECUTOR.shutdown()
+      EXECUTOR = executor
+    return EXECUTOR
+
+
+def _after_fork():
+  global EXECUTOR, _lock
+  _lock = threading.Lock()
+
+  # as with Promise.EXECUTOR, the parent's workers aren't in this process
+  if isinstance(EXECUTOR, futures.ThreadPoolExecutor):
+    EXECUTOR = futures.ThreadPoolExecutor(max_workers=EXECUTOR._max_workers)
+
+fork.register(_after_fork)
+
+
+def read(path, offset=0, size=None):
+  """
+  Read a file, or part of one.
+
+  Parameters
+  ----------
+  path : str
+      File to read.
+  offset : int, optional
+      Byte to start reading from.
+  size : int or None, optional
+      Maximum number of bytes to read. If None, read to the end of the file.
+
+  Returns
+  -------
+  result : Future
+      Future containing the bytes read.
+  """
+  return _submit(_read, path, offset, size)
+
+
+def read_many(paths, batch_size=16, mmap_threshold=None):
+  """
+  Read many whole files. Files are read `batch_size` to a task, so reading
+  thousands of small files doesn't cost thousands of trips through the
+  executor's queue.
+
+  Parameters
+  ----------
+  paths : iterable of str
+      Files to read.
+  batch_size : int, optional
+      Number of files read per executor task.
+  mmap_threshold : int or None, optional
+      Files at least this many bytes long are memory-mapped (as by
+      `mmap_view`) instead of copied into a string. If None, all files are
+      copied.
+
+  Returns
+  -------
+  result : Future
+      Future containing the contents of each file, in the same order as
+      `paths`. Fails with the first error encountered.
+  """
+  if batch_size <= 0:
+    raise ValueError("batch_size must be greater than 0")
+  paths   = list(paths)
+  batches = [paths[i:i + batch_size] for i in range(0, len(paths), batch_size)]
+  if len(batches) == 0:
+    return Promise.value([])
+
+  def read_batch(batch):
+    return [_load(path, mmap_threshold) for path in batch]
+
+  return (
+    Promise.collect([_submit(read_batch, batch) for batch in batches])
+    .map(lambda results: list(itertools.chain.from_iterable(results)))
+  )
+
+
+def mmap_view(path):
+  """
+  Memory-map a file for reading. Nothing is read up front; pages are loaded
+  by the operating system as they're accessed and shared with every other
+  process mapping the same file, so this is the cheapest way to use large
+  files. The map supports slicing, `len`, `find` and the buffer interface
+  (e.g. `numpy.frombuffer`).
+
+  Parameters
+  ----------
+  path : str
+      File to map.
+
+  Returns
+  -------
+  result : Future
+      Future containing a read-only `mmap.mmap`, or an empty string if the
+      file is empty (empty files can't be mapped).
+  """
+  return _submit(_map, path)
+
+
+def _submit(fn, *args):
+  ctx = context.current()
+  p   = Promise(executor().submit(_prepare(fn, ctx), *args))
+  p._context = ctx
+  return p.future()
+
+
+def _read(path, offset, size):
+  with open(path, 'rb') as f:
+    if offset:
+      f.seek(offset)
+    return f.read() if size is None else f.read(size)
+
+
+def _load(path, mmap_threshold):
+  with open(path, 'rb') as f:
+    if mmap_threshold is not None:
+      size = os.fstat(f.fileno()).st_size
+      if size > 0 and size >= mmap_threshold:
+        return _mmap(f)
+    return f.read()
+
+
+def _map(path):
+  with open(path, 'rb') as f:
+    if os.fstat(f.fileno()).st_size == 0:
+      return ""
+    return _mmap(f)
+
+
+def _mmap(f):
+  # imported on first use to keep it out of `import mirai`
+  import mmap
+  return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
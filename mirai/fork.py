@@ -0,0 +1,52 @@
+"""
+Keep mirai usable in processes forked after it was imported, e.g. by prefork
+servers such as gunicorn or by `multiprocessing`. A forked child starts with
+only the thread that called `fork`, so executor workers and the timer thread
+of its parent are gone, and any lock one of them held stays locked forever.
+
+Modules holding such state register a function with `register`; `check`, which
+mirai calls whenever it hands out an executor or the timer, runs those
+functions the first time it's called in a new process. Where the interpreter
+supports `os.register_at_fork`, they run right after the fork instead.
+"""
+import os
+import threading
+
+
+_pid   = os.getpid()
+_hooks = []
+_lock  = threading.Lock()
+
+
+def register(fn):
+  """
+  Call `fn()` in each child process forked from now on, before mirai is used
+  there.
+
+  Parameters
+  ----------
+  fn : (,) -> None
+      Function replacing per-process state. It must not wait on locks that
+      may have been held at the time of the fork.
+  """
+  _hooks.append(fn)
+
+
+def check():
+  """Run the functions given to `register` if this is a newly forked process."""
+  global _pid
+  if os.getpid() == _pid:
+    return
+  # `_lock` is only ever held while running hooks, so it can't have been
+  # inherited locked unless this process forked while it was itself catching
+  # up on a fork.
+  with _lock:
+    if os.getpid() == _pid:
+      return
+    for fn in list(_hooks):
+      fn()
+    _pid = os.getpid()
+
+
+if hasattr(os, 'register_at_fork'):
+  os.register_at_fork(after_in_child=check)
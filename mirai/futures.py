@@ -1,11 +1,19 @@
 from concurrent import futures
 from concurrent.futures import TimeoutError
+import Queue
+import errno
+import itertools
+import os
 import sys
 import threading
 import time
 import traceback
+import types
 
+from . import context, fork
 from .exceptions import MiraiError, SafeFunction, AlreadyResolvedError
+from .executors import PartitionedExecutor
+from .timer import Timer
 from .utils import proxyto
 
 # Future methods:
@@ -59,13 +67,20 @@ class Promise(object):
       return promise.future()
   """
 
-  EXECUTOR = futures.ThreadPoolExecutor(max_workers=10)
+  EXECUTOR   = None # created on first use; see Promise.executor
+  PARTITIONS = PartitionedExecutor(lambda: Promise.executor())
+  TIMER      = None # created on first use; see Promise._timer
+  REACTOR    = None # created on first use; see Promise._reactor
+  PROFILER   = None # see mirai.debug
+  ROUTER     = None # see mirai.routing
 
-  __slots__ = ['_future', '_lock']
+  __slots__ = ['_future', '_lock', '_context', '_submitted']
 
   def __init__(self, future=None):
-    self._future = future or futures.Future()
-    self._lock   = threading.Lock()
+    self._future    = future or futures.Future()
+    self._lock      = threading.Lock()
+    self._context   = context.EMPTY
+    self._submitted = future is not None # `_future` is an executor's
 
   def andthen(self, fn):
     """
@@ -472,7 +487,9 @@ class Promise(object):
 
   def respond(self, fn):
     """
-    Apply a function to this Promise when it's resolved.
+    Apply a function to this Promise when it's resolved. If this Promise was
+    created by `Promise.call`, `fn` runs under the same priority and deadline
+    as the call did.
 
     Parameters
     ----------
@@ -483,9 +500,17 @@ class Promise(object):
     -------
     self : Promise
     """
+    if Promise.PROFILER is not None:
+      fn = Promise.PROFILER.wrap(fn)
+
+    ctx = self._context
     def done_callback(fut):
       try:
-        fn(self)
+        if ctx is context.EMPTY:
+          fn(self)
+        else:
+          with context.bound(ctx):
+            fn(self)
       except Exception as e:
         traceback.print_stack()
         print 'FATAL Uncaught exception in Promise.respond:', e # TODO log.error
@@ -617,7 +642,8 @@ class Promise(object):
     Return a Promise whose state is guaranteed to be resolved within `duration`
     seconds. If this Promise completes before `duration` seconds expire, it will
     contain this Promise's contents. If this Promise is not resolved by then, the
-    resulting Promise will fail with a `TimeoutError`.
+    resulting Promise will fail with a `TimeoutError`. If a deadline set with
+    `Promise.deadline` expires sooner, that deadline is used instead.
 
     Parameters
     ----------
@@ -629,8 +655,19 @@ class Promise(object):
     result : Promise
         Promise guaranteed to resolve in `duration` seconds.
     """
+    remaining = context.remaining()
+    if remaining is not None and remaining < duration:
+      duration = remaining
+
     e = TimeoutError("Promise did not finish in {} seconds".format(duration))
-    return self.or_(Promise.wait(duration).flatmap(lambda v: Promise.exception(e)))
+    p = Promise()
+    timeout = Promise._timer().schedule(duration, _off_timer(lambda: p.updateifempty(Promise.exception(e))))
+
+    def respond(fut):
+      timeout.cancel()
+      p.updateifempty(fut)
+    self.respond(respond)
+    return p
 
   # CONSTRUCTORS
   @classmethod
@@ -667,14 +704,9 @@ class Promise(object):
     result : Future
         Promise that will resolve in `duration` seconds with value `None`.
     """
-    def wait():
-      try:
-        time.sleep(duration)
-        return None
-      except Exception as e:
-        raise e
-
-    return Promise.call(wait).future()
+    p = cls()
+    cls._timer().schedule(duration, _off_timer(lambda: p.setvalue(None)))
+    return p.future()
 
   @classmethod
   def exception(cls, exc):
@@ -774,7 +806,7 @@ class Promise(object):
                 p.updateifempty(Promise.value(xs))
           fs[i].onsuccess(onsuccess).onfailure(onfailure)
         body(i)
-      return p
+      return cls._bounded(p)
 
   @classmethod
   def join(cls, fs):
@@ -823,7 +855,210 @@ class Promise(object):
         def body(f): # Capture f for closures below
           f.respond(lambda x: p.updateifempty(Promise.value((f, filter(lambda g: g != f, fs)))))
         body(f)
-    return p
+    return cls._bounded(p)
+
+  @classmethod
+  def as_completed(cls, fs, timeout=None):
+    """
+    Iterate over Promises in `fs` in the order they resolve, successfully or
+    otherwise, blocking until the next one is ready. Iteration stops after
+    every Promise in `fs` has been yielded.::
+
+      for fut in Promise.as_completed(shards, timeout=5.0):
+        if fut.issuccess():
+          total += fut.get()
+
+    Parameters
+    ----------
+    fs : [Promise]
+        Promises to wait upon.
+    timeout : number or None
+        Number of seconds after which iteration raises a `TimeoutError` if
+        Promises remain unresolved. If `None`, wait indefinitely. The
+        deadline set with `Promise.deadline` applies too, if it's sooner.
+
+    Returns
+    -------
+    result : iterator of Promises
+        Promises from `fs`, each of which is resolved.
+    """
+    remaining = context.remaining()
+    if remaining is not None and (timeout is None or remaining < timeout):
+      timeout = remaining
+
+    done = Queue.Queue()
+    n    = 0
+    for f in fs:
+      f.respond(done.put)
+      n += 1
+
+    def iterate(n, deadline):
+      for i in range(n):
+        # Queue.get without a timeout can't be interrupted by Ctrl-C
+        wait = sys.maxint if deadline is None else max(deadline - time.time(), 0)
+        try:
+          f = done.get(timeout=wait)
+        except Queue.Empty:
+          raise TimeoutError("{} of {} Promises did not finish in {} seconds".format(n - i, n, timeout))
+        yield f
+
+    return iterate(n, None if timeout is None else time.time() + timeout)
+
+  @classmethod
+  def fold(cls, fs, init, fn):
+    """
+    Combine the values of Promises in `fs` into a single value, applying
+    `fn(accumulator, value)` to each value as soon as it arrives, in order of
+    arrival. Values are not retained after they've been folded in, so memory
+    use doesn't grow with `len(fs)`. `fn` calls are never concurrent. If any
+    Promise in `fs` fails (or `fn` raises), the resulting Promise fails with
+    the same exception.::
+
+      total = Promise.fold(shards, 0, operator.add)
+
+    Parameters
+    ----------
+    fs : [Promise]
+        Promises whose values to combine.
+    init : anything
+        Initial value of the accumulator.
+    fn : (accumulator, value) -> accumulator
+        Function returning the new accumulator. Since values are folded in as
+        they arrive, the result should not depend on their order.
+
+    Returns
+    -------
+    result : Future
+        Future containing the final accumulator.
+    """
+    fs = list(fs)
+    if len(fs) == 0:
+      return Promise.value(init)
+
+    lock  = threading.Lock()
+    acc   = [init]
+    count = [len(fs)]
+    p     = Promise()
+
+    def respond(f):
+      with lock:
+        if count[0] == 0:
+          return
+        try:
+          acc[0] = fn(acc[0], f.get())
+        except Exception as e:
+          count[0] = 0
+          outcome  = Promise.exception(e)
+        else:
+          count[0] -= 1
+          if count[0] > 0:
+            return
+          outcome = Promise.value(acc[0])
+        acc[0] = None
+      p.update(outcome)
+
+    for f in fs:
+      f.respond(respond)
+    del fs
+    return cls._bounded(p)
+
+  @classmethod
+  def quorum(cls, fs, k, cancel=False):
+    """
+    Construct a Promise containing the values of the first `k` Promises in `fs`
+    to succeed, in the order they succeeded. Failures are skipped unless so
+    many Promises fail that `k` successes are no longer possible, in which case
+    the resulting Promise fails with the exception of the Promise that made it
+    impossible. Either way, the result resolves as soon as the outcome is
+    decided, without waiting on the remaining Promises.
+
+    Parameters
+    ----------
+    fs : [Promise]
+        List of Promises to wait upon.
+    k : int
+        Number of successful Promises required. Use `len(fs) // 2 + 1` for a
+        majority.
+    cancel : bool, optional
+        If True, once the outcome is decided, cancel the work queued by
+        `Promise.call` (and the like) for Promises in `fs` that hasn't started
+        yet, so that it never runs. Other Promises are left alone.
+
+    Returns
+    -------
+    result : Future
+        Future containing a list of `k` values.
+    """
+    fs = list(fs)
+    if not 0 < k <= len(fs):
+      raise ValueError('Promise.quorum requires 0 < k <= len(fs)')
+
+    lock     = threading.Lock()
+    values   = []
+    failures = [0]
+    inputs   = [fs] # released once the outcome is decided
+    p        = Promise()
+
+    def respond(f):
+      with lock:
+        if inputs[0] is None:
+          return
+        try:
+          values.append(f.get())
+        except Exception as e:
+          failures[0] += 1
+          if failures[0] <= len(inputs[0]) - k:
+            return
+          outcome = Promise.exception(e)
+        else:
+          if len(values) < k:
+            return
+          outcome = Promise.value(list(values))
+        remaining, inputs[0] = inputs[0], None
+
+      p.update(outcome)
+      if cancel:
+        # only executors' futures can be cancelled. Whatever resolves any other
+        # Promise would fail on finding it already resolved.
+        for g in remaining:
+          if g._submitted:
+            g._future.cancel()
+
+    for f in fs:
+      f.respond(respond)
+    del fs
+    return cls._bounded(p)
+
+  @classmethod
+  def first_successful(cls, fs, cancel=False):
+    """
+    Construct a Promise containing the value of the first Promise in `fs` to
+    succeed. Unlike `Promise.select`, failures are skipped; the result only
+    fails (with the last exception) if every Promise in `fs` fails.
+
+    Parameters
+    ----------
+    fs : [Promise]
+        List of Promises to wait upon.
+    cancel : bool, optional
+        If True, cancel the queued work of Promises in `fs` that hasn't started
+        once one succeeds. See `Promise.quorum`.
+
+    Returns
+    -------
+    result : Future
+        Future containing the first successful value.
+    """
+    return cls.quorum(fs, 1, cancel=cancel).map(lambda vs: vs[0])
+
+  @classmethod
+  def _bounded(cls, p):
+    """Bound `p` by the active deadline, if there is one."""
+    remaining = context.remaining()
+    if remaining is None:
+      return p
+    else:
+      return p.within(remaining)
 
   @classmethod
   def eval(cls, fn, *args, **kwargs):
@@ -866,12 +1101,65 @@ class Promise(object):
     `context` attribute detailing the stack at the time the exception was
     thrown.
 
+    `fn` runs under the deadline set with `Promise.deadline`, if any. If that
+    deadline has already passed by the time a worker picks `fn` up, `fn` is
+    never called and the result fails with a `TimeoutError`.
+
+    Parameters
+    ----------
+    fn : function
+        Function to be called
+    *args : arguments
+    **kwargs : keyword arguments
+    priority : number, optional
+        Scheduling priority for executors that support it, such as
+        `PriorityThreadPoolExecutor`. Higher runs sooner. If omitted, the
+        priority of the currently running call is inherited, so work spawned
+        from a prioritized call (including its callbacks) keeps its priority.
+        This keyword is consumed by `call` and not passed on to `fn`.
+
+    If `mirai.routing` is enabled, CPU-bound functions may run on a process
+    pool instead.
+
+    Returns
+    -------
+    result : Future
+        Future containing the result of `fn(*args, **kwargs)` as its value or
+        the exception thrown as its exception.
+    """
+    if 'priority' in kwargs:
+      ctx = context.current().replace(priority=kwargs.pop('priority'))
+      with context.bound(ctx):
+        return cls.call(fn, *args, **kwargs)
+
+    ctx = context.current()
+    if cls.ROUTER is not None:
+      p = cls(cls.ROUTER.submit(fn, _prepare(fn, ctx), args, kwargs))
+    else:
+      p = cls(cls.executor().submit(_prepare(fn, ctx), *args, **kwargs))
+    p._context = ctx
+    return p.future()
+
+  @classmethod
+  def call_keyed(cls, key, fn, *args, **kwargs):
+    """
+    Like `Promise.call`, but calls made with the same `key` run one at a time,
+    in the order they were made. Calls with different keys run in parallel.
+    Waiting calls are queued per key rather than holding a worker thread, and
+    keys with nothing queued take no memory.::
+
+      for update in updates:
+        Promise.call_keyed(update.account_id, apply_update, update)
+
     Parameters
     ----------
+    key : hashable
+        Calls with equal keys are run serially.
     fn : function
         Function to be called
     *args : arguments
     **kwargs : keyword arguments
+        As for `Promise.call`, including `priority`.
 
     Returns
     -------
@@ -879,7 +1167,554 @@ class Promise(object):
         Future containing the result of `fn(*args, **kwargs)` as its value or
         the exception thrown as its exception.
     """
-    return cls(cls.EXECUTOR.submit(SafeFunction(fn), *args, **kwargs)).future()
+    if 'priority' in kwargs:
+      ctx = context.current().replace(priority=kwargs.pop('priority'))
+      with context.bound(ctx):
+        return cls.call_keyed(key, fn, *args, **kwargs)
+
+    fork.check()
+    ctx = context.current()
+    p   = cls(cls.PARTITIONS.submit(key, _prepare(fn, ctx), *args, **kwargs))
+    p._context = ctx
+    return p.future()
+
+  @classmethod
+  def call_many(cls, fn, args, chunksize=1, priority=None):
+    """
+    Call a function asynchronously once per tuple of arguments in `args` and
+    return a Promise with all of the results, in order. This is equivalent
+    to::
+
+      Promise.collect([Promise.call(fn, *a) for a in args])
+
+    but much cheaper for large numbers of calls: every task is put on the
+    executor's queue at once (if the executor supports `submit_many`, as
+    `AdaptiveThreadPoolExecutor` does) and no Promise is created per call.
+    With `chunksize` greater than 1, each executor task makes that many calls
+    in a row, trading parallelism for less scheduling overhead -- worthwhile
+    when `fn` is quick.
+
+    Parameters
+    ----------
+    fn : function
+        Function to be called
+    args : iterable of tuples
+        Positional arguments for each call.
+    chunksize : int, optional
+        Number of calls made per executor task.
+    priority : number, optional
+        As for `Promise.call`.
+
+    Returns
+    -------
+    result : Future
+        Future containing a list with the result of `fn(*a)` for each `a` in
+        `args`, or the first exception thrown.
+    """
+    if chunksize <= 0:
+      raise ValueError("chunksize must be greater than 0")
+    if priority is not None:
+      ctx = context.current().replace(priority=priority)
+      with context.bound(ctx):
+        return cls.call_many(fn, args, chunksize)
+
+    args   = [tuple(a) for a in args]
+    chunks = [args[i:i + chunksize] for i in range(0, len(args), chunksize)]
+    if len(chunks) == 0:
+      return Promise.value([])
+
+    ctx = context.current()
+    run = _prepare(lambda chunk: [fn(*a) for a in chunk], ctx)
+    executor = cls.executor()
+    if hasattr(executor, 'submit_many'):
+      fs = executor.submit_many(run, [(chunk,) for chunk in chunks])
+    else:
+      fs = [executor.submit(run, chunk) for chunk in chunks]
+
+    # gather results straight from the executor's futures rather than through
+    # a Promise per task
+    lock    = threading.Lock()
+    results = [None] * len(fs)
+    count   = [len(fs)]
+    p       = cls()
+    p._context = ctx
+
+    def done(i, f):
+      e = futures.CancelledError() if f.cancelled() else f.exception()
+      if e is not None:
+        p.updateifempty(Promise.exception(e))
+        return
+      with lock:
+        results[i] = f.result()
+        count[0]  -= 1
+        finished   = count[0] == 0
+      if finished:
+        p.updateifempty(Promise.value(list(itertools.chain.from_iterable(results))))
+
+    for (i, f) in enumerate(fs):
+      f.add_done_callback(lambda f, i=i: done(i, f))
+    return cls._bounded(p.future())
+
+  @classmethod
+  def map_array(cls, fn, array, chunks=None, axis=0, out=None):
+    """
+    Apply a function to a NumPy array in parallel, chunk by chunk. The array
+    is split along `axis` into views (no data is copied), `fn` is called on
+    each with `Promise.call_many`, and each result is written straight into
+    its place in the output array.::
+
+      normalized = Promise.map_array(lambda rows: rows / rows.sum(axis=1)[:, None], matrix)
+
+    As chunks run on threads, `fn` gains the most from this when it spends
+    its time in NumPy routines that release the GIL.
+
+    Parameters
+    ----------
+    fn : (array,) -> array
+        Function to apply to each chunk. Must return an array the same length
+        as the chunk along `axis`.
+    array : array_like
+        Array to split.
+    chunks : int or None, optional
+        Number of chunks. If None, one is chosen from the size of `array`
+        and the number of executor workers: enough for 4 per worker, but no
+        chunk smaller than 64 KB unless the array is.
+    axis : int, optional
+        Axis to split along.
+    out : numpy.ndarray or None, optional
+        Array to write results into, shaped like the results put together.
+        If None, one is allocated, shaped and typed after the first chunk's
+        result.
+
+    Returns
+    -------
+    result : Future
+        Future containing the output array, or the first exception thrown.
+    """
+    import numpy
+
+    array = numpy.asarray(array)
+    if array.ndim == 0:
+      raise ValueError("array must have at least one dimension")
+    axis  = range(array.ndim)[axis]
+    n     = array.shape[axis]
+
+    if chunks is None:
+      executor = cls.executor()
+      workers  = getattr(executor, 'max_workers', None) or getattr(executor, '_max_workers', None)
+      if workers is None:
+        import multiprocessing
+        workers = multiprocessing.cpu_count()
+      chunks = min(4 * workers, array.nbytes // (64 * 1024))
+    elif chunks <= 0:
+      raise ValueError("chunks must be greater than 0")
+    chunks = max(1, min(chunks, n))
+    bounds = [i * n // chunks for i in range(chunks + 1)]
+
+    lock   = threading.Lock()
+    output = [out]
+
+    def section(start, stop):
+      index = [slice(None)] * array.ndim
+      index[axis] = slice(start, stop)
+      return tuple(index)
+
+    def run(start, stop):
+      result = numpy.asarray(fn(array[section(start, stop)]))
+      if result.ndim != array.ndim or result.shape[axis] != stop - start:
+        raise ValueError(
+          "fn returned an array of shape {} for a chunk of shape {}"
+          .format(result.shape, array[section(start, stop)].shape)
+        )
+      with lock:
+        if output[0] is None:
+          shape       = list(result.shape)
+          shape[axis] = n
+          output[0]   = numpy.empty(shape, dtype=result.dtype)
+      output[0][section(start, stop)] = result
+
+    return (
+      cls.call_many(run, zip(bounds[:-1], bounds[1:]))
+      .map(lambda results: output[0])
+    )
+
+  @classmethod
+  def deadline(cls, timeout):
+    """
+    Set a deadline `timeout` seconds from now for all work started inside a
+    `with` block. Calls made with `Promise.call` carry the deadline to their
+    workers (and anything they start in turn); they are skipped if it has
+    passed before they begin. `Promise.within`, `Promise.collect` and
+    `Promise.select` fail with a `TimeoutError` once it passes. Nested
+    deadlines can only tighten the current one.::
+
+      with Promise.deadline(0.5):
+        user    = Promise.call(fetch_user, user_id)
+        friends = user.flatmap(lambda u: Promise.collect(fetch_friends(u)))
+
+    Parameters
+    ----------
+    timeout : number
+        Number of seconds from now until the deadline.
+
+    Returns
+    -------
+    context : context manager
+    """
+    return context.deadline(timeout)
+
+  @classmethod
+  def remaining(cls):
+    """
+    Number of seconds left until the active deadline.
+
+    Returns
+    -------
+    remaining : number or None
+        Seconds until the deadline set with `Promise.deadline` passes (negative
+        if it already has), or `None` if there is no deadline.
+    """
+    return context.remaining()
+
+  @classmethod
+  def lazy(cls, fn, *args, **kwargs):
+    """
+    Like `Promise.call`, but `fn` isn't submitted to the executor until the
+    result is observed -- when `get` is called on it, a callback is registered
+    on it, or it's passed to a combinator such as `Promise.collect`. Until
+    then it costs nothing, so speculative work that's never used never runs.
+    Transformations (`map`, `flatmap`, `within`, etc.) of the result are lazy
+    too. The priority and deadline active when `lazy` is called are the ones
+    `fn` runs under.
+
+    Parameters
+    ----------
+    fn : function
+        Function to be called
+    *args : arguments
+    **kwargs : keyword arguments
+
+    Returns
+    -------
+    result : Future
+        Future containing the result of `fn(*args, **kwargs)`.
+    """
+    return LazyPromise(lambda p: p.update(cls.call(fn, *args, **kwargs))).future()
+
+  # I/O
+  @classmethod
+  def readable(cls, sock, timeout=None):
+    """
+    Construct a Promise that resolves once `sock` has data to read (or has
+    reached end-of-file, or failed). No thread is blocked while waiting; all
+    waiting descriptors are watched by a single reactor thread, which also
+    runs the callbacks of the returned Promise.
+
+    Parameters
+    ----------
+    sock : socket or int
+        Socket, or any object with a `fileno` method, or a file descriptor.
+    timeout : number or None, optional
+        Seconds to wait before failing with a `TimeoutError`. Bounded by the
+        deadline set with `Promise.deadline`, if any.
+
+    Returns
+    -------
+    result : Future
+        Future containing `sock`.
+    """
+    from .reactor import READ
+    return cls._io(sock, READ, lambda: sock, timeout, wait=True)
+
+  @classmethod
+  def writable(cls, sock, timeout=None):
+    """
+    Construct a Promise that resolves once `sock` can be written to without
+    blocking. See `Promise.readable`.
+
+    Returns
+    -------
+    result : Future
+        Future containing `sock`.
+    """
+    from .reactor import WRITE
+    return cls._io(sock, WRITE, lambda: sock, timeout, wait=True)
+
+  @classmethod
+  def recv(cls, sock, bufsize, timeout=None):
+    """
+    Receive up to `bufsize` bytes from `sock` as soon as any are available,
+    without blocking a thread while waiting. See `Promise.readable`.
+
+    Parameters
+    ----------
+    sock : socket
+        Socket to read from. Should be non-blocking on platforms without
+        `socket.MSG_DONTWAIT`.
+    bufsize : int
+        Maximum number of bytes to receive.
+    timeout : number or None, optional
+        Seconds to wait before failing with a `TimeoutError`.
+
+    Returns
+    -------
+    result : Future
+        Future containing the bytes received; an empty string if the other
+        end has closed the connection.
+    """
+    from .reactor import READ
+    flags = _dontwait()
+    return cls._io(sock, READ, lambda: sock.recv(bufsize, flags), timeout)
+
+  @classmethod
+  def send(cls, sock, data, timeout=None):
+    """
+    Send all of `data` on `sock`, waiting for room in its buffer as needed
+    without blocking a thread. See `Promise.readable`.
+
+    Parameters
+    ----------
+    sock : socket
+        Socket to write to. Should be non-blocking on platforms without
+        `socket.MSG_DONTWAIT`.
+    data : str
+        Bytes to send.
+    timeout : number or None, optional
+        Seconds to wait for all of `data` to be sent before failing with a
+        `TimeoutError`. Part of it may have been sent by then.
+
+    Returns
+    -------
+    result : Future
+        Future containing the number of bytes sent.
+    """
+    from .reactor import WRITE
+    flags = _dontwait()
+    view  = memoryview(data)
+    sent  = [0]
+
+    def send():
+      sent[0] += sock.send(view[sent[0]:], flags)
+      if sent[0] < len(view):
+        return _AGAIN
+      return sent[0]
+    return cls._io(sock, WRITE, send, timeout)
+
+  @classmethod
+  def subprocess(cls, argv, input=None, stdout=None, stderr=None, timeout=None, **kwargs):
+    """
+    Run a command and construct a Promise of its outcome. The child's pipes
+    are serviced by the reactor thread (see `Promise.readable`), and it's
+    reaped by polling on the timer thread, so no thread waits on it --
+    running hundreds of commands at once costs no more threads than running
+    one.::
+
+      Promise.subprocess(['gzip', '-c'], input=data).map(lambda (code, out, err): out)
+
+    Parameters
+    ----------
+    argv : [str]
+        Command and arguments, as for `subprocess.Popen`.
+    input : str or None, optional
+        Bytes to write to the command's standard input, which is then closed.
+        If None, standard input is `/dev/null`.
+    stdout, stderr : (str,) -> None or None, optional
+        If given, called with each chunk of output as it arrives instead of
+        collecting it all in memory. Called on the reactor thread, so it
+        should be quick.
+    timeout : number or None, optional
+        Seconds to wait for the command to finish. If it doesn't, it's killed
+        and the result fails with a `TimeoutError`. Bounded by the deadline
+        set with `Promise.deadline`, if any. The command has finished once it
+        has exited and closed its output, so this also bounds the wait for
+        any process it leaves running with its output open.
+    **kwargs : keyword arguments
+        Passed on to `subprocess.Popen`, e.g. `cwd` or `env`.
+
+    Returns
+    -------
+    result : Future
+        Future containing `(returncode, stdout, stderr)` once the command has
+        exited, where `stdout` and `stderr` are the collected output, or None
+        if streamed to a function. Fails if the command can't be started.
+    """
+    import subprocess
+    from .reactor import READ, WRITE
+
+    kwargs.setdefault('close_fds', True)
+    try:
+      if input is None:
+        with open(os.devnull, 'rb') as devnull:
+          proc = subprocess.Popen(argv, stdin=devnull, stdout=subprocess.PIPE, stderr=subprocess.PIPE, **kwargs)
+      else:
+        proc = subprocess.Popen(argv, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, **kwargs)
+    except (OSError, ValueError) as e:
+      return cls.exception(e)
+
+    reactor = cls._reactor()
+    timer   = cls._timer()
+    p       = cls()
+    p._context = context.current()
+    lock    = threading.Lock()
+    open_   = [2 if input is None else 3]
+    output  = {'stdout': [], 'stderr': []}
+    waiting = {}   # pipe -> (fd, event, function) the reactor will call
+
+    def fail(e):
+      # resolve first: killing the command may let the pipes close and the
+      # command be reaped successfully before this thread gets to it
+      try:
+        p.setexception(e)
+      except AlreadyResolvedError:
+        return
+      try:
+        if proc.returncode is None: # don't signal a reaped (and reusable) pid
+          proc.kill()
+      except OSError: # already exited
+        pass
+
+      # stop waiting on the pipes, which something the command started may
+      # still hold open, and reap the command whatever state they're in
+      with lock:
+        pipes = waiting.items()
+        waiting.clear()
+      for (f, (fd, event, fn)) in pipes:
+        if reactor.unwatch(fd, event, fn):
+          f.close()
+      reap(0.001)
+
+    def wait(f, event, fn):
+      with lock:
+        if p.isdefined():
+          f.close()
+          return
+        waiting[f] = (f.fileno(), event, fn)
+      reactor.watch(f.fileno(), event, fn)
+
+    def closed(f):
+      f.close()
+      with lock:
+        waiting.pop(f, None)
+        open_[0] -= 1
+        last = open_[0] == 0
+      if last:
+        reap(0.001)
+
+    def reap(delay):
+      # the pipes are closed or the child was killed, so it's done or nearly so
+      if proc.poll() is None:
+        timer.schedule(delay, _off_timer(lambda: reap(min(2 * delay, 0.1))))
+        return
+      _resolve(p, value=(
+        proc.returncode,
+        None if stdout is not None else "".join(output['stdout']),
+        None if stderr is not None else "".join(output['stderr']),
+      ))
+
+    def pump(f, write):
+      fd = f.fileno()
+      _nonblocking(fd)
+
+      def read():
+        while True:
+          try:
+            chunk = os.read(fd, 65536)
+          except (IOError, OSError) as e:
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+              wait(f, READ, read)
+              return
+            fail(e)
+            chunk = ""
+          if not chunk:
+            closed(f)
+            return
+          if not p.isdefined():
+            try:
+              write(chunk)
+            except Exception as e:
+              fail(e)
+      read()
+
+    def feed(f, data):
+      fd = f.fileno()
+      _nonblocking(fd)
+      sent = [0]
+
+      def write():
+        while sent[0] < len(data):
+          try:
+            sent[0] += os.write(fd, data[sent[0]:sent[0] + 65536])
+          except (IOError, OSError) as e:
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+              wait(f, WRITE, write)
+              return
+            if e.errno != errno.EPIPE: # the child needn't read all its input
+              fail(e)
+            break
+        closed(f)
+      write()
+
+    remaining = context.remaining()
+    if remaining is not None and (timeout is None or remaining < timeout):
+      timeout = remaining
+    if timeout is not None:
+      e    = TimeoutError("Command did not finish in {} seconds".format(timeout))
+      task = timer.schedule(timeout, _off_timer(lambda: fail(e)))
+      p._future.add_done_callback(lambda f: task.cancel())
+
+    if input is not None:
+      feed(proc.stdin, input)
+    pump(proc.stdout, stdout or output['stdout'].append)
+    pump(proc.stderr, stderr or output['stderr'].append)
+    return p.future()
+
+  @classmethod
+  def _io(cls, sock, event, op, timeout, wait=False):
+    """
+    Resolve a Promise with `op()` once it succeeds. `op` is retried whenever
+    `sock` is next ready for `event` while it fails with EAGAIN or returns
+    `_AGAIN`. If `wait`, `op` is only tried once `sock` is ready.
+    """
+    fd      = sock if isinstance(sock, (int, long)) else sock.fileno()
+    reactor = cls._reactor()
+    p       = cls()
+    p._context = context.current()
+
+    def attempt():
+      if p.isdefined(): # timed out
+        return
+      try:
+        result = op()
+      except (IOError, OSError) as e:
+        if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+          _resolve(p, exception=e)
+          return
+        result = _AGAIN
+      except Exception as e:
+        _resolve(p, exception=e)
+        return
+
+      if result is _AGAIN:
+        reactor.watch(fd, event, attempt)
+      else:
+        _resolve(p, value=result)
+
+    remaining = context.remaining()
+    if remaining is not None and (timeout is None or remaining < timeout):
+      timeout = remaining
+    if timeout is not None:
+      e = TimeoutError("Descriptor was not ready in {} seconds".format(timeout))
+      def expire():
+        reactor.unwatch(fd, event, attempt)
+        _resolve(p, exception=e)
+      task = cls._timer().schedule(timeout, _off_timer(expire))
+      p._future.add_done_callback(lambda f: task.cancel())
+
+    if wait:
+      reactor.watch(fd, event, attempt)
+    else:
+      attempt()
+    return p.future()
 
   @classmethod
   def executor(cls, executor=None):
@@ -887,6 +1722,11 @@ class Promise(object):
     Set/Get the EXECUTOR Promise uses. If setting, the current executor is
     first shut down.
 
+    Unless one is set, a `concurrent.futures.ThreadPoolExecutor` with 10
+    workers is created the first time one is needed. In a process forked
+    after that, it's replaced with a new one; an `AdaptiveThreadPoolExecutor`
+    instead restarts its own workers (see `mirai.fork`).
+
     Parameters
     ----------
     executor : concurrent.futures.Executor or None
@@ -898,7 +1738,12 @@ class Promise(object):
     executor : Executor
         Current executor
     """
+    fork.check()
     if executor is None:
+      if cls.EXECUTOR is None:
+        with _init_lock:
+          if Promise.EXECUTOR is None:
+            Promise.EXECUTOR = futures.ThreadPoolExecutor(max_workers=10)
       return cls.EXECUTOR
     else:
       if cls.EXECUTOR is not None:
@@ -906,6 +1751,189 @@ class Promise(object):
       cls.EXECUTOR = executor
       return cls.EXECUTOR
 
+  @classmethod
+  def _timer(cls):
+    """Return the Timer for this process, creating it if necessary."""
+    fork.check()
+    if Promise.TIMER is None:
+      with _init_lock:
+        if Promise.TIMER is None:
+          Promise.TIMER = Timer()
+    return Promise.TIMER
+
+  @classmethod
+  def _reactor(cls):
+    """Return the Reactor for this process, creating it if necessary."""
+    fork.check()
+    if Promise.REACTOR is None:
+      from .reactor import Reactor
+      with _init_lock:
+        if Promise.REACTOR is None:
+          Promise.REACTOR = Reactor()
+    return Promise.REACTOR
+
+
+class LazyPromise(Promise):
+  """
+  A Promise that doesn't start computing its value until it's observed: when
+  `get` is called, a callback is registered, or it's passed to a combinator
+  such as `Promise.collect`. Transformations such as `map` and `flatmap`
+  return LazyPromises too, so a chain of them stays unevaluated until its end
+  is observed. See `Promise.lazy`.
+
+  Checking on it with `isdefined`, `issuccess` or `isfailure` doesn't count
+  as observing it, so a LazyPromise nothing else has observed stays
+  undefined; call `force` to start it.
+
+  Parameters
+  ----------
+  thunk : (promise,) -> None
+      Called once, with this Promise, when it's first observed. Must
+      (eventually) resolve it. Runs under the context (priority, deadline)
+      active when this Promise was created, not the observer's.
+  """
+
+  __slots__ = ['_thunk']
+
+  def __init__(self, thunk=None):
+    super(LazyPromise, self).__init__()
+    self._thunk = None if thunk is None else context.wrap(thunk, context.current())
+
+  def force(self):
+    """
+    Start computing this Promise's value, if that hasn't started already.
+
+    Returns
+    -------
+    self : Promise
+    """
+    # `_thunk` only ever goes from a function to None. Check it without the
+    # lock first: callbacks fired by `setvalue` (which holds the lock) call
+    # `get` on this Promise.
+    if self._thunk is None:
+      return self
+    with self._lock:
+      thunk, self._thunk = self._thunk, None
+    if thunk is not None:
+      thunk(self)
+    return self
+
+  def get(self, timeout=None):
+    return super(LazyPromise, self.force()).get(timeout)
+
+  get.__doc__ = Promise.get.__doc__
+
+  def respond(self, fn):
+    return super(LazyPromise, self.force()).respond(fn)
+
+  respond.__doc__ = Promise.respond.__doc__
+
+  def transform(self, fn):
+    return LazyPromise(lambda p: p.update(Promise.transform(self, fn)))
+
+  transform.__doc__ = Promise.transform.__doc__
+
+  def within(self, duration):
+    return LazyPromise(lambda p: p.update(Promise.within(self, duration)))
+
+  within.__doc__ = Promise.within.__doc__
+
+
+_init_lock = threading.Lock()
+
+def _after_fork():
+  global _init_lock, _EXPIRED
+  _init_lock = threading.Lock()
+  _EXPIRED   = None
+
+  # tasks queued or scheduled in the parent are left behind with its threads
+  executor = Promise.EXECUTOR
+  if isinstance(executor, futures.ThreadPoolExecutor):
+    Promise.EXECUTOR = futures.ThreadPoolExecutor(max_workers=executor._max_workers)
+  Promise.TIMER      = None
+  Promise.PARTITIONS = PartitionedExecutor(lambda: Promise.executor())
+
+  # so is the reactor's thread, but its wake pipe was copied into this process
+  if Promise.REACTOR is not None:
+    Promise.REACTOR._abandon()
+    Promise.REACTOR = None
+
+fork.register(_after_fork)
+
+
+# returned by I/O operations that should be retried once their descriptor is
+# ready again
+_AGAIN = object()
+
+def _dontwait():
+  # imported on first use, like the other modules only needed for I/O, to
+  # keep them out of `import mirai`
+  import socket
+  return getattr(socket, 'MSG_DONTWAIT', 0)
+
+def _nonblocking(fd):
+  import fcntl
+  fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+
+
+def _resolve(p, value=None, exception=None):
+  """Resolve `p` unless something else already has."""
+  try:
+    if exception is not None:
+      p.setexception(exception)
+    else:
+      p.setvalue(value)
+  except AlreadyResolvedError:
+    pass
+
+
+def _off_timer(fn):
+  """
+  Wrap `fn`, to be scheduled on the timer, so that it runs on an executor
+  instead. `fn` resolves a Promise, and the callbacks that runs mustn't hold
+  up the timer thread, which every timeout in the process shares. The executor
+  isn't `Promise.EXECUTOR`, so that timeouts still fire while all of its
+  workers are busy -- possibly waiting on those very timeouts.
+  """
+  def safe():
+    try:
+      fn()
+    except Exception:
+      traceback.print_exc()
+
+  def submit():
+    global _EXPIRED
+    if _EXPIRED is None:
+      with _init_lock:
+        if _EXPIRED is None:
+          # not an AdaptiveThreadPoolExecutor: its idle workers wait with a
+          # timeout, which Python 2 implements by polling every 50 ms
+          _EXPIRED = futures.ThreadPoolExecutor(max_workers=16)
+    try:
+      _EXPIRED.submit(safe)
+    except Exception: # e.g. shut down at exit
+      safe()
+  return submit
+
+_EXPIRED = None # created on first use; see _off_timer
+
+
+def _prepare(fn, ctx):
+  """Wrap `fn` to be run on behalf of `Promise.call` under `ctx`."""
+  fn = SafeFunction(fn)
+  if ctx.deadline is not None:
+    fn = _unless_expired(fn, ctx.deadline)
+  return context.wrap(fn, ctx)
+
+
+def _unless_expired(fn, deadline):
+  """Wrap `fn` so that it's skipped if `deadline` has passed before it's called."""
+  def wrapped(*args, **kwargs):
+    if time.time() >= deadline:
+      raise TimeoutError("Deadline passed before call started")
+    return fn(*args, **kwargs)
+  return wrapped
+
 
 class Future(Promise):
   """Read-only version of a Promise."""
@@ -919,6 +1947,16 @@ class Future(Promise):
     ]
     proxyto(self, promise, allowed_specials)
 
+    # Future inherits Promise's methods, so proxyto skips them. Methods a
+    # subclass of Promise overrides need to be bound to `promise` instead.
+    for cls in type(promise).__mro__:
+      if cls is Promise:
+        break
+      for (k, v) in cls.__dict__.items():
+        is_special = k.startswith("__") and k.endswith("__")
+        if isinstance(v, types.FunctionType) and not is_special and k not in ['setvalue', 'setexception']:
+          setattr(self, k, getattr(promise, k))
+
   def setvalue(self, val):
     raise AttributeError("Futures are read only; Promises are writable")
 
@@ -0,0 +1,279 @@
+from concurrent import futures
+import collections
+import threading
+import time
+
+from .exceptions import SafeFunction
+from .executors import AdaptiveThreadPoolExecutor, _Throughput
+from .futures import Promise
+
+
+class _Stage(object):
+  """One step of a `Pipeline`, with its own executor and bounded intake."""
+
+  def __init__(self, name, fn, workers, max_queue, executor):
+    self.name      = name
+    self.workers   = workers
+    self.max_queue = max_queue
+    self.kind      = executor
+
+    if executor == 'thread':
+      self.fn       = SafeFunction(fn)
+      self.executor = AdaptiveThreadPoolExecutor(max_workers=workers)
+    else:
+      # exceptions from other processes already carry their own traceback,
+      # and SafeFunction's exception classes can't be pickled
+      self.fn       = fn
+      self.executor = futures.ProcessPoolExecutor(max_workers=workers)
+
+    # records in this stage are limited to `workers + max_queue` slots. A
+    # record keeps its slot until it enters the next stage, so a full stage
+    # holds back the stages feeding it. Records that find a stage full wait in
+    # `_waiting` rather than tying up the thread handing them over, which may
+    # be an executor's worker or the thread running its done callbacks.
+    self._free       = None if max_queue is None else workers + max_queue
+    self._waiting    = collections.deque()   # (record, entered, hold, Promise, time)
+    self._lock       = threading.Lock()
+    self._room       = threading.Condition(self._lock)
+    self._pending    = 0
+    self._submitted  = 0
+    self._completed  = 0
+    self._failed     = 0
+    self._blocked    = 0.0
+    self._latency    = 0.0
+    self._throughput = _Throughput()
+
+  def submit(self, record, wait=False, entered=None, hold=False):
+    """
+    Apply this stage to `record` once it has a slot. If the stage is full,
+    wait for one if `wait`, or else queue the record. `entered` is called
+    when the record gets its slot. If `hold`, a record that succeeds keeps
+    its slot until `release` is called.
+    """
+    with self._lock:
+      if self._free is not None:
+        if self._free == 0 and not wait:
+          p = Promise()
+          self._waiting.append((record, entered, hold, p, time.time()))
+          return p.future()
+        start = time.time()
+        while self._free == 0:
+          self._room.wait()
+        self._free    -= 1
+        self._blocked += time.time() - start
+
+    (result, started) = self._start(record, entered, hold)
+    if not started:
+      self.release()
+    return result.future()
+
+  def release(self):
+    """Give up a slot, to the record that's waited longest for one if any."""
+    while True:
+      with self._lock:
+        if self._free is None:
+          return
+        if not self._waiting:
+          self._free += 1
+          self._room.notify()
+          return
+        (record, entered, hold, p, queued) = self._waiting.popleft()
+        self._blocked += time.time() - queued
+
+      (result, started) = self._start(record, entered, hold)
+      result.proxyto(p)
+      if started:
+        return
+
+  def _start(self, record, entered, hold):
+    """
+    Hand a record holding a slot to the executor. Returns a Promise and
+    whether the executor took it; if not, the slot is still held.
+    """
+    if entered is not None:
+      entered()
+    with self._lock:
+      self._pending   += 1
+      self._submitted += 1
+
+    started = time.time()
+    try:
+      future = self.executor.submit(self.fn, record)
+    except Exception as e:
+      self._finish(started, failed=True)
+      return (Promise.exception(e), False)
+
+    def done(f):
+      failed = f.cancelled() or f.exception() is not None
+      self._finish(started, failed)
+      if failed or not hold:
+        self.release()
+    future.add_done_callback(done)
+    return (Promise(future), True)
+
+  def _finish(self, started, failed):
+    now = time.time()
+    with self._lock:
+      self._pending   -= 1
+      self._completed += 1
+      self._failed    += failed
+      self._latency    = 0.9 * self._latency + 0.1 * (now - started)
+      self._throughput.record(now)
+
+  def stats(self):
+    with self._lock:
+      return {
+        'name'       : self.name,
+        'executor'   : self.kind,
+        'workers'    : self.workers,
+        'max_queue'  : self.max_queue,
+        'pending'    : self._pending,
+        'waiting'    : len(self._waiting),
+        'queued'     : max(0, self._pending - self.workers),
+        'occupancy'  : None if self.max_queue is None else self._pending / float(self.workers + self.max_queue),
+        'submitted'  : self._submitted,
+        'completed'  : self._completed,
+        'failed'     : self._failed,
+        'throughput' : self._throughput.rate(time.time()),
+        'latency'    : self._latency,
+        'blocked'    : self._blocked,
+      }
+
+
+class Pipeline(object):
+  """
+  A chain of processing stages in the style of SEDA (staged event-driven
+  architecture). Each stage runs on its own executor with its own number of
+  workers, so a slow stage can't starve the others of threads, and each
+  stage accepts a bounded number of records, so a slow stage holds back the
+  stages (and ultimately the producer) feeding it rather than letting records
+  pile up in memory.::
+
+    ingest = (
+      Pipeline()
+      .stage('parse',  parse,  workers=2)
+      .stage('enrich', enrich, workers=32, max_queue=1000)
+      .stage('score',  score,  workers=4,  executor='process')
+      .stage('write',  write,  workers=8)
+    )
+    for line in lines:
+      ingest.submit(line).onfailure(log_error)
+    print ingest.bottleneck()
+
+  A record enters a stage once the previous stage is done with it. When the
+  first stage is full, `submit` waits for room. When a later stage is full,
+  records done with the previous stage wait in line for it, still counting
+  against the previous stage's limit, so a full stage holds back every stage
+  before it and, in the end, the producer.
+  """
+
+  EXECUTORS = ('thread', 'process')
+
+  def __init__(self):
+    self._stages = []
+
+  def stage(self, name, fn, workers=1, max_queue=None, executor='thread'):
+    """
+    Append a stage to the pipeline.
+
+    Parameters
+    ----------
+    name : str
+        Name of the stage, used in `stats`.
+    fn : (record,) -> record
+        Function applied to each record. Its return value is passed on to the
+        next stage. With `executor='process'`, it and the records must be
+        picklable.
+    workers : int, optional
+        Number of records this stage processes concurrently.
+    max_queue : int or None, optional
+        Number of records allowed to wait for a worker in this stage. None for
+        no limit.
+    executor : str, optional
+        `'thread'` to run `fn` on a thread pool, or `'process'` to run it on a
+        process pool (for CPU-bound stages).
+
+    Returns
+    -------
+    self : Pipeline
+    """
+    if workers <= 0:
+      raise ValueError("workers must be greater than 0")
+    if max_queue is not None and max_queue < 0:
+      raise ValueError("max_queue must not be negative")
+    if executor not in self.EXECUTORS:
+      raise ValueError("executor must be one of {}".format(", ".join(self.EXECUTORS)))
+    if any(s.name == name for s in self._stages):
+      raise ValueError("Stage {!r} already exists".format(name))
+
+    self._stages.append(_Stage(name, fn, workers, max_queue, executor))
+    return self
+
+  def submit(self, record):
+    """
+    Send a record through every stage, waiting if the first stage is full.
+
+    Returns
+    -------
+    result : Future
+        Future containing the output of the last stage, or the exception of
+        the first stage to fail. A record that fails in one stage isn't passed
+        on to the next.
+    """
+    stages = self._stages
+    if not stages:
+      return Promise.value(record)
+
+    def enter(stage, previous):
+      return lambda r: stage.submit(r, entered=previous.release, hold=stage is not stages[-1])
+
+    p = stages[0].submit(record, wait=True, hold=len(stages) > 1)
+    for (previous, stage) in zip(stages, stages[1:]):
+      p = p.flatmap(enter(stage, previous))
+    return p
+
+  def map(self, records):
+    """
+    Submit each record in turn.
+
+    Returns
+    -------
+    result : Future
+        Future containing the outputs for all records, in order. Fails with
+        the first exception of any record.
+    """
+    return Promise.collect([self.submit(r) for r in records])
+
+  def stats(self):
+    """
+    Report the load on each stage.
+
+    Returns
+    -------
+    stats : [dict]
+        One dict per stage, in order, with keys `name`, `executor`, `workers`,
+        `max_queue`, `pending` (records queued or running), `waiting`
+        (records done with the previous stage, waiting for room), `queued`
+        (records waiting for a worker), `occupancy` (`pending` as a fraction
+        of `workers + max_queue`, or None if unbounded), `submitted`,
+        `completed` and `failed` (record counts), `throughput` (records
+        completed per second over the last 10 seconds), `latency` (moving
+        average of seconds from entering the stage to leaving it) and
+        `blocked` (total seconds spent waiting for room in this stage).
+    """
+    return [stage.stats() for stage in self._stages]
+
+  def bottleneck(self):
+    """
+    Return the name of the stage with the most records waiting for a worker,
+    or None if nothing is waiting.
+    """
+    stats = [s for s in self.stats() if s['queued'] > 0]
+    if not stats:
+      return None
+    return max(stats, key=lambda s: s['queued'])['name']
+
+  def shutdown(self, wait=True):
+    """Shut down every stage's executor."""
+    for stage in self._stages:
+      stage.executor.shutdown(wait=wait)
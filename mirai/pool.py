@@ -0,0 +1,371 @@
+import collections
+import threading
+import time
+import traceback
+
+from concurrent.futures import TimeoutError
+
+from . import context
+from .exceptions import AlreadyResolvedError, RejectedError
+from .futures import Promise, _off_timer, _resolve
+
+
+class ResourcePool(object):
+  """
+  A pool of reusable resources -- connections, sessions, handles -- handed
+  out as Futures. A caller waiting for a resource holds no thread: it's
+  queued and its Future is resolved when one is released or created.::
+
+    pool = ResourcePool(lambda: connect(host), max_size=8,
+                        check=lambda conn: conn.ping(), close=lambda conn: conn.close())
+    pool.warm(2)
+    rows = pool.use(lambda conn: Promise.call(conn.query, sql))
+
+  Resources are created with `factory` on `Promise.EXECUTOR`, up to
+  `max_size` at a time, when a caller is waiting and none are idle. The most
+  recently released resource is handed out first, so resources beyond what
+  the load needs sit idle until `idle_timeout` evicts them.
+
+  Parameters
+  ----------
+  factory : (,) -> resource
+      Function creating a new resource. May block.
+  max_size : int, optional
+      Maximum number of resources, idle or in use.
+  idle_timeout : number or None, optional
+      Seconds a resource may stay idle before it's closed. None to keep idle
+      resources forever.
+  min_size : int, optional
+      Number of resources idle eviction leaves open.
+  check : (resource,) -> bool or None, optional
+      Health check run on `Promise.EXECUTOR` before handing out an idle
+      resource. A resource failing it (returning falsily or raising) is
+      closed and another one used instead.
+  close : (resource,) -> None or None, optional
+      Function called to dispose of a resource that's evicted, discarded or
+      fails its health check.
+  """
+
+  def __init__(self, factory, max_size=10, idle_timeout=60.0, min_size=0, check=None, close=None):
+    if max_size <= 0:
+      raise ValueError("max_size must be greater than 0")
+    if not 0 <= min_size <= max_size:
+      raise ValueError("min_size must be between 0 and max_size")
+    if idle_timeout is not None and idle_timeout < 0:
+      raise ValueError("idle_timeout must not be negative")
+
+    self.factory      = factory
+    self.max_size     = max_size
+    self.min_size     = min_size
+    self.idle_timeout = idle_timeout
+    self.check        = check
+    self.close        = close
+
+    self._lock     = threading.Lock()
+    self._idle     = collections.deque()   # (resource, released at); newest on the right
+    self._waiters  = collections.deque()   # (promise, enqueued at)
+    self._size     = 0                     # resources open or being created
+    self._in_use   = 0
+    self._stopped  = False
+    self._sweep    = None                  # TimerTask evicting idle resources
+
+    self._acquired   = 0
+    self._created    = 0
+    self._evicted    = 0
+    self._discarded  = 0
+    self._timeouts   = 0
+    self._wait_total = 0.0
+    self._wait_max   = 0.0
+
+  def acquire(self, timeout=None):
+    """
+    Take a resource from the pool. It must be given back with `release`; see
+    `use` to do so automatically.
+
+    Parameters
+    ----------
+    timeout : number or None, optional
+        Seconds to wait for a resource. If a deadline set with
+        `Promise.deadline` expires sooner, that deadline is used instead.
+
+    Returns
+    -------
+    result : Future
+        Future containing a resource. Fails with `TimeoutError` if none is
+        available in time, with `RejectedError` if the pool has been shut
+        down, or with `factory`'s exception if creating one fails.
+    """
+    p = Promise()
+    with self._lock:
+      if self._stopped:
+        return Promise.exception(RejectedError("ResourcePool has been shut down"))
+      self._waiters.append((p, time.time()))
+
+    remaining = context.remaining()
+    if remaining is not None and (timeout is None or remaining < timeout):
+      timeout = remaining
+    if timeout is not None:
+      task = Promise._timer().schedule(timeout, _off_timer(lambda: self._expire(p, timeout)))
+      p._future.add_done_callback(lambda f: task.cancel())
+
+    self._dispatch()
+    return p.future()
+
+  def release(self, resource, discard=False):
+    """
+    Give a resource taken with `acquire` back to the pool.
+
+    Parameters
+    ----------
+    resource : object
+        Resource to give back.
+    discard : bool, optional
+        If True, close the resource instead of reusing it, e.g. because it
+        was left in a bad state.
+    """
+    with self._lock:
+      self._in_use -= 1
+    if discard:
+      self._discard(resource)
+    else:
+      self._put(resource)
+
+  def use(self, fn, timeout=None):
+    """
+    Apply `fn` to a resource from the pool, and release the resource once the
+    Future it returns resolves, whether or not it succeeds.
+
+    Parameters
+    ----------
+    fn : (resource,) -> Future
+        Function to apply. Must return a Future.
+    timeout : number or None, optional
+        Seconds to wait for a resource; see `acquire`.
+
+    Returns
+    -------
+    result : Future
+        Future containing return result of `fn`.
+    """
+    def run(resource):
+      return (
+        Promise.value(resource)
+        .flatmap(fn)
+        .ensure(lambda: self.release(resource))
+      )
+    return self.acquire(timeout).flatmap(run)
+
+  def warm(self, n=None):
+    """
+    Create resources ahead of demand, so the first callers don't wait for
+    `factory`.
+
+    Parameters
+    ----------
+    n : int or None, optional
+        Number of resources the pool should have open, at most `max_size`.
+        Defaults to `min_size`.
+
+    Returns
+    -------
+    result : Future
+        Future containing None once the new resources are idle in the pool,
+        or the first exception raised by `factory`.
+    """
+    n = self.min_size if n is None else min(n, self.max_size)
+    with self._lock:
+      if self._stopped:
+        return Promise.exception(RejectedError("ResourcePool has been shut down"))
+      count = max(0, n - self._size)
+      self._size += count
+
+    def create():
+      created = Promise.call(self.factory)
+      created.onsuccess(self._created_idle).onfailure(lambda e: self._abandon())
+      return created
+    return Promise.join([create() for i in range(count)])
+
+  def stats(self):
+    """
+    Report the pool's size and how long callers have waited for resources.
+
+    Returns
+    -------
+    stats : dict
+        Keys `max_size`, `size` (resources open or being created), `idle`,
+        `in_use`, `waiting` (callers queued for a resource), `utilization`
+        (`in_use` as a fraction of `max_size`), `acquired`, `created`,
+        `evicted` (closed for being idle), `discarded` (closed by `release`
+        or for failing a health check) and `timeouts` (counts), and
+        `wait_mean` and `wait_max` (seconds callers waited for a resource).
+    """
+    with self._lock:
+      return {
+        'max_size'    : self.max_size,
+        'size'        : self._size,
+        'idle'        : len(self._idle),
+        'in_use'      : self._in_use,
+        'waiting'     : len(self._waiters),
+        'utilization' : self._in_use / float(self.max_size),
+        'acquired'    : self._acquired,
+        'created'     : self._created,
+        'evicted'     : self._evicted,
+        'discarded'   : self._discarded,
+        'timeouts'    : self._timeouts,
+        'wait_mean'   : self._wait_total / self._acquired if self._acquired else 0.0,
+        'wait_max'    : self._wait_max,
+      }
+
+  def shutdown(self):
+    """
+    Close idle resources and fail waiting callers with `RejectedError`.
+    Resources in use are closed when they're released.
+    """
+    with self._lock:
+      self._stopped = True
+      idle    = [r for (r, released) in self._idle]
+      waiters = [p for (p, enqueued) in self._waiters]
+      self._idle.clear()
+      self._waiters.clear()
+      self._size -= len(idle)
+      if self._sweep is not None:
+        self._sweep.cancel()
+        self._sweep = None
+
+    e = RejectedError("ResourcePool has been shut down")
+    for p in waiters:
+      _resolve(p, exception=e)
+    for resource in idle:
+      self._close(resource)
+
+  def _dispatch(self):
+    """Pair waiting callers with idle resources, or create new ones for them."""
+    handouts = []
+    creates  = []
+    with self._lock:
+      while self._waiters and (self._idle or self._size < self.max_size):
+        waiter = self._waiters.popleft()
+        if waiter[0].isdefined(): # timed out
+          continue
+        if self._idle:
+          handouts.append((waiter, self._idle.pop()[0]))
+        else:
+          self._size += 1
+          creates.append(waiter)
+
+    for (waiter, resource) in handouts:
+      if self.check is None:
+        self._give(waiter, resource)
+      else:
+        self._checked(waiter, resource)
+    for waiter in creates:
+      self._create(waiter)
+
+  def _checked(self, waiter, resource):
+    def respond(f):
+      if f.issuccess() and f.get():
+        self._give(waiter, resource)
+      else:
+        with self._lock:
+          self._waiters.appendleft(waiter)
+        self._discard(resource)
+    Promise.call(self.check, resource).respond(respond)
+
+  def _create(self, waiter):
+    def onfailure(e):
+      self._abandon()
+      _resolve(waiter[0], exception=e)
+
+    def onsuccess(resource):
+      with self._lock:
+        self._created += 1
+      self._give(waiter, resource)
+
+    Promise.call(self.factory).onsuccess(onsuccess).onfailure(onfailure)
+
+  def _give(self, waiter, resource):
+    (p, enqueued) = waiter
+    now = time.time()
+    with self._lock:
+      self._in_use += 1
+    try:
+      p.setvalue(resource)
+    except AlreadyResolvedError: # timed out or shut down
+      with self._lock:
+        self._in_use -= 1
+      self._put(resource)
+      return
+
+    with self._lock:
+      self._acquired   += 1
+      self._wait_total += now - enqueued
+      self._wait_max    = max(self._wait_max, now - enqueued)
+
+  def _put(self, resource):
+    with self._lock:
+      stopped = self._stopped
+      if not stopped:
+        self._idle.append((resource, time.time()))
+        if self._sweep is None and self.idle_timeout is not None:
+          self._sweep = Promise._timer().schedule(self.idle_timeout, self._evict)
+    if stopped:
+      with self._lock:
+        self._size -= 1
+      self._close(resource)
+    else:
+      self._dispatch()
+
+  def _created_idle(self, resource):
+    with self._lock:
+      self._created += 1
+    self._put(resource)
+
+  def _discard(self, resource):
+    with self._lock:
+      self._size      -= 1
+      self._discarded += 1
+    self._close(resource)
+    self._dispatch()
+
+  def _abandon(self):
+    """Give up on a resource that failed to be created."""
+    with self._lock:
+      self._size -= 1
+    self._dispatch()
+
+  def _expire(self, p, timeout):
+    try:
+      p.setexception(TimeoutError("No resource was available in {} seconds".format(timeout)))
+    except AlreadyResolvedError:
+      return
+    with self._lock:
+      self._timeouts += 1
+      try:
+        self._waiters.remove(next(w for w in self._waiters if w[0] is p))
+      except StopIteration:
+        pass # already handed a resource, which `_give` puts back
+
+  def _evict(self):
+    now     = time.time()
+    evicted = []
+    with self._lock:
+      self._sweep = None
+      while (self._idle and self._size > self.min_size
+             and now - self._idle[0][1] >= self.idle_timeout):
+        evicted.append(self._idle.popleft()[0])
+        self._size    -= 1
+        self._evicted += 1
+      if self._idle and self._size > self.min_size and not self._stopped:
+        delay = max(0.0, self._idle[0][1] + self.idle_timeout - now)
+        self._sweep = Promise._timer().schedule(delay, self._evict)
+
+    for resource in evicted:
+      self._close(resource)
+
+  def _close(self, resource):
+    if self.close is None:
+      return
+    try:
+      self.close(resource)
+    except Exception:
+      traceback.print_exc()
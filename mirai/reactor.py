@@ -0,0 +1,274 @@
+import atexit
+import errno
+import fcntl
+import os
+import select
+import threading
+import traceback
+import weakref
+
+from . import fork
+
+
+READ  = getattr(select, 'POLLIN',  1)
+WRITE = getattr(select, 'POLLOUT', 4)
+
+# conditions reported whether or not they were asked for. Operations waiting
+# on a descriptor in one of these states are woken so that they can fail.
+_ERRORS = getattr(select, 'POLLERR', 8) | getattr(select, 'POLLHUP', 16) | getattr(select, 'POLLNVAL', 32)
+
+
+# stop reactor threads before the interpreter tears down the modules they use
+_reactors = weakref.WeakSet()
+
+def _python_exit():
+  for reactor in list(_reactors):
+    reactor.shutdown()
+
+atexit.register(_python_exit)
+
+def _after_fork():
+  # a forked child has none of its parent's reactor threads, and may have
+  # inherited their locks held; leave those reactors be, except for closing
+  # the child's copies of their wake pipes.
+  for reactor in list(_reactors):
+    reactor._abandon()
+  _reactors.clear()
+
+fork.register(_after_fork)
+
+
+class _Poll(object):
+  """`select.epoll` or `select.poll` behind one interface."""
+
+  def __init__(self):
+    if hasattr(select, 'epoll'):
+      self._poller  = select.epoll()
+      self._timeout = -1
+    else:
+      self._poller  = select.poll()
+      self._timeout = None
+
+  def register(self, fd, mask):
+    self._poller.register(fd, mask)
+
+  def modify(self, fd, mask):
+    self._poller.modify(fd, mask)
+
+  def unregister(self, fd):
+    self._poller.unregister(fd)
+
+  def poll(self):
+    return self._poller.poll(self._timeout)
+
+  def close(self):
+    if hasattr(self._poller, 'close'):
+      self._poller.close()
+
+
+class Reactor(object):
+  """
+  Waits for file descriptors to become readable or writable on a single
+  background thread, started when the first one is watched, and calls a
+  function for each one that does. Watching a descriptor costs no thread, so
+  any number of operations can wait at once. Callbacks run on the reactor's
+  thread and should be short -- e.g. resolving a Promise -- as they delay
+  every other descriptor.
+
+  Uses `select.epoll` where available and `select.poll` elsewhere, so it
+  needs a Unix.
+  """
+
+  def __init__(self):
+    self._lock     = threading.Lock()
+    self._watchers = {}      # fd -> ([readers], [writers])
+    self._dirty    = set()   # fds whose registration must be updated
+    self._thread   = None
+    self._stopped  = False
+    self._woken    = False
+
+    # writing to this pipe interrupts the reactor's wait, so it can pick up
+    # newly watched descriptors.
+    (self._wake_r, self._wake_w) = os.pipe()
+    for fd in (self._wake_r, self._wake_w):
+      fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+    _reactors.add(self)
+
+  def watch(self, fd, event, fn):
+    """
+    Call `fn()` once, the next time `fd` is ready for `event`.
+
+    Parameters
+    ----------
+    fd : int
+        File descriptor to watch.
+    event : READ or WRITE
+    fn : (,) -> None
+        Function to call. Return value ignored.
+    """
+    with self._lock:
+      if self._stopped:
+        raise RuntimeError('cannot watch file descriptors after shutdown')
+      watchers = self._watchers.get(fd)
+      if watchers is None:
+        watchers = self._watchers[fd] = ([], [])
+      watchers[event == WRITE].append(fn)
+      self._dirty.add(fd)
+
+      if self._thread is None:
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+      self._wake()
+
+  def unwatch(self, fd, event, fn):
+    """
+    Stop waiting to call `fn`, if it hasn't been called yet.
+
+    Returns
+    -------
+    removed : bool
+        True if `fn` was still waiting.
+    """
+    with self._lock:
+      watchers = self._watchers.get(fd)
+      if watchers is None or fn not in watchers[event == WRITE]:
+        return False
+      watchers[event == WRITE].remove(fn)
+      self._dirty.add(fd)
+      self._wake()
+      return True
+
+  def pending(self):
+    """Return the number of callbacks waiting for their descriptor."""
+    with self._lock:
+      return sum(len(r) + len(w) for (r, w) in self._watchers.values())
+
+  def shutdown(self):
+    """
+    Stop the reactor's thread and release its descriptors. Callbacks still
+    waiting are never called.
+    """
+    with self._lock:
+      stopped, self._stopped = self._stopped, True
+      self._watchers.clear()
+      thread = self._thread
+      if not stopped:
+        if thread is None:
+          self._close()
+        else:
+          self._wake()   # the thread closes the pipe on its way out
+    if thread is not None and thread is not threading.current_thread():
+      thread.join()
+
+  def _wake(self):
+    # called with `self._lock` held
+    if not self._woken:
+      self._woken = True
+      os.write(self._wake_w, b'x')
+
+  def _update(self, poller, masks):
+    """Bring `poller` up to date with the watchers. Called with the lock held."""
+    failed = []
+    for fd in self._dirty:
+      watchers = self._watchers.get(fd)
+      mask     = 0
+      if watchers is not None:
+        mask = (READ if watchers[0] else 0) | (WRITE if watchers[1] else 0)
+        if mask == 0:
+          del self._watchers[fd]
+
+      try:
+        if mask == 0:
+          if masks.pop(fd, None) is not None:
+            poller.unregister(fd)
+        elif fd not in masks:
+          poller.register(fd, mask)
+          masks[fd] = mask
+        elif masks[fd] != mask:
+          poller.modify(fd, mask)
+          masks[fd] = mask
+      except (IOError, OSError, ValueError, KeyError):
+        # e.g. the descriptor was closed. Wake its watchers so that their
+        # operations fail instead of waiting forever.
+        masks.pop(fd, None)
+        watchers = self._watchers.pop(fd, None)
+        if watchers is not None:
+          failed.extend(watchers[0])
+          failed.extend(watchers[1])
+    self._dirty.clear()
+    return failed
+
+  def _run(self):
+    poller = _Poll()
+    poller.register(self._wake_r, READ)
+    masks  = {}
+    try:
+      while True:
+        with self._lock:
+          if self._stopped:
+            return
+          ready = self._update(poller, masks)
+        self._call(ready)
+
+        try:
+          events = poller.poll()
+        except (IOError, OSError, select.error) as e:
+          if e.args[0] == errno.EINTR:
+            continue
+          raise
+
+        ready = []
+        with self._lock:
+          for (fd, mask) in events:
+            if fd == self._wake_r:
+              self._drain()
+              continue
+            watchers = self._watchers.get(fd)
+            if watchers is None:
+              continue
+            if mask & (READ | _ERRORS):
+              ready.extend(watchers[0])
+              del watchers[0][:]
+            if mask & (WRITE | _ERRORS):
+              ready.extend(watchers[1])
+              del watchers[1][:]
+            self._dirty.add(fd)
+        self._call(ready)
+    finally:
+      poller.close()
+      with self._lock:
+        if self._stopped:
+          self._close()
+
+  def _abandon(self):
+    # for a reactor inherited by a forked child, where its thread is gone and
+    # its lock may be held: stop it and close the child's copy of its pipe
+    self._stopped = True
+    self._close()
+
+  def _close(self):
+    for fd in (self._wake_r, self._wake_w):
+      if fd is not None:
+        try:
+          os.close(fd)
+        except OSError:
+          pass
+    self._wake_r = self._wake_w = None
+
+  def _drain(self):
+    # called with `self._lock` held
+    try:
+      while os.read(self._wake_r, 4096):
+        pass
+    except (IOError, OSError) as e:
+      if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+        raise
+    self._woken = False
+
+  def _call(self, fns):
+    for fn in fns:
+      try:
+        fn()
+      except Exception:
+        traceback.print_exc()
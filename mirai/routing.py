@@ -0,0 +1,333 @@
+"""
+Send each function given to `Promise.call` to whichever kind of pool suits it.
+Threads are cheap but share the GIL, so CPU-heavy Python code runs one call at
+a time no matter how many workers there are; processes run in parallel but
+pay to pickle arguments and results. While a `Router` is enabled, it measures
+the CPU time each function uses against the wall time it takes and, once it
+has seen a function a few times, runs those that keep a CPU busy on a process
+pool and everything else on `Promise.EXECUTOR` as usual.::
+
+  from mirai import routing
+
+  router = routing.enable()
+  router.override(parse_html, 'process')   # known to be CPU-bound
+  ...
+  router.print_stats()
+
+Calls sent to a process don't run under the caller's `mirai.context` (such as
+its deadline). Exceptions they raise come back wrapped with the worker's
+traceback, as they would from a thread. Measuring a call running on a thread
+needs per-thread CPU time, which is only available on Linux; elsewhere,
+functions go to processes only when overridden.
+"""
+from concurrent import futures
+import cPickle as pickle
+import multiprocessing
+import sys
+import threading
+import time
+
+from . import fork
+from .debug import _RUSAGE_THREAD, _cpu, _qualname
+from .exceptions import ShadowException, _format_exc
+from .futures import Promise
+
+
+def _timed(payload):
+  """
+  Run a call pickled by `Router._pickle` in a worker process, reporting how
+  long it took. An exception is returned along with its traceback formatted
+  as `SafeFunction` would, as tracebacks can't be pickled.
+  """
+  (fn, args, kwargs) = pickle.loads(payload)
+  wall = time.time()
+  cpu  = time.clock()
+  try:
+    (result, error) = (fn(*args, **kwargs), None)
+  except Exception as e:
+    e_type, e_value, e_tb = sys.exc_info()
+    (result, error) = (e, _format_exc(e_type, e_value, e_tb))
+    del e_tb
+  return (result, error, time.time() - wall, time.clock() - cpu)
+
+
+def _key(fn):
+  """
+  What measurements of `fn` are filed under. Functions are identified by
+  their code, so that the router holds no reference to them (or their
+  closures), and the lambdas and bound methods made anew for each call share
+  one entry. Other callables are identified by name.
+  """
+  code = getattr(getattr(fn, 'im_func', fn), '__code__', None)
+  return code if code is not None else _qualname(fn)
+
+
+class _Stats(object):
+
+  __slots__ = ['name', 'calls', 'threads', 'processes', 'wall', 'cpu', 'ratio', 'picklable']
+
+  def __init__(self, name):
+    self.name      = name
+    self.calls     = 0
+    self.threads   = 0
+    self.processes = 0
+    self.wall      = 0.0
+    self.cpu       = 0.0
+    self.ratio     = None   # moving average of cpu / wall
+    self.picklable = None
+
+
+class Router(object):
+  """
+  Routes calls between `Promise.EXECUTOR` and a process pool.
+
+  Parameters
+  ----------
+  processes : int or None, optional
+      Number of worker processes. Defaults to the number of CPUs.
+  threshold : number, optional
+      Functions whose CPU time is at least this fraction of their wall time
+      are run on processes.
+  warmup : int, optional
+      Number of calls measured on threads before a function may be moved to
+      a process.
+  """
+
+  ROUTES = ('thread', 'process')
+
+  def __init__(self, processes=None, threshold=0.5, warmup=3):
+    if not 0 < threshold <= 1:
+      raise ValueError("threshold must be between 0 and 1")
+    self.processes = processes or multiprocessing.cpu_count()
+    self.threshold = threshold
+    self.warmup    = warmup
+    self._lock     = threading.Lock()
+    self._stats    = {}   # _key(fn) -> _Stats
+    self._override = {}   # _key(fn) -> route
+    self._pool     = None
+
+  def override(self, fn, route):
+    """
+    Always run `fn` on `route` (`'thread'` or `'process'`), or pass None to go
+    back to choosing automatically.
+    """
+    if route is not None and route not in self.ROUTES:
+      raise ValueError("route must be one of {} or None".format(", ".join(self.ROUTES)))
+    with self._lock:
+      if route is None:
+        self._override.pop(_key(fn), None)
+      else:
+        self._override[_key(fn)] = route
+
+  def route(self, fn):
+    """
+    Return where the next call to `fn` would run, `'thread'` or `'process'`,
+    not counting arguments that can't be pickled.
+    """
+    return self._route(_key(fn))
+
+  def _route(self, key):
+    with self._lock:
+      route = self._override.get(key)
+      if route is not None:
+        return route
+      stats = self._stats.get(key)
+      if stats is None or stats.threads + stats.processes < self.warmup or stats.ratio is None:
+        return 'thread'
+      return 'process' if stats.ratio >= self.threshold else 'thread'
+
+  def submit(self, fn, prepared, args, kwargs):
+    """
+    Start `fn(*args, **kwargs)` on a thread or a process.
+
+    Parameters
+    ----------
+    fn : function
+        Function given to `Promise.call`.
+    prepared : function
+        `fn` wrapped as `Promise.call` would run it on a thread.
+    args : tuple
+    kwargs : dict
+
+    Returns
+    -------
+    future : concurrent.futures.Future
+    """
+    if self.route(fn) == 'process':
+      payload = self._pickle(fn, args, kwargs)
+      if payload is not None:
+        return self._submit_process(fn, payload)
+
+    def timed(*args, **kwargs):
+      wall = time.time()
+      cpu  = _cpu()
+      try:
+        return prepared(*args, **kwargs)
+      finally:
+        self._record(fn, 'thread', time.time() - wall, _cpu() - cpu)
+    return Promise.executor().submit(timed, *args, **kwargs)
+
+  def stats(self, sort='calls'):
+    """
+    Return measurements per function.
+
+    Parameters
+    ----------
+    sort : str
+        Field to sort by, largest first.
+
+    Returns
+    -------
+    stats : [dict]
+        One dict per function with keys `name`, `calls`, `threads` and
+        `processes` (calls run on each), `wall` and `cpu` (total seconds),
+        `cpu_ratio` (recent CPU time as a fraction of wall time, or None if
+        not measured), `route` (where the next call will run) and `override`
+        (the route set with `override`, or None).
+    """
+    with self._lock:
+      items     = self._stats.items()
+      overrides = dict(self._override)
+    result = [
+      {
+        'name'      : s.name,
+        'calls'     : s.calls,
+        'threads'   : s.threads,
+        'processes' : s.processes,
+        'wall'      : s.wall,
+        'cpu'       : s.cpu,
+        'cpu_ratio' : s.ratio,
+        'route'     : self._route(key),
+        'override'  : overrides.get(key),
+      }
+      for (key, s) in items
+    ]
+    result.sort(key=lambda s: s[sort], reverse=True)
+    return result
+
+  def print_stats(self, sort='calls', limit=20, stream=None):
+    """Print measurements for the `limit` most called functions as a table."""
+    stream = stream or sys.stdout
+    stream.write("{:>8} {:>8} {:>8} {:>10} {:>10}  {:<8} {}\n".format("calls", "threads", "procs", "cpu", "wall", "route", "function"))
+    for s in self.stats(sort)[:limit]:
+      stream.write("{calls:8d} {threads:8d} {processes:8d} {cpu:10.4f} {wall:10.4f}  {route:<8} {name}\n".format(**s))
+
+  def shutdown(self, wait=True):
+    """Shut down the process pool, if one was started."""
+    with self._lock:
+      pool, self._pool = self._pool, None
+    if pool is not None:
+      pool.shutdown(wait=wait)
+
+  def _after_fork(self):
+    # the parent's pool can't be used from here; start a new one when needed
+    self._lock = threading.Lock()
+    self._pool = None
+
+  def _submit_process(self, fn, payload):
+    with self._lock:
+      if self._pool is None:
+        self._pool = futures.ProcessPoolExecutor(max_workers=self.processes)
+      pool = self._pool
+
+    result = futures.Future()
+    result.set_running_or_notify_cancel()
+
+    def done(f):
+      try:
+        (value, error, wall, cpu) = f.result()
+      except BaseException as e:
+        result.set_exception(e)
+        return
+      self._record(fn, 'process', wall, cpu)
+      if error is not None:
+        result.set_exception(ShadowException.build(value, error))
+      else:
+        result.set_result(value)
+
+    pool.submit(_timed, payload).add_done_callback(done)
+    return result
+
+  def _pickle(self, fn, args, kwargs):
+    """
+    Pickle a call for a worker process, or return None if it can't be. A
+    process pool fails in a background thread, leaving the future pending
+    forever, if what's sent can't be pickled -- so it's pickled here, once,
+    and the pool only has to copy the resulting string.
+    """
+    with self._lock:
+      stats = self._stats.get(_key(fn))
+      if stats is None:
+        stats = self._stats[_key(fn)] = _Stats(_qualname(fn))
+    if stats.picklable is False:
+      return None
+    try:
+      payload = pickle.dumps((fn, args, kwargs), pickle.HIGHEST_PROTOCOL)
+    except Exception:
+      if stats.picklable is None:
+        try:
+          pickle.dumps(fn, pickle.HIGHEST_PROTOCOL)
+          stats.picklable = True
+        except Exception:
+          stats.picklable = False
+      return None
+    stats.picklable = True
+    return payload
+
+  def _record(self, fn, route, wall, cpu):
+    measured = route == 'process' or _RUSAGE_THREAD is not None
+    with self._lock:
+      stats = self._stats.get(_key(fn))
+      if stats is None:
+        stats = self._stats[_key(fn)] = _Stats(_qualname(fn))
+      stats.calls += 1
+      stats.wall  += wall
+      if route == 'thread':
+        stats.threads += 1
+      else:
+        stats.processes += 1
+      if measured:
+        stats.cpu += cpu
+        if wall > 0:
+          ratio       = min(1.0, cpu / wall)
+          stats.ratio = ratio if stats.ratio is None else 0.7 * stats.ratio + 0.3 * ratio
+
+
+def _after_fork():
+  if Promise.ROUTER is not None:
+    Promise.ROUTER._after_fork()
+
+fork.register(_after_fork)
+
+
+def enable(**kwargs):
+  """
+  Start routing calls made with `Promise.call`.
+
+  Parameters
+  ----------
+  **kwargs : keyword arguments
+      Passed on to `Router`.
+
+  Returns
+  -------
+  router : Router
+  """
+  Promise.ROUTER = Router(**kwargs)
+  return Promise.ROUTER
+
+
+def disable():
+  """
+  Stop routing calls; from now on, all of them run on `Promise.EXECUTOR`. The
+  router's process pool is shut down once its calls finish.
+
+  Returns
+  -------
+  router : Router or None
+      The router that was installed, with the measurements it collected.
+  """
+  router, Promise.ROUTER = Promise.ROUTER, None
+  if router is not None:
+    router.shutdown(wait=False)
+  return router
@@ -0,0 +1,117 @@
+import threading
+import time
+import unittest
+
+from mirai import *
+
+
+class BroadcastPromiseTests(unittest.TestCase):
+
+  def setUp(self):
+    self.executor = AdaptiveThreadPoolExecutor(max_workers=4)
+    Promise.executor(self.executor)
+
+  def tearDown(self):
+    Promise.executor().shutdown(wait=False)
+
+  def test_subscribers(self):
+    promise = BroadcastPromise()
+    results = Promise.collect([promise.map(lambda v, i=i: v + i) for i in range(1000)])
+    self.assertEqual(promise.subscribers(), 1000)
+
+    promise.setvalue(1)
+    self.assertEqual(results.get(0.5), range(1, 1001))
+    self.assertEqual(promise.subscribers(), 0)
+
+  def test_batches(self):
+    promise = BroadcastPromise(batch_size=10)
+    for i in range(95):
+      promise.onsuccess(lambda v: None)
+    promise.setvalue(1)
+    self.executor.shutdown(wait=True)
+
+    self.assertEqual(self.executor.stats()['submitted'], 10)
+
+  def test_runs_off_resolving_thread(self):
+    promise = BroadcastPromise()
+    thread  = promise.map(lambda v: threading.current_thread())
+    promise.setvalue(1)
+
+    self.assertIsNot(thread.get(0.5), threading.current_thread())
+
+  def test_late_subscribers_inline(self):
+    promise = BroadcastPromise().setvalue(1)
+    threads = []
+    promise.onsuccess(lambda v: threads.append(threading.current_thread()))
+
+    self.assertEqual(threads, [threading.current_thread()])
+    self.assertEqual(self.executor.stats()['submitted'], 0)
+
+  def test_exception(self):
+    promise = BroadcastPromise()
+    failed  = Promise()
+    promise.onfailure(failed.setvalue)
+
+    e = MiraiError()
+    promise.setexception(e)
+    self.assertIs(failed.get(0.5), e)
+    self.assertRaises(MiraiError, promise.get, 0.5)
+
+  def test_set_twice(self):
+    promise = BroadcastPromise().setvalue(1)
+    self.assertRaises(AlreadyResolvedError, promise.setvalue, 2)
+    self.assertRaises(AlreadyResolvedError, promise.setexception, MiraiError())
+
+  def test_proxyto(self):
+    promise = BroadcastPromise()
+    Promise.value(1).proxyto(promise)
+    self.assertEqual(promise.future().map(lambda v: v + 1).get(0.5), 2)
+
+  def test_future_subscribers(self):
+    promise = BroadcastPromise()
+    future  = promise.future()
+    result  = future.map(lambda v: v + 1)
+
+    self.assertEqual(promise.subscribers(), 1)
+    promise.setvalue(1)
+    self.assertEqual(result.get(0.5), 2)
+    self.assertRaises(AttributeError, future.setvalue, 1)
+
+  def test_executor_shut_down(self):
+    promise = BroadcastPromise(batch_size=10)
+    results = Promise.collect([promise.map(lambda v: v) for i in range(25)])
+    self.executor.shutdown()
+    promise.setvalue(1)
+    self.assertEqual(results.get(0.5), [1] * 25)
+
+  def test_executor_rejects(self):
+    event    = threading.Event()
+    executor = AdaptiveThreadPoolExecutor(max_workers=1, max_queue=1, overflow='reject')
+    executor.submit(event.wait, 1.0)
+    time.sleep(0.01)
+    executor.submit(lambda: None)
+    try:
+      promise = BroadcastPromise(executor=executor)
+      result  = promise.map(lambda v: v)
+      promise.setvalue(1)
+      self.assertEqual(result.get(0.5), 1)
+    finally:
+      event.set()
+      executor.shutdown(wait=False)
+
+  def test_failing_subscriber(self):
+    import sys, StringIO
+    promise = BroadcastPromise()
+    promise.onsuccess(lambda v: 1 / 0)
+    result  = promise.map(lambda v: v)
+
+    stderr, sys.stderr = sys.stderr, StringIO.StringIO()
+    try:
+      promise.setvalue(1)
+      self.assertEqual(result.get(0.5), 1)
+    finally:
+      sys.stderr = stderr
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,231 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from mirai import *
+from mirai import files
+
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
+
+calls = []
+
+def square(x, offset=0):
+  calls.append(x)
+  return x * x + offset
+
+def pad(x):
+  calls.append(x)
+  return "x" * 1000
+
+def fail(x):
+  calls.append(x)
+  raise ValueError(x)
+
+
+class DiskCacheTests(unittest.TestCase):
+
+  def setUp(self):
+    Promise.executor(ThreadPoolExecutor(max_workers=4))
+    files.executor(ThreadPoolExecutor(max_workers=4))
+    self.root = tempfile.mkdtemp()
+    del calls[:]
+
+  def tearDown(self):
+    Promise.executor().shutdown(wait=False)
+    files.executor().shutdown(wait=False)
+    shutil.rmtree(self.root)
+
+  def test_call(self):
+    cache = DiskCache(self.root)
+    self.assertEqual(cache.call(square, 3).get(1.0), 9)
+    self.assertEqual(cache.call(square, 3).get(1.0), 9)
+    self.assertEqual(cache.call(square, 3, offset=1).get(1.0), 10)
+    self.assertEqual(calls, [3, 3])
+
+    stats = cache.stats()
+    self.assertEqual((stats['hits'], stats['misses'], stats['stored']), (1, 2, 2))
+
+  def test_persistent(self):
+    DiskCache(self.root).call(square, 4).get(1.0)
+    self.assertEqual(DiskCache(self.root).call(square, 4).get(1.0), 16)
+    self.assertEqual(calls, [4])
+
+  def test_memoize(self):
+    memoized = DiskCache(self.root).memoize(square)
+    self.assertEqual(memoized.__name__, 'square')
+    self.assertEqual([memoized(2).get(1.0) for i in range(3)], [4, 4, 4])
+    self.assertEqual(calls, [2])
+
+  def test_failures_not_stored(self):
+    cache = DiskCache(self.root)
+    self.assertRaises(ValueError, cache.call(fail, 1).get, 1.0)
+    self.assertRaises(ValueError, cache.call(fail, 1).get, 1.0)
+    self.assertEqual(calls, [1, 1])
+
+  def test_concurrent_misses_share(self):
+    event = threading.Event()
+    def slow(x):
+      calls.append(x)
+      event.wait(1.0)
+      return x
+
+    cache   = DiskCache(self.root)
+    results = [cache.call(slow, 'a') for i in range(5)]
+    time.sleep(0.05)
+    event.set()
+    self.assertEqual(Promise.collect(results).get(1.0), ['a'] * 5)
+    self.assertEqual(calls, ['a'])
+    self.assertEqual(cache.stats()['shared'], 4)
+
+  def test_caller_thread_does_no_io(self):
+    files.executor(ThreadPoolExecutor(max_workers=1))
+    blocker = threading.Event()
+    files.executor().submit(blocker.wait, 1.0)
+    try:
+      start  = time.time()
+      result = DiskCache(self.root).call(square, 5)
+      self.assertLess(time.time() - start, 0.05)
+      self.assertFalse(result.isdefined())
+    finally:
+      blocker.set()
+    self.assertEqual(result.get(1.0), 25)
+
+  def test_closures(self):
+    def adder(n):
+      return lambda x: x + n
+
+    cache = DiskCache(self.root)
+    self.assertEqual(cache.call(adder(1), 1).get(1.0), 2)
+    self.assertEqual(cache.call(adder(2), 1).get(1.0), 3)
+    self.assertEqual(cache.call(adder(2), 1).get(1.0), 3)
+    self.assertEqual(cache.stats()['hits'], 1)
+
+  def test_defaults(self):
+    def adder(n):
+      return lambda x, n=n: x + n
+
+    cache = DiskCache(self.root)
+    self.assertEqual(cache.call(adder(1), 1).get(1.0), 2)
+    self.assertEqual(cache.call(adder(2), 1).get(1.0), 3)
+
+  def test_functions_not_kept(self):
+    import gc, weakref
+    cache = DiskCache(self.root)
+    fn    = lambda x: x
+    cache.call(fn, 1).get(1.0)
+    ref = weakref.ref(fn)
+    del fn
+    gc.collect()
+    self.assertIsNone(ref())
+
+  def test_max_age(self):
+    cache = DiskCache(self.root, max_age=0.05)
+    cache.call(square, 2).get(1.0)
+    cache.call(square, 2).get(1.0)
+    time.sleep(0.1)
+    cache.call(square, 2).get(1.0)
+    self.assertEqual(calls, [2, 2])
+
+  def test_evict_age(self):
+    cache = DiskCache(self.root, max_age=0.05)
+    cache.call(square, 2).get(1.0)
+    self.assertEqual(cache.evict().get(1.0), 0)
+    time.sleep(0.1)
+    self.assertEqual(cache.evict().get(1.0), 1)
+    self.assertEqual(cache.stats()['evicted'], 1)
+
+  def test_max_bytes(self):
+    cache = DiskCache(self.root, max_bytes=2500)
+    for i in (0, 1):
+      cache.call(pad, i).get(1.0)
+      time.sleep(0.02)
+    cache.call(pad, 0).get(1.0)   # 1 is now the least recently used
+    time.sleep(0.02)
+    cache.call(pad, 2).get(1.0)
+    self.assertEqual(cache.stats()['evicted'], 1)
+
+    del calls[:]
+    for i in (0, 2, 1):
+      cache.call(pad, i).get(1.0)
+    self.assertEqual(calls, [1])
+
+  def test_max_bytes_tracked(self):
+    walks = []
+    walk  = os.walk
+    def counted(top, *args):
+      if top == self.root: # os.walk calls itself for subdirectories
+        walks.append(top)
+      return walk(top, *args)
+
+    os.walk = counted
+    try:
+      cache = DiskCache(self.root, max_bytes=2500)
+      for i in range(2):
+        cache.call(pad, i).get(1.0)
+      self.assertEqual(len(walks), 1)   # measured once
+      cache.call(pad, 2).get(1.0)
+      self.assertEqual(len(walks), 2)   # over the limit
+    finally:
+      os.walk = walk
+    self.assertEqual(cache.stats()['evicted'], 1)
+
+  def test_clear(self):
+    cache = DiskCache(self.root)
+    cache.call(square, 2).get(1.0)
+    cache.clear().get(1.0)
+    cache.call(square, 2).get(1.0)
+    self.assertEqual(calls, [2, 2])
+
+  @unittest.skipIf(numpy is None, "numpy is not installed")
+  def test_numpy_mmap(self):
+    cache  = DiskCache(self.root)
+    array  = lambda n: numpy.arange(n, dtype=numpy.float64)
+    first  = cache.call(array, 1000).get(1.0)
+    second = cache.call(array, 1000).get(1.0)
+    for result in (first, second):
+      self.assertIsInstance(result, numpy.memmap)
+      self.assertFalse(result.flags.writeable)
+      numpy.testing.assert_array_equal(result, numpy.arange(1000))
+    self.assertEqual(cache.stats()['hits'], 1)
+
+  @unittest.skipIf(numpy is None, "numpy is not installed")
+  def test_numpy_arguments(self):
+    cache = DiskCache(self.root)
+    total = lambda a: float(a.sum())
+    self.assertEqual(cache.call(total, numpy.ones(10)).get(1.0), 10.0)
+    self.assertEqual(cache.call(total, numpy.ones(20)).get(1.0), 20.0)
+    self.assertEqual(cache.stats()['misses'], 2)
+
+  @unittest.skipIf(numpy is None, "numpy is not installed")
+  def test_numpy_object_arrays_pickled(self):
+    cache  = DiskCache(self.root)
+    result = cache.call(lambda: numpy.array([{'a': 1}], dtype=object)).get(1.0)
+    self.assertEqual(result[0], {'a': 1})
+    self.assertNotIsInstance(result, numpy.memmap)
+
+  @unittest.skipIf(numpy is None, "numpy is not installed")
+  def test_numpy_replaced_by_pickle(self):
+    kind = ['array']
+    def result(x):
+      calls.append(x)
+      return numpy.arange(3) if kind[0] == 'array' else [0, 1, 2]
+
+    cache = DiskCache(self.root, max_age=0.05)
+    cache.call(result, 1).get(1.0)
+    time.sleep(0.1)
+    kind[0] = 'list'
+    cache.call(result, 1).get(1.0)
+    self.assertEqual(cache.call(result, 1).get(1.0), [0, 1, 2])
+    self.assertEqual(calls, [1, 1])
+
+
+if __name__ == '__main__':
+  unittest.main()
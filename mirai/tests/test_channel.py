@@ -0,0 +1,150 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+import unittest
+
+from mirai import *
+
+
+class AsyncQueueTests(unittest.TestCase):
+
+  def setUp(self):
+    Promise.executor(ThreadPoolExecutor(max_workers=2))
+
+  def tearDown(self):
+    Promise.executor().shutdown(wait=False)
+
+  def test_put_get(self):
+    queue = AsyncQueue()
+    for i in range(3):
+      self.assertIsNone(queue.put(i).get(0.5))
+    self.assertEqual(queue.qsize(), 3)
+    self.assertEqual([queue.get().get(0.5) for i in range(3)], [0, 1, 2])
+
+  def test_get_waits(self):
+    queue = AsyncQueue()
+    (a, b) = (queue.get(), queue.get())
+    time.sleep(0.01)
+    self.assertFalse(a.isdefined())
+
+    queue.put('x')
+    queue.put('y')
+    self.assertEqual((a.get(0.5), b.get(0.5)), ('x', 'y'))
+    self.assertEqual(queue.qsize(), 0)
+
+  def test_bounded(self):
+    queue = AsyncQueue(max_size=2)
+    puts  = [queue.put(i) for i in range(4)]
+    self.assertTrue(puts[1].isdefined())
+    self.assertFalse(puts[2].isdefined())
+
+    self.assertEqual(queue.get().get(0.5), 0)
+    self.assertTrue(puts[2].isdefined())
+    self.assertFalse(puts[3].isdefined())
+    self.assertEqual([queue.get().get(0.5) for i in range(3)], [1, 2, 3])
+    self.assertTrue(puts[3].isdefined())
+
+  def test_rendezvous(self):
+    queue = AsyncQueue(max_size=0)
+    put   = queue.put('x')
+    time.sleep(0.01)
+    self.assertFalse(put.isdefined())
+    self.assertEqual(queue.qsize(), 0)
+    self.assertEqual(queue.get().get(0.5), 'x')
+    self.assertIsNone(put.get(0.5))
+
+  def test_get_many(self):
+    queue = AsyncQueue()
+    for i in range(5):
+      queue.put(i)
+    self.assertEqual(queue.get_many(3).get(0.5), [0, 1, 2])
+    self.assertEqual(queue.get_many(3).get(0.5), [3, 4])
+
+    waiting = queue.get_many(3)
+    queue.put(5)
+    self.assertEqual(waiting.get(0.5), [5])
+    self.assertRaises(ValueError, queue.get_many, 0)
+
+  def test_get_many_frees_room(self):
+    queue = AsyncQueue(max_size=2)
+    puts  = [queue.put(i) for i in range(5)]
+    self.assertEqual(queue.get_many(4).get(0.5), [0, 1, 2, 3])
+    self.assertTrue(all(p.isdefined() for p in puts))
+    self.assertEqual(queue.qsize(), 1)
+
+  def test_timeout(self):
+    queue = AsyncQueue(max_size=1)
+    self.assertRaises(TimeoutError, queue.get(timeout=0.02).get, 0.5)
+    queue.put('a')
+    self.assertRaises(TimeoutError, queue.put('b', timeout=0.02).get, 0.5)
+
+    # neither the expired get nor the expired put took effect
+    self.assertEqual(queue.get(timeout=0.5).get(0.5), 'a')
+    self.assertEqual(queue.qsize(), 0)
+
+  def test_deadline(self):
+    queue = AsyncQueue()
+    with Promise.deadline(0.02):
+      got = queue.get()
+    self.assertRaises(TimeoutError, got.get, 0.5)
+
+  def test_close(self):
+    queue = AsyncQueue(max_size=1)
+    queue.put('a')
+    blocked = queue.put('b')
+    queue.close()
+    self.assertTrue(queue.closed())
+    self.assertRaises(QueueClosedError, queue.put('c').get, 0.5)
+
+    # items put before closing can still be taken
+    self.assertEqual(queue.get().get(0.5), 'a')
+    self.assertEqual(queue.get().get(0.5), 'b')
+    self.assertIsNone(blocked.get(0.5))
+    self.assertRaises(QueueClosedError, queue.get().get, 0.5)
+
+  def test_close_wakes_getters(self):
+    queue   = AsyncQueue()
+    waiting = queue.get_many(2)
+    queue.close()
+    self.assertRaises(QueueClosedError, waiting.get, 0.5)
+
+  def test_drain(self):
+    queue   = AsyncQueue()
+    queue.put('a')
+    drained = queue.drain()
+    queue.close()
+    time.sleep(0.01)
+    self.assertFalse(drained.isdefined())
+    queue.get()
+    self.assertIsNone(drained.get(0.5))
+    self.assertIsNone(queue.drain().get(0.5))
+
+  def test_producers_consumers(self):
+    # far more concurrent consumers than executor threads
+    queue    = AsyncQueue(max_size=10)
+    consumed = []
+    lock     = threading.Lock()
+
+    def consume():
+      def record(batch):
+        with lock:
+          consumed.extend(batch)
+        return consume()
+      def closed(e):
+        return Promise.value(None) if isinstance(e, QueueClosedError) else Promise.exception(e)
+      return queue.get_many(4).flatmap(record).rescue(closed)
+
+    consumers = [consume() for i in range(50)]
+    producers = [
+      Promise.call(lambda start: [queue.put(i).get(1.0) for i in range(start, start + 500)], start)
+      for start in (0, 500)
+    ]
+    Promise.collect(producers).get(5.0)
+    queue.close()
+    queue.drain().get(1.0)
+    Promise.collect(consumers).get(1.0)
+    self.assertEqual(sorted(consumed), range(1000))
+
+
+if __name__ == '__main__':
+  unittest.main()
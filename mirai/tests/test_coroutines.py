@@ -0,0 +1,102 @@
+from concurrent.futures import ThreadPoolExecutor
+import time
+import unittest
+
+from mirai import *
+
+
+class CoroutineTests(unittest.TestCase):
+
+  def setUp(self):
+    Promise.executor(ThreadPoolExecutor(max_workers=10))
+
+  def tearDown(self):
+    Promise.executor().shutdown(wait=False)
+
+  def test_sequential(self):
+    @coroutine
+    def add(a, b):
+      x = yield Promise.call(lambda: a)
+      y = yield Promise.wait(0.01).map(lambda v: b)
+      raise Return(x + y)
+
+    self.assertEqual(add(1, 2).get(0.5), 3)
+
+  def test_no_return(self):
+    @coroutine
+    def nothing():
+      yield Promise.value(1)
+
+    self.assertIsNone(nothing().get(0.5))
+
+  def test_not_a_generator(self):
+    @coroutine
+    def plain():
+      return 5
+
+    self.assertEqual(plain().get(0.5), 5)
+
+  def test_yield_list(self):
+    @coroutine
+    def fanout():
+      values = yield [Promise.call(lambda i=i: i) for i in range(5)]
+      raise Return(values)
+
+    self.assertEqual(fanout().get(0.5), range(5))
+
+  def test_yield_value(self):
+    @coroutine
+    def identity():
+      v = yield 3
+      raise Return(v)
+
+    self.assertEqual(identity().get(0.5), 3)
+
+  def test_exception_thrown_into_generator(self):
+    @coroutine
+    def recover():
+      try:
+        yield Promise.wait(0.01).flatmap(lambda v: Promise.exception(NotImplementedError()))
+      except NotImplementedError:
+        raise Return("recovered")
+
+    self.assertEqual(recover().get(0.5), "recovered")
+
+  def test_exception_propagates(self):
+    @coroutine
+    def fail():
+      yield Promise.value(1)
+      raise NotImplementedError("Uh oh...")
+
+    self.assertRaises(NotImplementedError, fail().get, 0.5)
+
+  def test_many_resolved_steps(self):
+    @coroutine
+    def count(n):
+      total = 0
+      for i in range(n):
+        total += yield Promise.value(1)
+      raise Return(total)
+
+    self.assertEqual(count(10000).get(0.5), 10000)
+
+  def test_few_threads(self):
+    # like PromiseMiscellaneousTests.test_within_few_threads, but waiting on
+    # nested calls in coroutines rather than with Promise.get, which would
+    # deadlock.
+    Promise.executor(ThreadPoolExecutor(max_workers=2))
+
+    @coroutine
+    def nested(i):
+      if i <= 0:
+        raise Return("done")
+      yield Promise.call(time.sleep, 0.01)
+      result = yield nested(i - 1)
+      raise Return(result)
+
+    results = Promise.collect([nested(i) for i in range(10)])
+    self.assertEqual(results.get(2.0), ["done"] * 10)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,117 @@
+import threading
+import time
+import unittest
+
+from mirai import *
+
+
+def add(a, b):
+  return a + b
+
+
+class DataflowTests(unittest.TestCase):
+
+  def setUp(self):
+    Promise.executor(PriorityThreadPoolExecutor(max_workers=4))
+
+  def tearDown(self):
+    Promise.executor().shutdown(wait=False)
+
+  def test_run(self):
+    flow = Dataflow()
+    flow.add('a', lambda: 1)
+    flow.add('b', lambda: 2)
+    flow.add('c', add, inputs=['a', 'b'])
+    flow.add('d', add, inputs=['c'], args=(10,))
+
+    self.assertEqual(flow.run().get(0.5), {'a': 1, 'b': 2, 'c': 3, 'd': 13})
+    self.assertEqual(flow.run(['d']).get(0.5), {'d': 13})
+
+  def test_run_only_needed(self):
+    called = []
+    flow   = Dataflow()
+    flow.add('a', lambda: called.append('a'))
+    flow.add('b', lambda: called.append('b'))
+
+    flow.run(['a']).get(0.5)
+    self.assertEqual(called, ['a'])
+
+  def test_failure(self):
+    def bar(v):
+      raise NotImplementedError("Uh oh...")
+
+    flow = Dataflow()
+    flow.add('a', lambda: 1)
+    flow.add('b', bar, inputs=['a'])
+    flow.add('c', add, inputs=['b'], args=(1,))
+
+    self.assertRaises(NotImplementedError, flow.run(['c']).get, 0.5)
+
+  def test_invalid(self):
+    flow = Dataflow()
+    flow.add('a', lambda: 1)
+    self.assertRaises(ValueError, flow.add, 'a', lambda: 2)
+    self.assertRaises(ValueError, flow.add, 'b', add, inputs=['missing'])
+    self.assertRaises(ValueError, flow.run, ['missing'])
+
+  def test_shares_identical_nodes(self):
+    called = []
+    def fetch(key):
+      called.append(key)
+      return key
+
+    flow = Dataflow()
+    self.assertEqual(flow.add('x', fetch, args=(1,)), 'x')
+    self.assertEqual(flow.add('y', fetch, args=(1,)), 'x')
+    self.assertEqual(flow.add('z', fetch, args=(2,)), 'z')
+    self.assertEqual(flow.add('sum1', add, inputs=['x', 'z']), 'sum1')
+    self.assertEqual(flow.add('sum2', add, inputs=['y', 'z']), 'sum1')
+
+    self.assertEqual(flow.run().get(0.5), {'x': 1, 'y': 1, 'z': 2, 'sum1': 3, 'sum2': 3})
+    self.assertEqual(sorted(called), [1, 2])
+
+  def test_unhashable_args_not_shared(self):
+    flow = Dataflow()
+    self.assertEqual(flow.add('x', len, args=([1],)), 'x')
+    self.assertEqual(flow.add('y', len, args=([1],)), 'y')
+
+  def test_critical_path(self):
+    flow = Dataflow()
+    flow.add('a', lambda: 1)
+    flow.add('short', lambda v: v, inputs=['a'], cost=1)
+    flow.add('long', lambda v: v, inputs=['a'], cost=5)
+    flow.add('end', add, inputs=['short', 'long'], cost=2)
+
+    self.assertEqual(flow.critical_path(), {'a': 8, 'short': 3, 'long': 7, 'end': 2})
+
+  def test_critical_path_runs_first(self):
+    Promise.executor(PriorityThreadPoolExecutor(max_workers=1))
+    event = threading.Event()
+    order = []
+
+    flow = Dataflow()
+    flow.add('gate', event.wait, args=(1.0,))
+    flow.add('short', lambda v: order.append('short'), inputs=['gate'], cost=1)
+    flow.add('long', lambda v: order.append('long'), inputs=['gate'], cost=5)
+    result = flow.run()
+    event.set()
+    result.get(0.5)
+
+    self.assertEqual(order, ['long', 'short'])
+
+  def test_export(self):
+    flow = Dataflow()
+    flow.add('a', lambda: time.sleep(0.01))
+    flow.add('b', lambda: time.sleep(0.01))
+    flow.run(['a']).get(0.5)
+
+    nodes = dict((n['name'], n) for n in flow.export())
+    self.assertEqual(set(nodes), set(['a', 'b']))
+    self.assertTrue(nodes['a']['end'] - nodes['a']['start'] >= 0.01)
+    self.assertTrue(nodes['a']['start'] >= nodes['a']['ready'])
+    self.assertNotIn('start', nodes['b'])
+    self.assertIn('"a"', flow.to_dot())
+
+
+if __name__ == '__main__':
+  unittest.main()
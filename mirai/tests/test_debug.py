@@ -0,0 +1,87 @@
+import logging
+import StringIO
+import time
+import unittest
+
+from mirai import *
+from mirai import debug
+
+
+class ListHandler(logging.Handler):
+
+  def __init__(self):
+    logging.Handler.__init__(self)
+    self.records = []
+
+  def emit(self, record):
+    self.records.append(record)
+
+
+def slow(v):
+  time.sleep(0.05)
+
+
+class CallbackProfilerTests(unittest.TestCase):
+
+  def setUp(self):
+    self.profiler = debug.enable(threshold=0.02)
+    self.handler  = ListHandler()
+    debug.log.addHandler(self.handler)
+
+  def tearDown(self):
+    debug.log.removeHandler(self.handler)
+    debug.disable()
+
+  def test_attributes_callback(self):
+    Promise.value(1).onsuccess(slow)
+
+    stats = self.profiler.stats()
+    self.assertEqual(len(stats), 1)
+    self.assertEqual(stats[0]['name'], __name__ + '.slow')
+    self.assertIn('test_debug.py', stats[0]['site'])
+    self.assertEqual(stats[0]['calls'], 1)
+    self.assertTrue(stats[0]['wall'] >= 0.04)
+
+  def test_attributes_map(self):
+    Promise.value(1).map(slow).get(0.5)
+    self.assertIn(__name__ + '.slow', [s['name'] for s in self.profiler.stats()])
+
+  def test_groups_by_site(self):
+    for i in range(3):
+      Promise.value(i).onsuccess(lambda v: None)
+    Promise.value(1).onsuccess(lambda v: None)
+
+    self.assertEqual(sorted(s['calls'] for s in self.profiler.stats('calls')), [1, 3])
+
+  def test_sort(self):
+    Promise.value(1).onsuccess(slow)
+    for i in range(3):
+      Promise.value(i).onsuccess(lambda v: None)
+
+    self.assertEqual(self.profiler.stats('wall')[0]['name'], __name__ + '.slow')
+    self.assertEqual(self.profiler.stats('calls')[0]['calls'], 3)
+
+  def test_warns_on_slow_callbacks(self):
+    Promise.value(1).onsuccess(lambda v: None)
+    self.assertEqual(self.handler.records, [])
+
+    Promise.value(1).onsuccess(slow)
+    self.assertEqual(len(self.handler.records), 1)
+    self.assertIn(__name__ + '.slow', self.handler.records[0].getMessage())
+
+  def test_print_stats(self):
+    Promise.value(1).onsuccess(slow)
+    stream = StringIO.StringIO()
+    self.profiler.print_stats(stream=stream)
+    self.assertIn(__name__ + '.slow', stream.getvalue())
+
+  def test_disable(self):
+    profiler = debug.disable()
+    Promise.value(1).onsuccess(slow)
+
+    self.assertIs(profiler, self.profiler)
+    self.assertEqual(profiler.stats(), [])
+
+
+if __name__ == '__main__':
+  unittest.main()
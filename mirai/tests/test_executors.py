@@ -0,0 +1,396 @@
+import threading
+import time
+import unittest
+
+from mirai import *
+from mirai import context
+
+
+class AdaptiveThreadPoolExecutorTests(unittest.TestCase):
+
+  def setUp(self):
+    self.executor = AdaptiveThreadPoolExecutor(max_workers=4, idle_timeout=0.1)
+
+  def tearDown(self):
+    self.executor.shutdown(wait=False)
+
+  def test_submit(self):
+    self.assertEqual(self.executor.submit(lambda a, b: a+b, 1, b=2).result(0.5), 3)
+
+  def test_submit_many(self):
+    fs = self.executor.submit_many(lambda a, b: a+b, [(i, 1) for i in range(10)])
+    self.assertEqual([f.result(0.5) for f in fs], range(1, 11))
+    self.assertEqual(self.executor.stats()['submitted'], 10)
+
+  def test_submit_exception(self):
+    def bar():
+      raise NotImplementedError("Uh oh...")
+
+    self.assertRaises(NotImplementedError, self.executor.submit(bar).result, 0.5)
+
+  def test_starts_empty(self):
+    self.assertEqual(self.executor.stats()['workers'], 0)
+
+  def test_grows_to_max_workers(self):
+    event = threading.Event()
+    fs    = [self.executor.submit(event.wait, 1.0) for i in range(10)]
+
+    time.sleep(0.05)
+    stats = self.executor.stats()
+    self.assertEqual(stats['workers'], 4)
+    self.assertEqual(stats['active'], 4)
+    self.assertEqual(stats['queued'], 6)
+
+    event.set()
+    for f in fs:
+      f.result(0.5)
+
+  def test_reuses_idle_workers(self):
+    for i in range(100):
+      self.executor.submit(lambda: None).result(0.5)
+
+    self.assertEqual(self.executor.stats()['peak_workers'], 1)
+
+  def test_shrinks_to_min_workers(self):
+    executor = AdaptiveThreadPoolExecutor(max_workers=4, min_workers=1, idle_timeout=0.05)
+    try:
+      fs = [executor.submit(time.sleep, 0.05) for i in range(4)]
+      for f in fs:
+        f.result(0.5)
+      self.assertEqual(executor.stats()['workers'], 4)
+
+      time.sleep(0.3)
+      self.assertEqual(executor.stats()['workers'], 1)
+    finally:
+      executor.shutdown()
+
+  def test_shrinks_to_zero(self):
+    self.executor.submit(lambda: None).result(0.5)
+    time.sleep(0.3)
+
+    stats = self.executor.stats()
+    self.assertEqual(stats['workers'], 0)
+    self.assertEqual(stats['completed'], 1)
+
+  def test_stats(self):
+    fs = [self.executor.submit(time.sleep, 0.02) for i in range(8)]
+    for f in fs:
+      f.result(0.5)
+
+    stats = self.executor.stats()
+    self.assertEqual(stats['submitted'], 8)
+    self.assertEqual(stats['completed'], 8)
+    self.assertEqual(stats['queued'], 0)
+    self.assertTrue(stats['throughput'] > 0)
+    self.assertTrue(stats['max_wait_time'] >= 0.01)
+
+  def test_shutdown(self):
+    f = self.executor.submit(time.sleep, 0.05)
+    self.executor.shutdown(wait=True)
+
+    self.assertTrue(f.done())
+    self.assertEqual(self.executor.stats()['workers'], 0)
+    self.assertRaises(RuntimeError, self.executor.submit, lambda: None)
+
+  def test_promise_executor(self):
+    Promise.executor(self.executor)
+    self.assertEqual(Promise.call(lambda v: v+1, 1).get(0.5), 2)
+    self.assertEqual(Promise.collect([Promise.call(time.sleep, 0.01) for i in range(8)]).get(0.5), [None] * 8)
+
+
+class BoundedQueueTests(unittest.TestCase):
+
+  def setUp(self):
+    self.event    = threading.Event()
+    self.executor = None
+
+  def tearDown(self):
+    self.event.set()
+    self.executor.shutdown(wait=False)
+
+  def fill(self, overflow):
+    # one worker busy until `self.event` is set, two tasks queued
+    self.executor = AdaptiveThreadPoolExecutor(max_workers=1, max_queue=2, overflow=overflow)
+    busy = self.executor.submit(self.event.wait, 1.0)
+    time.sleep(0.01)
+    return [busy] + [self.executor.submit(lambda i=i: i) for i in range(2)]
+
+  def test_invalid(self):
+    self.executor = AdaptiveThreadPoolExecutor()
+    self.assertRaises(ValueError, AdaptiveThreadPoolExecutor, max_queue=0)
+    self.assertRaises(ValueError, AdaptiveThreadPoolExecutor, overflow='ignore')
+
+  def test_occupancy(self):
+    self.fill('reject')
+    stats = self.executor.stats()
+    self.assertEqual(stats['queued'], 2)
+    self.assertEqual(stats['max_queue'], 2)
+    self.assertEqual(stats['occupancy'], 1.0)
+    self.assertEqual(AdaptiveThreadPoolExecutor(max_workers=1).stats()['occupancy'], None)
+
+  def test_reject(self):
+    fs       = self.fill('reject')
+    rejected = self.executor.submit(lambda: 2)
+
+    self.assertRaises(RejectedError, rejected.result, 0)
+    self.event.set()
+    self.assertEqual([f.result(0.5) for f in fs[1:]], [0, 1])
+    self.assertEqual(self.executor.stats()['overflowed'], 1)
+
+  def test_reject_promise(self):
+    self.fill('reject')
+    Promise.executor(self.executor)
+    self.assertRaises(RejectedError, Promise.call(lambda: 2).get, 0)
+
+  def test_caller_runs(self):
+    fs     = self.fill('caller_runs')
+    result = self.executor.submit(threading.current_thread)
+
+    self.assertTrue(result.done())
+    self.assertEqual(result.result(), threading.current_thread())
+
+  def test_drop_oldest(self):
+    fs    = self.fill('drop_oldest')
+    newer = self.executor.submit(lambda: 2)
+
+    self.assertRaises(RejectedError, fs[1].result, 0)
+    self.event.set()
+    self.assertEqual([fs[2].result(0.5), newer.result(0.5)], [1, 2])
+
+  def test_drop_lowest_priority(self):
+    self.executor = PriorityThreadPoolExecutor(max_workers=1, max_queue=2, overflow='drop_oldest')
+    Promise.executor(self.executor)
+    Promise.call(self.event.wait, 1.0)
+    time.sleep(0.01)
+    high = Promise.call(lambda: 'high', priority=5)
+    low  = Promise.call(lambda: 'low',  priority=1)
+    mid  = Promise.call(lambda: 'mid',  priority=3)
+
+    self.assertRaises(RejectedError, low.get, 0)
+    self.event.set()
+    self.assertEqual(Promise.collect([high, mid]).get(0.5), ['high', 'mid'])
+
+  def test_block(self):
+    fs      = self.fill('block')
+    blocked = []
+    thread  = threading.Thread(target=lambda: blocked.append(self.executor.submit(lambda: 2)))
+    thread.start()
+    time.sleep(0.05)
+    self.assertEqual(blocked, [])
+
+    self.event.set()
+    thread.join(0.5)
+    self.assertEqual(blocked[0].result(0.5), 2)
+
+  def test_block_shutdown(self):
+    self.fill('block')
+    errors = []
+
+    def submit():
+      try:
+        self.executor.submit(lambda: 2)
+      except RuntimeError as e:
+        errors.append(e)
+
+    thread = threading.Thread(target=submit)
+    thread.start()
+    time.sleep(0.05)
+    self.executor.shutdown(wait=False)
+    thread.join(0.5)
+    self.assertEqual(len(errors), 1)
+
+  def test_block_deadline(self):
+    self.fill('block')
+    start = time.time()
+    with context.deadline(0.05):
+      future = self.executor.submit(lambda: 2)
+    self.assertRaises(TimeoutError, future.result, 0.5)
+    self.assertLess(time.time() - start, 0.5)
+    self.assertEqual(self.executor.stats()['queued'], 2)
+
+  def test_block_deadline_priority(self):
+    self.executor = PriorityThreadPoolExecutor(max_workers=1, max_queue=1)
+    self.executor.submit(self.event.wait, 1.0)
+    time.sleep(0.01)
+    self.executor.submit(lambda: 1)
+    with context.deadline(0.05):
+      future = self.executor.submit(lambda: 2)
+    self.assertRaises(TimeoutError, future.result, 0.5)
+
+
+class PriorityThreadPoolExecutorTests(unittest.TestCase):
+
+  def setUp(self):
+    Promise.executor(PriorityThreadPoolExecutor(max_workers=1))
+
+  def tearDown(self):
+    Promise.executor().shutdown(wait=False)
+
+  def run_blocked(self, priorities):
+    # occupy the only worker, queue one task per priority, then release it and
+    # record the order the queued tasks ran in.
+    event = threading.Event()
+    order = []
+    Promise.call(event.wait, 1.0, priority=100)
+    time.sleep(0.01)
+    promises = [
+      Promise.call(order.append, i, priority=p)
+      for (i, p) in enumerate(priorities)
+    ]
+    event.set()
+    Promise.collect(promises).get(0.5)
+    return order
+
+  def test_priority_order(self):
+    self.assertEqual(self.run_blocked([0, 5, None, 10, 5]), [3, 1, 4, 0, 2])
+
+  def test_aging(self):
+    Promise.executor(PriorityThreadPoolExecutor(max_workers=1, aging=0.01))
+    event = threading.Event()
+    order = []
+    Promise.call(event.wait, 1.0)
+    low = Promise.call(order.append, "low", priority=0)
+    time.sleep(0.1)
+    high = Promise.call(order.append, "high", priority=5)
+    event.set()
+    Promise.join([low, high]).get(0.5)
+
+    self.assertEqual(order, ["low", "high"])
+
+  def test_priority_not_passed_to_fn(self):
+    self.assertEqual(Promise.call(lambda **kw: kw, a=1, priority=3).get(0.5), {'a': 1})
+
+  def test_priority_inherited(self):
+    Promise.executor(PriorityThreadPoolExecutor(max_workers=2))
+
+    def inner():
+      return Promise.call(lambda: context.current().priority).get(0.5)
+
+    self.assertEqual(Promise.call(inner, priority=7).get(0.5), 7)
+    self.assertEqual(Promise.call(lambda: context.current().priority).get(0.5), None)
+
+  def test_priority_inherited_by_callbacks(self):
+    event  = threading.Event()
+    result = Promise.call(event.wait, 1.0, priority=7).map(lambda v: context.current().priority)
+    event.set()
+
+    self.assertEqual(result.get(0.5), 7)
+    self.assertEqual(context.current().priority, None)
+
+
+class PartitionedExecutorTests(unittest.TestCase):
+
+  def setUp(self):
+    Promise.executor(AdaptiveThreadPoolExecutor(max_workers=4))
+
+  def tearDown(self):
+    Promise.executor().shutdown(wait=False)
+
+  def test_call_keyed(self):
+    self.assertEqual(Promise.call_keyed('a', lambda a, b: a+b, 1, b=2).get(0.5), 3)
+
+  def test_call_keyed_exception(self):
+    def bar():
+      raise NotImplementedError("Uh oh...")
+
+    self.assertRaises(NotImplementedError, Promise.call_keyed('a', bar).get, 0.5)
+
+  def test_same_key_serial(self):
+    lock    = threading.Lock()
+    running = [0]
+    order   = []
+
+    def work(i):
+      with lock:
+        running[0] += 1
+        overlap = running[0] > 1
+      time.sleep(0.001)
+      order.append(i)
+      with lock:
+        running[0] -= 1
+      return overlap
+
+    results = Promise.collect([Promise.call_keyed('a', work, i) for i in range(50)]).get(1.0)
+    self.assertFalse(any(results))
+    self.assertEqual(order, range(50))
+
+  def test_different_keys_parallel(self):
+    start   = time.time()
+    Promise.collect([Promise.call_keyed(k, time.sleep, 0.1) for k in range(4)]).get(0.5)
+    self.assertLess(time.time() - start, 0.2)
+
+  def test_key_not_blocked_by_failure(self):
+    failed = Promise.call_keyed('a', lambda: 1 / 0)
+    after  = Promise.call_keyed('a', lambda: 2)
+
+    self.assertEqual(after.get(0.5), 2)
+    self.assertRaises(ZeroDivisionError, failed.get, 0.5)
+
+  def test_idle_keys_removed(self):
+    Promise.collect([Promise.call_keyed(i % 10, lambda: None) for i in range(100)]).get(1.0)
+    time.sleep(0.01)
+    self.assertEqual(Promise.PARTITIONS.keys(), 0)
+
+  def test_fairness(self):
+    # a key with a long backlog mustn't keep others waiting behind all of it
+    executor   = AdaptiveThreadPoolExecutor(max_workers=1)
+    partitions = PartitionedExecutor(executor, batch_size=2)
+    event      = threading.Event()
+    order      = []
+    partitions.submit('a', event.wait, 1.0)
+    fs  = [partitions.submit('a', order.append, 'a') for i in range(5)]
+    fs += [partitions.submit('b', order.append, 'b')]
+    event.set()
+    for f in fs:
+      f.result(0.5)
+    executor.shutdown(wait=False)
+
+    self.assertLess(order.index('b'), 5)
+
+  def test_priority_inherited(self):
+    result = Promise.call_keyed('a', lambda: context.current().priority, priority=3)
+    self.assertEqual(result.get(0.5), 3)
+
+  def test_priority_kept_across_batches(self):
+    executor   = PriorityThreadPoolExecutor(max_workers=1)
+    partitions = PartitionedExecutor(executor, batch_size=1)
+    event      = threading.Event()
+    order      = []
+    executor.submit(event.wait, 1.0)
+    time.sleep(0.01)
+    with context.bound(context.current().replace(priority=5)):
+      fs = [partitions.submit('a', order.append, 'a') for i in range(2)]
+    with context.bound(context.current().replace(priority=1)):
+      fs.append(executor.submit(order.append, 'b'))
+    event.set()
+    for f in fs:
+      f.result(0.5)
+    executor.shutdown(wait=False)
+
+    self.assertEqual(order, ['a', 'a', 'b'])
+
+  def test_executor_shut_down(self):
+    executor   = AdaptiveThreadPoolExecutor(max_workers=1)
+    partitions = PartitionedExecutor(executor)
+    executor.shutdown()
+    for i in range(2):
+      self.assertRaises(RuntimeError, partitions.submit('a', lambda: 1).result, 0.5)
+    self.assertEqual(partitions.keys(), 0)
+
+  def test_executor_rejects(self):
+    event      = threading.Event()
+    executor   = AdaptiveThreadPoolExecutor(max_workers=1, max_queue=1, overflow='reject')
+    partitions = PartitionedExecutor(executor)
+    executor.submit(event.wait, 1.0)
+    time.sleep(0.01)
+    executor.submit(lambda: None)
+    try:
+      self.assertRaises(RejectedError, partitions.submit('a', lambda: 1).result, 0.5)
+      self.assertEqual(partitions.keys(), 0)
+    finally:
+      event.set()
+      executor.shutdown(wait=False)
+
+
+if __name__ == '__main__':
+  unittest.main()
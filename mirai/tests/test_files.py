@@ -0,0 +1,84 @@
+import mmap
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from mirai import *
+from mirai import files
+
+
+class FilesTests(unittest.TestCase):
+
+  def setUp(self):
+    files.executor(AdaptiveThreadPoolExecutor(max_workers=4))
+    self.root = tempfile.mkdtemp()
+
+  def tearDown(self):
+    files.executor().shutdown(wait=False)
+    shutil.rmtree(self.root)
+
+  def write(self, name, data):
+    path = os.path.join(self.root, name)
+    with open(path, 'wb') as f:
+      f.write(data)
+    return path
+
+  def test_read(self):
+    path = self.write('a', "hello, world")
+    self.assertEqual(files.read(path).get(0.5), "hello, world")
+    self.assertEqual(files.read(path, offset=7).get(0.5), "world")
+    self.assertEqual(files.read(path, offset=7, size=3).get(0.5), "wor")
+    self.assertEqual(files.read(path, size=5).get(0.5), "hello")
+
+  def test_read_missing(self):
+    self.assertRaises(IOError, files.read(os.path.join(self.root, 'missing')).get, 0.5)
+
+  def test_read_many(self):
+    paths = [self.write(str(i), str(i) * i) for i in range(40)]
+    self.assertEqual(files.read_many(paths, batch_size=16).get(0.5), [str(i) * i for i in range(40)])
+    self.assertEqual(files.executor().stats()['submitted'], 3)
+
+  def test_read_many_empty(self):
+    self.assertEqual(files.read_many([]).get(0.5), [])
+    self.assertRaises(ValueError, files.read_many, [], batch_size=0)
+
+  def test_read_many_missing(self):
+    paths = [self.write('a', "a"), os.path.join(self.root, 'missing')]
+    self.assertRaises(IOError, files.read_many(paths).get, 0.5)
+
+  def test_read_many_mmap_threshold(self):
+    (small, large) = files.read_many([self.write('a', "a" * 10), self.write('b', "b" * 10000)], mmap_threshold=1000).get(0.5)
+    self.assertEqual(small, "a" * 10)
+    self.assertIsInstance(large, mmap.mmap)
+    self.assertEqual(large[:], "b" * 10000)
+
+  def test_mmap_view(self):
+    view = files.mmap_view(self.write('a', "hello, world")).get(0.5)
+    self.assertIsInstance(view, mmap.mmap)
+    self.assertEqual(len(view), 12)
+    self.assertEqual(view[7:], "world")
+    self.assertEqual(view.find("world"), 7)
+    self.assertRaises(TypeError, view.write, "x")
+
+  def test_mmap_view_empty(self):
+    self.assertEqual(files.mmap_view(self.write('a', "")).get(0.5), "")
+
+  def test_separate_executor(self):
+    # reads proceed while every Promise.EXECUTOR worker is busy. Swap the
+    # executor in directly: setting it with Promise.executor would shut down
+    # the one other tests are using.
+    (previous, Promise.EXECUTOR) = (Promise.EXECUTOR, AdaptiveThreadPoolExecutor(max_workers=1))
+    event = threading.Event()
+    try:
+      Promise.call(event.wait, 1.0)
+      self.assertEqual(files.read(self.write('a', "a")).get(0.5), "a")
+    finally:
+      event.set()
+      Promise.EXECUTOR.shutdown(wait=False)
+      Promise.EXECUTOR = previous
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,167 @@
+from concurrent.futures import ThreadPoolExecutor
+import cPickle as pickle
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+
+from mirai import *
+from mirai import files, fork
+
+
+def in_child(fn):
+  """Run `fn` in a forked child process and return its result."""
+  (r, w) = os.pipe()
+  pid = os.fork()
+  if pid == 0:
+    try:
+      os.close(r)
+      signal.alarm(5)   # don't let a hang in the child hang the tests
+      try:
+        data = pickle.dumps(('value', fn()))
+      except BaseException as e:
+        data = pickle.dumps(('exception', repr(e)))
+      os.write(w, data)
+    finally:
+      os._exit(0)
+
+  os.close(w)
+  chunks = []
+  while True:
+    chunk = os.read(r, 65536)
+    if not chunk:
+      break
+    chunks.append(chunk)
+  os.close(r)
+  os.waitpid(pid, 0)
+
+  if not chunks:
+    raise AssertionError("child process died")
+  (kind, result) = pickle.loads("".join(chunks))
+  if kind == 'exception':
+    raise AssertionError("child process raised " + result)
+  return result
+
+
+class ForkTests(unittest.TestCase):
+
+  def setUp(self):
+    Promise.executor(ThreadPoolExecutor(max_workers=2))
+    self.event = threading.Event()
+
+  def tearDown(self):
+    self.event.set()
+    Promise.executor().shutdown(wait=False)
+
+  def test_call(self):
+    Promise.call(lambda: None).get(0.5)   # start the parent's workers
+    self.assertEqual(in_child(lambda: Promise.call(os.getpid).get(1.0) == os.getpid()), True)
+
+  def test_call_with_busy_parent(self):
+    # every parent worker is stuck and more work is queued behind them
+    ran = []
+    for i in range(2):
+      Promise.call(self.event.wait, 1.0)
+    Promise.call(ran.append, 'parent')
+
+    def child():
+      value = Promise.call(lambda: 2).get(1.0)
+      return (value, ran)
+
+    self.assertEqual(in_child(child), (2, []))
+
+  def test_adaptive_executor(self):
+    Promise.executor(AdaptiveThreadPoolExecutor(max_workers=2, min_workers=1))
+    for i in range(2):
+      Promise.call(self.event.wait, 1.0)
+    Promise.call(lambda: None)
+
+    def child():
+      value = Promise.call(lambda: 2).get(1.0)
+      stats = Promise.executor().stats()
+      return (value, stats['queued'], stats['workers'] <= 2)
+
+    self.assertEqual(in_child(child), (2, 0, True))
+
+  def test_timer(self):
+    Promise.wait(10)   # start the parent's timer thread
+    pending = Promise.call(self.event.wait, 1.0)
+
+    def child():
+      waited = Promise.wait(0.01).get(1.0)
+      try:
+        pending.within(0.01).get(1.0)
+      except TimeoutError:
+        return (waited, 'timed out')
+
+    self.assertEqual(in_child(child), (None, 'timed out'))
+
+  def test_call_keyed(self):
+    Promise.call_keyed('a', self.event.wait, 1.0)
+    self.assertEqual(in_child(lambda: Promise.call_keyed('a', lambda: 3).get(1.0)), 3)
+
+  def test_reactor_pipe_closed(self):
+    Promise._reactor()
+    fds = (Promise.REACTOR._wake_r, Promise.REACTOR._wake_w)
+
+    def child():
+      fork.check()
+      closed = []
+      for fd in fds:
+        try:
+          os.fstat(fd)
+        except OSError:
+          closed.append(fd)
+      return closed == list(fds) or closed
+
+    self.assertEqual(in_child(child), True)
+
+  def test_files(self):
+    (fd, path) = tempfile.mkstemp()
+    os.write(fd, "contents")
+    os.close(fd)
+    files.executor(ThreadPoolExecutor(max_workers=1))
+    files.read(path).get(0.5)   # start the parent's worker
+    files._lock.acquire()       # as if another thread were using it
+    try:
+      self.assertEqual(in_child(lambda: files.read(path).get(1.0)), "contents")
+    finally:
+      files._lock.release()
+      files.executor().shutdown(wait=False)
+      os.remove(path)
+
+  def test_hooks_run_once_per_process(self):
+    calls = []
+    fork.register(lambda: calls.append(os.getpid()))
+    try:
+      def child():
+        fork.check()
+        fork.check()
+        return len(calls)
+      self.assertEqual(in_child(child), 1)
+      fork.check()
+      self.assertEqual(calls, [])
+    finally:
+      fork._hooks.pop()
+
+  def test_import_starts_nothing(self):
+    code = "import threading, mirai; print threading.active_count(), mirai.Promise.EXECUTOR, mirai.Promise.TIMER"
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    out  = subprocess.check_output([sys.executable, '-c', code], cwd=root)
+    self.assertEqual(out.split(), ['1', 'None', 'None'])
+
+  def test_import_is_lazy(self):
+    # modules only some features need are imported when first used; see
+    # benchmarks/import_time.py
+    code = "import sys, mirai; print ' '.join(sorted(m for m in sys.modules if sys.modules[m]))"
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    out  = subprocess.check_output([sys.executable, '-c', code], cwd=root).split()
+    for module in ['joblib', 'numpy', 'inspect', 'socket', 'mmap', 'hashlib', 'shutil', 'mirai.reactor']:
+      self.assertNotIn(module, out)
+
+
+if __name__ == '__main__':
+  unittest.main()
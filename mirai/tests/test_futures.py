@@ -1,7 +1,14 @@
 from concurrent.futures import ThreadPoolExecutor
+import sys
 import unittest
 
 from mirai import *
+from mirai.futures import LazyPromise
+
+try:
+  import numpy
+except ImportError:
+  numpy = None
 
 
 class PromiseTests(object):
@@ -54,6 +61,150 @@ class PromiseConstructorTests(PromiseTests, unittest.TestCase):
     self.assertRaises(NotImplementedError, Promise.call(bar).get, 0.5)
     self.assertRaises(MiraiError, Promise.call(bar).get, 0.5)
 
+  def test_call_exception_class_reused(self):
+    def bar():
+      raise NotImplementedError("Uh oh...")
+
+    e1 = Promise.call(bar)._future.exception(0.5)
+    e2 = Promise.call(bar)._future.exception(0.5)
+    self.assertIs(type(e1), type(e2))
+
+  def test_call_exception_class_collected(self):
+    import gc, weakref
+    def temporary():
+      class Temporary(Exception):
+        pass
+      def bar():
+        raise Temporary()
+      self.assertRaises(Temporary, Promise.call(bar).get, 0.5)
+      return weakref.ref(Temporary)
+
+    ref = temporary()
+    gc.collect()
+    self.assertIsNone(ref())
+
+  def test_call_exception_context_without_joblib(self):
+    def bar():
+      raise NotImplementedError("Uh oh...")
+
+    # `None` in sys.modules makes importing joblib fail
+    saved = sys.modules.get('joblib')
+    sys.modules['joblib'] = None
+    try:
+      e = Promise.call(bar)._future.exception(0.5)
+    finally:
+      if saved is None:
+        del sys.modules['joblib']
+      else:
+        sys.modules['joblib'] = saved
+
+    self.assertIn("in bar", e.context)
+    self.assertIn("Uh oh...", e.context)
+    self.assertNotIn("in __call__", e.context)
+
+  def test_call_many(self):
+    args = [(i, i) for i in range(25)]
+    for chunksize in [1, 4, 100]:
+      self.assertEqual(Promise.call_many(lambda a, b: a+b, args, chunksize=chunksize).get(0.5), range(0, 50, 2))
+
+  def test_call_many_empty(self):
+    self.assertEqual(Promise.call_many(lambda: 1, []).get(0.5), [])
+
+  def test_call_many_exception(self):
+    def bar(i):
+      if i == 3:
+        raise NotImplementedError("Uh oh...")
+      return i
+
+    result = Promise.call_many(bar, [(i,) for i in range(10)], chunksize=2)
+    self.assertRaises(NotImplementedError, result.get, 0.5)
+    self.assertRaises(ValueError, Promise.call_many, bar, [], chunksize=0)
+
+  def test_call_many_cancelled(self):
+    import threading
+    from concurrent.futures import CancelledError
+    submitted = []
+    class Recording(ThreadPoolExecutor):
+      def submit(self, fn, *args, **kwargs):
+        submitted.append(ThreadPoolExecutor.submit(self, fn, *args, **kwargs))
+        return submitted[-1]
+
+    Promise.executor().shutdown(wait=False)
+    Promise.executor(Recording(max_workers=1))
+    event = threading.Event()
+    Promise.call(event.wait, 1.0)
+    result = Promise.call_many(lambda v: v, [(i,) for i in range(4)], chunksize=2)
+    self.assertTrue(submitted[-1].cancel())
+    event.set()
+    self.assertRaises(CancelledError, result.get, 0.5)
+
+  def test_call_many_adaptive(self):
+    Promise.executor().shutdown(wait=False)
+    Promise.executor(AdaptiveThreadPoolExecutor(max_workers=4))
+    self.assertEqual(Promise.call_many(lambda v: v+1, ((i,) for i in range(100)), chunksize=3).get(0.5), range(1, 101))
+    self.assertEqual(Promise.executor().stats()['submitted'], 34)
+
+
+@unittest.skipIf(numpy is None, "numpy is not installed")
+class PromiseMapArrayTests(PromiseTests, unittest.TestCase):
+
+  def test_map_array(self):
+    array = numpy.arange(100).reshape(20, 5)
+    for chunks in (1, 3, 20, 50):
+      result = Promise.map_array(lambda a: a * 2, array, chunks=chunks).get(0.5)
+      numpy.testing.assert_array_equal(result, array * 2)
+
+  def test_axis(self):
+    array  = numpy.arange(100).reshape(20, 5)
+    result = Promise.map_array(lambda a: a - a.mean(axis=0), array, chunks=5, axis=1).get(0.5)
+    numpy.testing.assert_array_equal(result, array - array.mean(axis=0))
+    result = Promise.map_array(lambda a: a + 1, array, chunks=5, axis=-1).get(0.5)
+    numpy.testing.assert_array_equal(result, array + 1)
+
+  def test_chunks_are_views(self):
+    array = numpy.zeros(100)
+    seen  = []
+    def fn(a):
+      seen.append(numpy.may_share_memory(a, array))
+      return a
+    Promise.map_array(fn, array, chunks=4).get(0.5)
+    self.assertEqual(seen, [True] * 4)
+
+  def test_out(self):
+    array  = numpy.arange(10.0)
+    out    = numpy.zeros(10)
+    result = Promise.map_array(numpy.sqrt, array, chunks=3, out=out).get(0.5)
+    self.assertIs(result, out)
+    numpy.testing.assert_array_almost_equal(out, numpy.sqrt(array))
+
+  def test_dtype_from_result(self):
+    result = Promise.map_array(lambda a: a > 5, numpy.arange(10), chunks=2).get(0.5)
+    self.assertEqual(result.dtype, bool)
+    self.assertEqual(result.sum(), 4)
+
+  def test_automatic_chunks(self):
+    chunks = []
+    def fn(a):
+      chunks.append(len(a))
+      return a
+    Promise.map_array(fn, numpy.zeros(1000), axis=0).get(0.5)       # 8 KB
+    self.assertEqual(chunks, [1000])
+
+    del chunks[:]
+    Promise.map_array(fn, numpy.zeros(2 ** 20), axis=0).get(0.5)    # 8 MB
+    self.assertEqual(len(chunks), 40)
+    self.assertEqual(sum(chunks), 2 ** 20)
+
+  def test_empty(self):
+    result = Promise.map_array(lambda a: a, numpy.zeros((0, 3))).get(0.5)
+    self.assertEqual(result.shape, (0, 3))
+
+  def test_errors(self):
+    self.assertRaises(ValueError, Promise.map_array(lambda a: a[:1], numpy.zeros(10), chunks=2).get, 0.5)
+    self.assertRaises(ZeroDivisionError, Promise.map_array(lambda a: 1 / 0, numpy.zeros(10)).get, 0.5)
+    self.assertRaises(ValueError, Promise.map_array, lambda a: a, numpy.zeros(10), chunks=0)
+    self.assertRaises(ValueError, Promise.map_array, lambda a: a, numpy.float64(1))
+
 
 class PromiseBasicTests(PromiseTests, unittest.TestCase):
 
@@ -468,6 +619,254 @@ class PromiseMergingTests(PromiseTests, unittest.TestCase):
     # shouldn't throw a timeout error
     Promise.collect(promises).get(2.5)
 
+  def test_as_completed(self):
+    fut1 = [
+      Promise.wait(0.10).map(lambda v: 3),
+      Promise.exception(MiraiError()),
+      Promise.wait(0.05).map(lambda v: 2),
+    ]
+    results = list(Promise.as_completed(fut1))
+
+    self.assertEqual(len(results), 3)
+    self.assertTrue(results[0].isfailure())
+    self.assertEqual([f.get() for f in results[1:]], [2, 3])
+
+  def test_as_completed_timeout(self):
+    fut1     = [Promise.value(1), Promise()]
+    iterator = Promise.as_completed(fut1, timeout=0.05)
+
+    self.assertEqual(next(iterator).get(), 1)
+    self.assertRaises(TimeoutError, next, iterator)
+
+  def test_as_completed_empty(self):
+    self.assertEqual(list(Promise.as_completed([])), [])
+
+  def test_fold(self):
+    import operator
+    fut1 = [Promise.wait(0.01 * i).map(lambda v, i=i: i) for i in range(10)]
+    self.assertEqual(Promise.fold(fut1, 0, operator.add).get(0.5), 45)
+
+  def test_fold_empty(self):
+    self.assertEqual(Promise.fold([], 5, lambda a, b: a + b).get(0.5), 5)
+
+  def test_fold_failure(self):
+    fut1 = [Promise.value(1), Promise.exception(NotImplementedError())]
+    self.assertRaises(NotImplementedError, Promise.fold(fut1, 0, lambda a, b: a + b).get, 0.5)
+
+    fut1 = [Promise.value(1), Promise.value("a")]
+    self.assertRaises(TypeError, Promise.fold(fut1, 0, lambda a, b: a + b).get, 0.5)
+
+  def test_quorum(self):
+    fut1 = [
+      Promise.wait(0.01).map(lambda v: 1),
+      Promise.exception(MiraiError()),
+      Promise.wait(0.05).map(lambda v: 2),
+      Promise(),
+    ]
+    self.assertEqual(Promise.quorum(fut1, 2).get(0.5), [1, 2])
+
+  def test_quorum_impossible(self):
+    class VerySpecificException(Exception): pass
+    fut1 = [
+      Promise.value(1),
+      Promise.exception(MiraiError()),
+      Promise.wait(0.01).flatmap(lambda v: Promise.exception(VerySpecificException())),
+      Promise(),
+    ]
+    self.assertRaises(VerySpecificException, Promise.quorum(fut1, 3).get, 0.5)
+
+  def test_quorum_invalid(self):
+    self.assertRaises(ValueError, Promise.quorum, [Promise()], 0)
+    self.assertRaises(ValueError, Promise.quorum, [Promise()], 2)
+
+  def test_quorum_cancel(self):
+    import threading
+    Promise.executor(ThreadPoolExecutor(max_workers=1))
+    event  = threading.Event()
+    called = []
+
+    fut1 = [Promise.call(event.wait, 1.0), Promise.value(1), Promise.call(called.append, 1)]
+    fut2 = Promise.quorum(fut1, 1, cancel=True)
+    event.set()
+
+    self.assertEqual(fut2.get(0.5), [1])
+    Promise.executor().shutdown(wait=True)
+    self.assertEqual(called, [])
+    self.assertTrue(fut1[2].isdefined())
+
+  def test_quorum_cancel_mapped(self):
+    import time
+    fut1 = [Promise.value(1), Promise.call(time.sleep, 0.05).map(lambda v: 2), Promise()]
+    fut2 = Promise.quorum(fut1, 1, cancel=True)
+
+    self.assertEqual(fut2.get(0.5), [1])
+    self.assertEqual(fut1[1].get(0.5), 2)
+    fut1[2].setvalue(3)
+
+  def test_first_successful(self):
+    fut1 = [
+      Promise.exception(MiraiError()),
+      Promise.wait(0.05).map(lambda v: 2),
+      Promise(),
+    ]
+    self.assertEqual(Promise.first_successful(fut1).get(0.5), 2)
+
+  def test_first_successful_failure(self):
+    fut1 = [
+      Promise.exception(MiraiError()),
+      Promise.wait(0.01).flatmap(lambda v: Promise.exception(NotImplementedError())),
+    ]
+    self.assertRaises(NotImplementedError, Promise.first_successful(fut1).get, 0.5)
+
+
+class PromiseDeadlineTests(PromiseTests, unittest.TestCase):
+
+  def test_remaining(self):
+    self.assertIsNone(Promise.remaining())
+    with Promise.deadline(0.5):
+      self.assertTrue(0.4 < Promise.remaining() <= 0.5)
+    self.assertIsNone(Promise.remaining())
+
+  def test_nested_deadline_tightens(self):
+    with Promise.deadline(0.5):
+      with Promise.deadline(5.0):
+        self.assertTrue(Promise.remaining() <= 0.5)
+      with Promise.deadline(0.1):
+        self.assertTrue(Promise.remaining() <= 0.1)
+
+  def test_within_uses_deadline(self):
+    with Promise.deadline(0.05):
+      fut = Promise().within(10)
+    self.assertRaises(TimeoutError, fut.get, 0.5)
+
+  def test_within_uses_explicit_duration(self):
+    with Promise.deadline(10):
+      fut = Promise().within(0.05)
+    self.assertRaises(TimeoutError, fut.get, 0.5)
+
+  def test_call_inherits_deadline(self):
+    with Promise.deadline(0.5):
+      fut = Promise.call(Promise.remaining)
+    self.assertTrue(0 < fut.get(0.5) <= 0.5)
+
+  def test_callbacks_inherit_deadline(self):
+    import threading
+    event = threading.Event()
+    with Promise.deadline(0.5):
+      fut = Promise.call(event.wait, 0.5)
+    fut = fut.flatmap(lambda v: Promise.call(Promise.remaining))
+    event.set()
+    self.assertTrue(0 < fut.get(0.5) <= 0.5)
+
+  def test_call_drops_expired(self):
+    import time
+    Promise.executor(ThreadPoolExecutor(max_workers=1))
+    called = []
+
+    blocker = Promise.call(time.sleep, 0.1)
+    with Promise.deadline(0.05):
+      fut = Promise.call(called.append, 1)
+
+    self.assertRaises(TimeoutError, fut.get, 0.5)
+    self.assertEqual(called, [])
+
+  def test_collect_uses_deadline(self):
+    with Promise.deadline(0.05):
+      fut = Promise.collect([Promise.value(1), Promise()])
+    self.assertRaises(TimeoutError, fut.get, 0.5)
+
+  def test_select_uses_deadline(self):
+    with Promise.deadline(0.05):
+      fut = Promise.select([Promise(), Promise()])
+    self.assertRaises(TimeoutError, fut.get, 0.5)
+
+  def test_wait_needs_no_worker(self):
+    import threading
+    Promise.executor(ThreadPoolExecutor(max_workers=1))
+    event = threading.Event()
+    Promise.call(event.wait, 1.0)
+    try:
+      self.assertIsNone(Promise.wait(0.01).get(0.5))
+      self.assertRaises(TimeoutError, Promise().within(0.01).get, 0.5)
+    finally:
+      event.set()
+
+  def test_timeouts_not_held_up_by_callbacks(self):
+    import time
+    Promise.wait(0.01).map(lambda v: time.sleep(0.5))
+    time.sleep(0.02)
+    start = time.time()
+    self.assertRaises(TimeoutError, Promise().within(0.05).get, 1.0)
+    self.assertLess(time.time() - start, 0.3)
+
+
+class PromiseLazyTests(PromiseTests, unittest.TestCase):
+
+  def test_lazy_get(self):
+    called = []
+    fut    = Promise.lazy(lambda v: called.append(v) or v + 1, 1)
+
+    self.assertEqual(called, [])
+    self.assertFalse(fut.isdefined())
+    self.assertEqual(fut.get(0.5), 2)
+    self.assertEqual(called, [1])
+    self.assertEqual(fut.get(0.5), 2)
+    self.assertEqual(called, [1])
+
+  def test_lazy_chain(self):
+    called = []
+    fut    = (
+      Promise.lazy(called.append, 1)
+      .map(lambda v: 2)
+      .flatmap(lambda v: Promise.value(v + 1))
+      .within(0.5)
+    )
+
+    import time
+    time.sleep(0.05)
+    self.assertEqual(called, [])
+    self.assertEqual(fut.get(0.5), 3)
+    self.assertEqual(called, [1])
+
+  def test_lazy_callback(self):
+    called = []
+    fut    = Promise()
+    Promise.lazy(lambda: called.append(1) or 5).onsuccess(fut.setvalue)
+
+    self.assertEqual(fut.get(0.5), 5)
+    self.assertEqual(called, [1])
+
+  def test_lazy_collect(self):
+    fut = Promise.collect([Promise.lazy(lambda: 1), Promise.lazy(lambda: 2)])
+    self.assertEqual(fut.get(0.5), [1, 2])
+
+  def test_lazy_exception(self):
+    def bar():
+      raise NotImplementedError("Uh oh...")
+
+    self.assertRaises(NotImplementedError, Promise.lazy(bar).get, 0.5)
+    self.assertEqual(Promise.lazy(bar).handle(lambda e: 1).get(0.5), 1)
+
+  def test_lazy_inherits_context(self):
+    with Promise.deadline(0.5):
+      fut = Promise.lazy(Promise.remaining)
+    self.assertTrue(0 < fut.get(0.5) <= 0.5)
+
+  def test_lazy_thunk_inherits_context(self):
+    with Promise.deadline(0.5):
+      fut = LazyPromise(lambda p: p.setvalue(Promise.remaining()))
+    self.assertTrue(0 < fut.get(0.5) <= 0.5)
+
+  def test_lazy_isdefined_doesnt_force(self):
+    called = []
+    fut    = Promise.lazy(called.append, 1)
+
+    self.assertFalse(fut.isdefined())
+    self.assertFalse(fut.issuccess())
+    self.assertEqual(called, [])
+    fut.force().get(0.5)
+    self.assertTrue(fut.issuccess())
+
 
 class FutureTests(PromiseTests, unittest.TestCase):
 
@@ -0,0 +1,139 @@
+import threading
+import time
+import unittest
+
+from mirai import *
+
+
+def square(v):
+  return v * v
+
+
+class PipelineTests(unittest.TestCase):
+
+  def setUp(self):
+    self.pipeline = Pipeline()
+
+  def tearDown(self):
+    self.pipeline.shutdown(wait=False)
+
+  def test_submit(self):
+    self.pipeline.stage('parse', int).stage('double', lambda v: v * 2)
+    self.assertEqual(self.pipeline.submit("21").get(0.5), 42)
+
+  def test_map(self):
+    self.pipeline.stage('parse', int, workers=2).stage('double', lambda v: v * 2, workers=3)
+    self.assertEqual(self.pipeline.map([str(i) for i in range(20)]).get(0.5), range(0, 40, 2))
+
+  def test_empty(self):
+    self.assertEqual(self.pipeline.submit(1).get(0.5), 1)
+
+  def test_failure_stops_record(self):
+    seen = []
+    self.pipeline.stage('parse', int).stage('record', seen.append)
+
+    self.assertRaises(ValueError, self.pipeline.submit("x").get, 0.5)
+    self.assertEqual(self.pipeline.submit("1").get(0.5), None)
+    self.assertEqual(seen, [1])
+    self.assertEqual([s['failed'] for s in self.pipeline.stats()], [1, 0])
+
+  def test_invalid(self):
+    self.pipeline.stage('a', int)
+    self.assertRaises(ValueError, self.pipeline.stage, 'a', int)
+    self.assertRaises(ValueError, self.pipeline.stage, 'b', int, workers=0)
+    self.assertRaises(ValueError, self.pipeline.stage, 'b', int, executor='fiber')
+
+  def test_stages_have_own_workers(self):
+    # a stalled stage doesn't keep the other stage from running
+    event = threading.Event()
+    self.pipeline.stage('slow', lambda v: event.wait(1.0) and v, workers=1)
+    other = Pipeline().stage('fast', lambda v: v)
+    try:
+      self.pipeline.submit(1)
+      self.assertEqual(other.submit(2).get(0.5), 2)
+    finally:
+      event.set()
+      other.shutdown(wait=False)
+
+  def test_backpressure(self):
+    event = threading.Event()
+    self.pipeline.stage('fast', lambda v: v, max_queue=0).stage('slow', lambda v: event.wait(1.0) and v, max_queue=1)
+
+    submitted = []
+    def produce():
+      for i in range(10):
+        submitted.append(self.pipeline.submit(i))
+    thread = threading.Thread(target=produce)
+    thread.start()
+    time.sleep(0.1)
+
+    # 'slow' is full, so records back up through 'fast' to the producer
+    stats = dict((s['name'], s) for s in self.pipeline.stats())
+    self.assertEqual(stats['slow']['pending'], 2)
+    self.assertEqual(stats['slow']['occupancy'], 1.0)
+    self.assertTrue(thread.is_alive())
+    self.assertTrue(len(submitted) < 5)
+
+    event.set()
+    thread.join(0.5)
+    self.assertEqual(Promise.collect(submitted).get(0.5), range(10))
+    self.assertEqual(self.pipeline.bottleneck(), None)
+
+  def test_full_stage_blocks_no_threads(self):
+    # records done with 'fast' wait in line for 'slow' rather than tying up
+    # 'fast''s only worker
+    event = threading.Event()
+    self.pipeline.stage('fast', lambda v: v).stage('slow', lambda v: event.wait(1.0) and v, max_queue=0)
+    fs = [self.pipeline.submit(i) for i in range(3)]
+    time.sleep(0.05)
+
+    (fast, slow) = self.pipeline.stats()
+    self.assertEqual(fast['completed'], 3)
+    self.assertEqual(slow['waiting'], 2)
+    event.set()
+    self.assertEqual(Promise.collect(fs).get(0.5), [0, 1, 2])
+
+  def test_cancelled(self):
+    from concurrent.futures import CancelledError
+    event = threading.Event()
+    self.pipeline.stage('slow', lambda v: event.wait(1.0) and v, max_queue=1)
+    first     = self.pipeline.submit(1)
+    cancelled = self.pipeline.submit(2)
+    time.sleep(0.01)
+    self.pipeline._stages[0].executor._queue[0].future.cancel()
+    event.set()
+
+    self.assertRaises(CancelledError, cancelled.get, 0.5)
+    self.assertEqual(first.get(0.5), 1)
+    self.assertEqual(self.pipeline.submit(3).get(0.5), 3)
+    self.assertEqual(self.pipeline.stats()[0]['pending'], 0)
+
+  def test_bottleneck(self):
+    event = threading.Event()
+    self.pipeline.stage('fast', lambda v: v, workers=2).stage('slow', lambda v: event.wait(1.0) and v)
+    fs = [self.pipeline.submit(i) for i in range(4)]
+    time.sleep(0.05)
+
+    self.assertEqual(self.pipeline.bottleneck(), 'slow')
+    event.set()
+    Promise.collect(fs).get(0.5)
+
+  def test_stats(self):
+    self.pipeline.stage('parse', int).stage('sleep', lambda v: time.sleep(0.01) or v)
+    self.pipeline.map(["1", "2", "3"]).get(0.5)
+
+    (parse, sleep) = self.pipeline.stats()
+    self.assertEqual(parse['name'], 'parse')
+    self.assertEqual(parse['completed'], 3)
+    self.assertEqual(sleep['completed'], 3)
+    self.assertEqual(sleep['pending'], 0)
+    self.assertTrue(sleep['throughput'] > 0)
+    self.assertTrue(sleep['latency'] >= 0.001)
+
+  def test_process_stage(self):
+    self.pipeline.stage('parse', int).stage('square', square, workers=2, executor='process')
+    self.assertEqual(self.pipeline.map(["1", "2", "3"]).get(5.0), [1, 4, 9])
+
+
+if __name__ == '__main__':
+  unittest.main()
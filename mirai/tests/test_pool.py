@@ -0,0 +1,176 @@
+from concurrent.futures import ThreadPoolExecutor
+import itertools
+import threading
+import time
+import unittest
+
+from mirai import *
+
+
+class Resource(object):
+
+  def __init__(self, i):
+    self.i       = i
+    self.healthy = True
+    self.closed  = False
+
+
+class ResourcePoolTests(unittest.TestCase):
+
+  def setUp(self):
+    Promise.executor(ThreadPoolExecutor(max_workers=4))
+    self.counter = itertools.count()
+    self.closed  = []
+
+  def tearDown(self):
+    Promise.executor().shutdown(wait=False)
+
+  def pool(self, **kwargs):
+    kwargs.setdefault('close', self.closed.append)
+    return ResourcePool(lambda: Resource(next(self.counter)), **kwargs)
+
+  def test_acquire_release(self):
+    pool = self.pool(max_size=2)
+    a = pool.acquire().get(0.5)
+    pool.release(a)
+    self.assertIs(pool.acquire().get(0.5), a)
+
+    stats = pool.stats()
+    self.assertEqual((stats['size'], stats['in_use'], stats['acquired'], stats['created']), (1, 1, 2, 1))
+
+  def test_waiters_are_queued(self):
+    pool = self.pool(max_size=2)
+    (a, b) = [pool.acquire().get(0.5) for i in range(2)]
+    waiting = [pool.acquire() for i in range(3)]
+    time.sleep(0.02)
+    self.assertFalse(any(w.isdefined() for w in waiting))
+    self.assertEqual(pool.stats()['waiting'], 3)
+    self.assertEqual(pool.stats()['utilization'], 1.0)
+
+    # first come, first served
+    pool.release(a)
+    self.assertIs(waiting[0].get(0.5), a)
+    self.assertFalse(waiting[1].isdefined())
+    pool.release(b)
+    self.assertIs(waiting[1].get(0.5), b)
+    self.assertGreater(pool.stats()['wait_max'], 0.01)
+
+  def test_waiters_hold_no_threads(self):
+    Promise.executor(ThreadPoolExecutor(max_workers=1))
+    pool = self.pool(max_size=1)
+    a = pool.acquire().get(0.5)
+    waiting = [pool.acquire() for i in range(10)]
+    self.assertEqual(Promise.call(lambda: 1).get(0.5), 1)
+    pool.release(a)
+    self.assertIs(waiting[0].get(0.5), a)
+
+  def test_timeout(self):
+    pool = self.pool(max_size=1)
+    a = pool.acquire().get(0.5)
+    self.assertRaises(TimeoutError, pool.acquire(timeout=0.02).get, 0.5)
+    self.assertEqual(pool.stats()['waiting'], 0)
+    self.assertEqual(pool.stats()['timeouts'], 1)
+
+    pool.release(a)
+    self.assertIs(pool.acquire(timeout=0.5).get(0.5), a)
+
+  def test_deadline(self):
+    pool = self.pool(max_size=1)
+    pool.acquire().get(0.5)
+    with Promise.deadline(0.02):
+      acquired = pool.acquire()
+    self.assertRaises(TimeoutError, acquired.get, 0.5)
+
+  def test_use(self):
+    pool = self.pool(max_size=1)
+    self.assertEqual(pool.use(lambda r: Promise.value(r.i)).get(0.5), 0)
+    self.assertRaises(ValueError, pool.use(lambda r: Promise.call(int, "x")).get, 0.5)
+    self.assertRaises(ZeroDivisionError, pool.use(lambda r: 1 / 0).get, 0.5)
+    time.sleep(0.01)
+    self.assertEqual(pool.stats()['in_use'], 0)
+    self.assertEqual(pool.stats()['created'], 1)
+
+  def test_release_discard(self):
+    pool = self.pool(max_size=1)
+    a = pool.acquire().get(0.5)
+    pool.release(a, discard=True)
+    self.assertEqual(self.closed, [a])
+    self.assertIsNot(pool.acquire().get(0.5), a)
+    self.assertEqual(pool.stats()['discarded'], 1)
+
+  def test_factory_failure(self):
+    pool = ResourcePool(lambda: 1 / 0, max_size=1)
+    self.assertRaises(ZeroDivisionError, pool.acquire().get, 0.5)
+    self.assertEqual(pool.stats()['size'], 0)
+
+  def test_health_check(self):
+    pool = self.pool(max_size=2, check=lambda r: r.healthy)
+    a = pool.acquire().get(0.5)
+    a.healthy = False
+    pool.release(a)
+
+    b = pool.acquire().get(0.5)
+    self.assertIsNot(b, a)
+    self.assertEqual(self.closed, [a])
+    self.assertEqual(pool.stats()['size'], 1)
+
+  def test_idle_eviction(self):
+    pool = self.pool(max_size=3, idle_timeout=0.05, min_size=1)
+    resources = [pool.acquire().get(0.5) for i in range(3)]
+    for r in resources:
+      pool.release(r)
+    self.assertEqual(pool.stats()['idle'], 3)
+
+    time.sleep(0.2)
+    stats = pool.stats()
+    self.assertEqual((stats['size'], stats['idle'], stats['evicted']), (1, 1, 2))
+    # the oldest go first
+    self.assertEqual(self.closed, resources[:2])
+
+  def test_warm(self):
+    pool = self.pool(max_size=4, min_size=2)
+    self.assertIsNone(pool.warm().get(0.5))
+    self.assertEqual(pool.stats()['idle'], 2)
+    pool.warm(10).get(0.5)
+    self.assertEqual(pool.stats()['idle'], 4)
+    self.assertEqual(pool.stats()['created'], 4)
+
+  def test_shutdown(self):
+    pool = self.pool(max_size=2)
+    (a, b) = [pool.acquire().get(0.5) for i in range(2)]
+    waiting = pool.acquire()
+    pool.release(a)
+    self.assertIs(waiting.get(0.5), a)
+    waiting = pool.acquire()
+
+    pool.shutdown()
+    self.assertRaises(RejectedError, waiting.get, 0.5)
+    self.assertRaises(RejectedError, pool.acquire().get, 0.5)
+    pool.release(b)
+    pool.release(a)
+    self.assertEqual(sorted(self.closed), sorted([a, b]))
+    self.assertEqual(pool.stats()['size'], 0)
+
+  def test_concurrent(self):
+    pool   = self.pool(max_size=3)
+    active = []
+    peak   = []
+    lock   = threading.Lock()
+
+    def work(r):
+      with lock:
+        active.append(r)
+        peak.append(len(active))
+      time.sleep(0.001)
+      with lock:
+        active.remove(r)
+      return r.i
+
+    results = Promise.collect([pool.use(lambda r: Promise.call(work, r)) for i in range(100)])
+    self.assertEqual(len(results.get(5.0)), 100)
+    self.assertLessEqual(max(peak), 3)
+    self.assertEqual(pool.stats()['created'], 3)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,245 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+import socket
+import threading
+import time
+import unittest
+
+from mirai import *
+from mirai.reactor import Reactor, READ, WRITE
+
+
+class ReactorTests(unittest.TestCase):
+
+  def setUp(self):
+    self.reactor = Reactor()
+    (self.a, self.b) = socket.socketpair()
+
+  def tearDown(self):
+    self.reactor.shutdown()
+    self.a.close()
+    self.b.close()
+
+  def test_watch(self):
+    event = threading.Event()
+    self.reactor.watch(self.a.fileno(), READ, event.set)
+    self.assertFalse(event.wait(0.05))
+
+    self.b.send("x")
+    self.assertTrue(event.wait(0.5))
+    self.assertEqual(self.reactor.pending(), 0)
+
+  def test_watch_write(self):
+    # fill the socket's buffer, then wait for the other end to drain it
+    self.a.setblocking(False)
+    try:
+      while True:
+        self.a.send("x" * 65536)
+    except socket.error:
+      pass
+
+    event = threading.Event()
+    self.reactor.watch(self.a.fileno(), WRITE, event.set)
+    self.assertFalse(event.wait(0.05))
+
+    self.b.setblocking(False)
+    try:
+      while True:
+        self.b.recv(65536)
+    except socket.error:
+      pass
+    self.assertTrue(event.wait(0.5))
+
+  def test_unwatch(self):
+    called = []
+    fn     = lambda: called.append(1)
+    self.reactor.watch(self.a.fileno(), READ, fn)
+    self.assertTrue(self.reactor.unwatch(self.a.fileno(), READ, fn))
+    self.assertFalse(self.reactor.unwatch(self.a.fileno(), READ, fn))
+
+    self.b.send("x")
+    time.sleep(0.05)
+    self.assertEqual(called, [])
+    self.assertEqual(self.reactor.pending(), 0)
+
+  def test_shutdown(self):
+    self.reactor.watch(self.a.fileno(), READ, lambda: None)
+    self.reactor.shutdown()
+    self.assertRaises(RuntimeError, self.reactor.watch, self.a.fileno(), READ, lambda: None)
+
+  def test_shutdown_closes_pipe(self):
+    for started in (False, True):
+      reactor = Reactor()
+      fds     = (reactor._wake_r, reactor._wake_w)
+      if started:
+        reactor.watch(self.a.fileno(), READ, lambda: None)
+      reactor.shutdown()
+      for fd in fds:
+        self.assertRaises(OSError, os.fstat, fd)
+
+
+class PromiseIOTests(unittest.TestCase):
+
+  def setUp(self):
+    Promise.executor(ThreadPoolExecutor(max_workers=2))
+    (self.a, self.b) = socket.socketpair()
+
+  def tearDown(self):
+    self.a.close()
+    self.b.close()
+    Promise.executor().shutdown(wait=False)
+
+  def test_readable(self):
+    readable = Promise.readable(self.a)
+    time.sleep(0.02)
+    self.assertFalse(readable.isdefined())
+
+    self.b.send("hello")
+    self.assertIs(readable.get(0.5), self.a)
+
+  def test_writable(self):
+    self.assertIs(Promise.writable(self.a.fileno()).get(0.5), self.a.fileno())
+
+  def test_recv(self):
+    received = Promise.recv(self.a, 1024)
+    self.b.send("hello")
+    self.assertEqual(received.get(0.5), "hello")
+
+  def test_recv_ready(self):
+    self.b.send("hello")
+    self.assertEqual(Promise.recv(self.a, 3).get(0.5), "hel")
+
+  def test_recv_closed(self):
+    received = Promise.recv(self.a, 1024)
+    self.b.close()
+    self.assertEqual(received.get(0.5), "")
+
+  def test_send(self):
+    # far more than fits in a socket buffer, so send has to wait for room
+    data     = os.urandom(4 * 1024 * 1024)
+    sent     = Promise.send(self.a, data)
+    received = []
+    while sum(len(r) for r in received) < len(data):
+      received.append(self.b.recv(65536))
+
+    self.assertEqual(sent.get(0.5), len(data))
+    self.assertEqual("".join(received), data)
+
+  def test_roundtrip(self):
+    def echo(sock):
+      return Promise.recv(sock, 1024).flatmap(lambda data: Promise.send(sock, data.upper()))
+
+    echoed = echo(self.b)
+    result = Promise.send(self.a, "ping").flatmap(lambda n: Promise.recv(self.a, 1024))
+    self.assertEqual(result.get(0.5), "PING")
+    self.assertEqual(echoed.get(0.5), 4)
+
+  def test_timeout(self):
+    self.assertRaises(TimeoutError, Promise.recv(self.a, 1024, timeout=0.02).get, 0.5)
+    self.assertEqual(Promise.REACTOR.pending(), 0)
+
+    # the data isn't consumed by the expired recv
+    self.b.send("late")
+    self.assertEqual(Promise.recv(self.a, 1024).get(0.5), "late")
+
+  def test_deadline(self):
+    with Promise.deadline(0.02):
+      readable = Promise.readable(self.a)
+    self.assertRaises(TimeoutError, readable.get, 0.5)
+
+  def test_closed_descriptor(self):
+    # waiters on a descriptor that can't be watched are woken rather than
+    # left waiting forever
+    (c, d) = socket.socketpair()
+    fd = c.fileno()
+    c.close()
+    d.close()
+    self.assertEqual(Promise.readable(fd).get(0.5), fd)
+
+  def test_many_pending_without_threads(self):
+    threads = threading.active_count()
+    pairs   = [socket.socketpair() for i in range(200)]
+    try:
+      received = [Promise.recv(a, 16) for (a, b) in pairs]
+      time.sleep(0.02)
+      self.assertTrue(threading.active_count() <= threads + 1)
+      self.assertEqual(Promise.REACTOR.pending(), 200)
+
+      for (i, (a, b)) in enumerate(pairs):
+        b.send(str(i))
+      self.assertEqual(Promise.collect(received).get(1.0), [str(i) for i in range(200)])
+    finally:
+      for (a, b) in pairs:
+        a.close()
+        b.close()
+
+
+def zombies():
+  """Return the pids of this process's children that exited unreaped."""
+  pids = []
+  for pid in os.listdir('/proc'):
+    try:
+      with open('/proc/{}/stat'.format(pid)) as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    except (IOError, IndexError):
+      continue
+    if fields[0] == 'Z' and int(fields[1]) == os.getpid():
+      pids.append(int(pid))
+  return pids
+
+
+class PromiseSubprocessTests(unittest.TestCase):
+
+  def setUp(self):
+    Promise.executor(ThreadPoolExecutor(max_workers=2))
+
+  def tearDown(self):
+    Promise.executor().shutdown(wait=False)
+
+  def test_output(self):
+    result = Promise.subprocess(['sh', '-c', 'echo out; echo err >&2; exit 3'])
+    self.assertEqual(result.get(1.0), (3, "out\n", "err\n"))
+
+  def test_input(self):
+    # more than fits in a pipe's buffer, in both directions
+    data = os.urandom(4 * 1024 * 1024)
+    self.assertEqual(Promise.subprocess(['cat'], input=data).get(5.0), (0, data, ""))
+
+  def test_input_not_read(self):
+    self.assertEqual(Promise.subprocess(['true'], input="x" * 1024 * 1024).get(1.0), (0, "", ""))
+
+  def test_stream(self):
+    chunks = []
+    result = Promise.subprocess(['sh', '-c', 'echo a; sleep 0.01; echo b'], stdout=chunks.append)
+    self.assertEqual(result.get(1.0), (0, None, ""))
+    self.assertEqual("".join(chunks), "a\nb\n")
+
+  def test_kwargs(self):
+    self.assertEqual(Promise.subprocess(['pwd'], cwd='/').get(1.0), (0, "/\n", ""))
+
+  def test_not_found(self):
+    self.assertRaises(OSError, Promise.subprocess(['/nonexistent/command']).get, 0.5)
+
+  def test_timeout(self):
+    start = time.time()
+    self.assertRaises(TimeoutError, Promise.subprocess(['sleep', '5'], timeout=0.05).get, 1.0)
+    self.assertLess(time.time() - start, 1.0)
+
+  def test_timeout_with_output_held_open(self):
+    # the command exits, but the process it started keeps its stdout open
+    result = Promise.subprocess(['sh', '-c', 'sleep 1 & echo started'], timeout=0.1)
+    self.assertRaises(TimeoutError, result.get, 1.0)
+    time.sleep(0.05)
+    self.assertEqual(Promise.REACTOR.pending(), 0)
+    self.assertEqual(zombies(), [])
+
+  def test_many_without_threads(self):
+    threads = threading.active_count()
+    results = [Promise.subprocess(['sh', '-c', 'sleep 0.1; echo {}'.format(i)]) for i in range(50)]
+    time.sleep(0.05)
+    self.assertTrue(threading.active_count() <= threads + 2)
+    self.assertEqual(Promise.collect(results).get(5.0), [(0, "{}\n".format(i), "") for i in range(50)])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,125 @@
+from concurrent.futures import ThreadPoolExecutor
+import gc
+import os
+import time
+import unittest
+import weakref
+
+from mirai import *
+from mirai import routing
+from mirai.debug import _RUSAGE_THREAD
+
+
+def spin(n):
+  """Burn CPU, then report which process did it."""
+  total = 0
+  for i in xrange(n):
+    total += i
+  return os.getpid()
+
+
+def nap(seconds):
+  time.sleep(seconds)
+  return os.getpid()
+
+
+def fail():
+  raise ValueError("Uh oh...")
+
+
+class Counted(object):
+  """Counts how many times it's pickled in this process."""
+  pickled = 0
+
+  def __getstate__(self):
+    Counted.pickled += 1
+    return {}
+
+
+def identity(x):
+  return os.getpid()
+
+
+class RoutingTests(unittest.TestCase):
+
+  def setUp(self):
+    Promise.executor(ThreadPoolExecutor(max_workers=4))
+    self.router = routing.enable(processes=2, warmup=2)
+
+  def tearDown(self):
+    self.router.shutdown(wait=True)
+    routing.disable()
+    Promise.executor().shutdown(wait=False)
+
+  def run_many(self, fn, *args):
+    return [Promise.call(fn, *args).get(5.0) for i in range(4)]
+
+  def test_disable(self):
+    self.assertIs(routing.disable(), self.router)
+    self.assertIs(Promise.ROUTER, None)
+    self.assertEqual(Promise.call(spin, 10).get(0.5), os.getpid())
+
+  @unittest.skipIf(_RUSAGE_THREAD is None, "needs per-thread CPU time")
+  def test_cpu_bound_goes_to_processes(self):
+    pids = self.run_many(spin, 200000)
+
+    self.assertEqual(pids[:2], [os.getpid()] * 2)
+    self.assertNotIn(os.getpid(), pids[2:])
+    self.assertEqual(self.router.route(spin), 'process')
+
+    (stats,) = self.router.stats()
+    self.assertEqual(stats['name'], 'mirai.tests.test_routing.spin')
+    self.assertEqual((stats['calls'], stats['threads'], stats['processes']), (4, 2, 2))
+    self.assertTrue(stats['cpu_ratio'] >= 0.5)
+
+  def test_io_bound_stays_on_threads(self):
+    self.assertEqual(self.run_many(nap, 0.02), [os.getpid()] * 4)
+    self.assertEqual(self.router.route(nap), 'thread')
+    self.assertTrue(self.router.stats()[0]['cpu_ratio'] < 0.5)
+
+  def test_unpicklable_stays_on_threads(self):
+    fn = lambda n: spin(n)
+    self.router.override(fn, 'process')
+    self.assertEqual(Promise.call(fn, 10).get(0.5), os.getpid())
+
+  def test_arguments_pickled_once(self):
+    self.router.override(identity, 'process')
+    Counted.pickled = 0
+    self.assertNotEqual(Promise.call(identity, Counted()).get(5.0), os.getpid())
+    self.assertEqual(Counted.pickled, 1)
+
+  def test_override(self):
+    self.router.override(nap, 'process')
+    self.assertNotEqual(Promise.call(nap, 0).get(5.0), os.getpid())
+    self.assertEqual(self.router.stats()[0]['override'], 'process')
+
+    self.router.override(nap, None)
+    self.assertEqual(self.router.route(nap), 'thread')
+    self.assertRaises(ValueError, self.router.override, nap, 'fiber')
+
+  def test_no_references_kept(self):
+    # lambdas made per call share one entry, and aren't kept alive by it
+    refs = []
+    for i in range(5):
+      fn = lambda: None
+      refs.append(weakref.ref(fn))
+      Promise.call(fn).get(0.5)
+    del fn
+    gc.collect()
+    self.assertEqual([r() for r in refs], [None] * 5)
+    self.assertEqual(self.router.stats()[0]['calls'], 5)
+
+  def test_process_exception(self):
+    # same exception type and traceback, wherever `fail` runs
+    self.router.override(fail, 'process')
+    with self.assertRaises(ValueError) as raised:
+      Promise.call(fail).get(5.0)
+    self.assertIsInstance(raised.exception, MiraiError)
+    self.assertIn('raise ValueError', raised.exception.context)
+
+  def test_thread_exception(self):
+    self.assertRaises(MiraiError, Promise.call(fail).get, 0.5)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,148 @@
+import atexit
+import heapq
+import itertools
+import threading
+import time
+import traceback
+import weakref
+
+from . import fork
+
+
+# stop timer threads before the interpreter tears down the modules they use
+_timers = weakref.WeakSet()
+
+def _python_exit():
+  for timer in list(_timers):
+    timer.shutdown()
+
+atexit.register(_python_exit)
+
+# a forked child has none of its parent's timer threads, and may have
+# inherited their locks held; leave those timers be.
+fork.register(_timers.clear)
+
+
+class TimerTask(object):
+  """A function scheduled to run on a `Timer`. Call `cancel` to unschedule it."""
+
+  __slots__ = ['when', 'fn']
+
+  def __init__(self, when, fn):
+    self.when = when
+    self.fn   = fn
+
+  def cancel(self):
+    """Unschedule this task and release its function."""
+    self.fn = None
+
+  def cancelled(self):
+    return self.fn is None
+
+
+class Timer(object):
+  """
+  Runs functions after a delay on a single background thread. The thread is
+  started when the first task is scheduled. Scheduled functions should be
+  short -- e.g. resolving a Promise -- as they delay every task behind them.
+  """
+
+  def __init__(self):
+    self._cond    = threading.Condition(threading.Lock())
+    self._heap    = []
+    self._counter = itertools.count()
+    self._thread  = None
+    self._compact = 64
+    self._stopped = False
+    _timers.add(self)
+
+  def schedule(self, delay, fn):
+    """
+    Call `fn()` in `delay` seconds.
+
+    Parameters
+    ----------
+    delay : number
+        Seconds to wait before calling `fn`.
+    fn : (,) -> None
+        Function to call. Return value ignored.
+
+    Returns
+    -------
+    task : TimerTask
+        Handle that can be used to cancel the call.
+    """
+    task = TimerTask(time.time() + max(delay, 0), fn)
+    with self._cond:
+      # cancelled tasks stay in the heap until they come due. Rebuild it
+      # whenever it doubles in size so unfired timeouts can't pile up.
+      if len(self._heap) >= self._compact:
+        self._heap = [entry for entry in self._heap if not entry[2].cancelled()]
+        heapq.heapify(self._heap)
+        self._compact = max(64, 2 * len(self._heap))
+
+      if self._stopped:
+        return task
+
+      heapq.heappush(self._heap, (task.when, next(self._counter), task))
+      if self._thread is None:
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+      elif self._heap[0][2] is task:
+        self._cond.notify()
+    return task
+
+  def shutdown(self):
+    """
+    Stop the timer's thread. Tasks not yet run, and any scheduled from now on,
+    never run.
+    """
+    with self._cond:
+      self._stopped = True
+      self._heap    = []
+      self._cond.notify()
+      thread = self._thread
+    if thread is not None and thread is not threading.current_thread():
+      thread.join()
+
+  def pending(self):
+    """Return the number of tasks that are scheduled and not cancelled."""
+    with self._cond:
+      return sum(1 for (_, _, task) in self._heap if not task.cancelled())
+
+  def _next(self):
+    with self._cond:
+      while True:
+        if self._stopped:
+          return None
+
+        while self._heap and self._heap[0][2].cancelled():
+          heapq.heappop(self._heap)
+
+        if not self._heap:
+          self._cond.wait()
+          continue
+
+        delay = self._heap[0][0] - time.time()
+        if delay > 0:
+          self._cond.wait(delay)
+          continue
+
+        # `cancel` doesn't take the lock, so the task may have been cancelled
+        # since it was checked above.
+        task = heapq.heappop(self._heap)[2]
+        fn, task.fn = task.fn, None
+        if fn is not None:
+          return fn
+
+  def _run(self):
+    while True:
+      fn = self._next()
+      if fn is None:
+        return
+      try:
+        fn()
+      except Exception:
+        traceback.print_exc()
+      del fn